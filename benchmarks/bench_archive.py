@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+"""
+Benchmark e verifica dell'archiviazione VitalSigns -> Parquet
+(scripts/vitals_archive.py) contro un DynamoDB in memoria.
+
+Il client è un vero client botocore di basso livello: le richieste
+vengono serializzate come in produzione e servite da FakeDynamoDBEndpoint
+(benchmarks/fakes.py), quindi filtro, item scansionati e chiavi eliminate
+viaggiano nel formato AttributeValue reale. Verifica che le letture
+vecchie siano archiviate ed eliminate, che le recenti e quelle non
+conformi restino in tabella e che l'archivio si rilegga senza duplicati.
+
+Uso: python3 benchmarks/bench_archive.py [--patients 200] [--readings 100]
+                                         [--segments 4] [--chunk-rows 5000]
+"""
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+from datetime import datetime, timedelta, timezone
+
+from botocore import UNSIGNED
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+import aws_clients  # noqa: E402
+from fakes import CallCounter, FakeDynamoDBEndpoint  # noqa: E402
+from vitals_archive import ArchiveExporter, open_root, read_archive, scan_filter  # noqa: E402
+
+TABLE = 'VitalSigns'
+OLDER_THAN_DAYS = 7
+
+
+def make_items(patients, readings, now):
+    """
+    Letture in formato AttributeValue: metà più vecchie di OLDER_THAN_DAYS,
+    metà recenti, più una lettura vecchia non conforme allo schema
+    """
+    items = []
+    for p in range(patients):
+        patient_id = f"PT{p:06d}"
+        for r in range(readings):
+            age = timedelta(days=OLDER_THAN_DAYS * 2 if r % 2 else 0, minutes=r)
+            items.append({
+                'patient_id': {'S': patient_id},
+                'timestamp': {'S': (now - age).replace(tzinfo=None).isoformat()},
+                'patient_name': {'S': f"Paziente {p}"},
+                'heart_rate': {'N': str(70 + r % 30)},
+                'bp_systolic': {'N': '120'},
+                'bp_diastolic': {'N': '80'},
+                'spo2': {'N': '97'},
+                'temperature': {'N': '36.8'},
+                'ingest_time': {'N': str(int(now.timestamp() * 1000))},
+            })
+    invalid = {'patient_id': {'S': 'PT000000'},
+               'timestamp': {'S': (now - timedelta(days=OLDER_THAN_DAYS * 3)).replace(tzinfo=None).isoformat()},
+               'heart_rate': {'S': 'n/d'}}
+    return items + [invalid], invalid
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark archiviazione VitalSigns -> Parquet')
+    parser.add_argument('--patients', type=int, default=200)
+    parser.add_argument('--readings', type=int, default=100, help='letture per paziente')
+    parser.add_argument('--segments', type=int, default=4)
+    parser.add_argument('--chunk-rows', type=int, default=5000)
+    args = parser.parse_args()
+
+    now = datetime.now(timezone.utc)
+    items, invalid = make_items(args.patients, args.readings, now)
+    # Limite come in export_command: UTC senza offset, confrontato come stringa
+    cutoff = (now - timedelta(days=OLDER_THAN_DAYS)).replace(tzinfo=None).isoformat()
+    old = [item for item in items if item is not invalid and item['timestamp']['S'] < cutoff]
+
+    counter = CallCounter()
+    endpoint = FakeDynamoDBEndpoint(counter, page_size=1000)
+    endpoint.create_table(TABLE)
+    endpoint.load(TABLE, items)
+    client = endpoint.attach(aws_clients.client('dynamodb', endpoint_url='http://dynamodb.local',
+                                                signature_version=UNSIGNED))
+
+    root = tempfile.mkdtemp(prefix='vitals-archive-')
+    try:
+        filesystem, path = open_root(root)
+        exporter = ArchiveExporter(client, TABLE, filesystem, path, scan_filter(older_than=cutoff),
+                                   segments=args.segments, delete=True, chunk_rows=args.chunk_rows)
+        started = time.perf_counter()
+        stats = exporter.run()
+        elapsed = time.perf_counter() - started
+
+        remaining = endpoint.items(TABLE)
+        archived = read_archive(filesystem, path, 'PT000001')
+        checks = {
+            'archiviate': (stats.archived, len(old)),
+            'eliminate': (stats.deleted, len(old)),
+            'non valide': (stats.invalid, 1),
+            'rimaste in tabella': (len(remaining), len(items) - len(old)),
+            'rilette per PT000001': (archived.num_rows, sum(1 for item in old
+                                                            if item['patient_id']['S'] == 'PT000001')),
+        }
+        if invalid not in remaining:
+            checks['lettura non valida in tabella'] = (0, 1)
+
+        print(f"📦 {len(items):,} letture, {len(old):,} da archiviare, {args.segments} segmenti")
+        print(f"   {stats.archived:,} archiviate in {stats.files} blocchi in {elapsed:.2f}s "
+              f"({stats.archived / max(elapsed, 1e-9):,.0f} letture/s), chiamate: {counter.snapshot()}")
+        failed = {name: pair for name, pair in checks.items() if pair[0] != pair[1]}
+        for name, (actual, expected) in failed.items():
+            print(f"❌ {name}: {actual} invece di {expected}")
+        if failed:
+            sys.exit(1)
+        print("✅ Archivio e tabella coerenti")
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Benchmark del calcolo delle baseline dei pazienti.
+
+Confronta il ciclo originale del notebook (iterrows, costo
+O(pazienti × misure)) con compute_baselines (groupby + pivot, lineare)
+su chartevents sintetici da 200 a 40.000 pazienti. Il ciclo originale
+viene eseguito solo fino a --legacy-max pazienti (cresce in modo quadratico).
+
+Uso: python3 benchmarks/bench_baselines.py [--sizes 200 1000 5000 40000]
+                                           [--events-per-patient 60] [--legacy-max 5000]
+"""
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+
+from patient_baselines import BASELINE_ITEMS, compute_baselines, legacy_baselines  # noqa: E402
+
+# Valori medi e dispersione per ITEMID (hr, bp_sys, bp_dia, temp, spo2) + frequenza respiratoria
+ITEM_DISTRIBUTIONS = {
+    220045: (85, 15), 220179: (125, 15), 220180: (75, 10),
+    223761: (36.9, 0.5), 220277: (96, 2), 220210: (18, 4)
+}
+
+
+def make_chartevents(patients, events_per_patient, seed=42):
+    """Misure sintetiche; ~5% dei pazienti senza misure"""
+    rng = np.random.default_rng(seed)
+    subject_ids = np.arange(10000, 10000 + patients, dtype=np.int32)
+    measured = subject_ids[rng.random(patients) > 0.05]
+    count = len(measured) * events_per_patient
+
+    items = np.array(list(ITEM_DISTRIBUTIONS), dtype=np.int32)
+    choice = rng.integers(0, len(items), count)
+    itemid = items[choice]
+    means = np.array([ITEM_DISTRIBUTIONS[i][0] for i in items])[choice]
+    spreads = np.array([ITEM_DISTRIBUTIONS[i][1] for i in items])[choice]
+
+    chartevents = pd.DataFrame({
+        'SUBJECT_ID': np.repeat(measured, events_per_patient),
+        'ITEMID': itemid,
+        'VALUENUM': (means + rng.standard_normal(count) * spreads).astype(np.float32)
+    })
+    patients_df = pd.DataFrame({'SUBJECT_ID': subject_ids})
+    return patients_df, chartevents
+
+
+def timed(func, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def check_equal(legacy, vectorized):
+    """Le due implementazioni devono dare le stesse baseline e lo stesso stato"""
+    columns = ['baseline_' + param for param in BASELINE_ITEMS.values()]
+    vectorized = vectorized.reindex(legacy.index)
+    same_status = (legacy['status'] == vectorized['status']).all()
+    same_values = np.allclose(legacy[columns].astype(float), vectorized[columns], atol=0.051)
+    return same_status and same_values
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark baseline: iterrows vs groupby/pivot')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[200, 1000, 5000, 40000])
+    parser.add_argument('--events-per-patient', type=int, default=60)
+    parser.add_argument('--legacy-max', type=int, default=5000,
+                        help='numero massimo di pazienti per il ciclo originale')
+    parser.add_argument('--stats', nargs='*', default=['median', 'std', 'p05', 'p95'],
+                        help='statistiche aggiuntive per la variante estesa')
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'pazienti':>8} | {'misure':>10} | {'iterrows':>10} | {'vettoriale':>10} | "
+          f"{'+ ' + ' '.join(args.stats):>22} | {'speedup':>8}")
+    print("-" * 86)
+    for size in args.sizes:
+        patients, chartevents = make_chartevents(size, args.events_per_patient)
+        subject_ids = patients['SUBJECT_ID']
+
+        t_vector, vectorized = timed(lambda: compute_baselines(chartevents, subject_ids), args.repeat)
+        t_stats, _ = timed(lambda: compute_baselines(chartevents, subject_ids, stats=args.stats), args.repeat)
+
+        if size <= args.legacy_max:
+            t_legacy, legacy = timed(lambda: legacy_baselines(patients, chartevents), 1)
+            legacy_text = f"{t_legacy:>9.2f}s"
+            speedup = f"{t_legacy / t_vector:>7.0f}x"
+            if not check_equal(legacy, vectorized):
+                print(f"❌ Risultati diversi per {size} pazienti")
+                sys.exit(1)
+        else:
+            legacy_text, speedup = f"{'-':>10}", f"{'-':>8}"
+
+        print(f"{size:>8} | {len(chartevents):>10,} | {legacy_text} | {t_vector:>9.3f}s | "
+              f"{t_stats:>21.3f}s | {speedup}")
+
+
+if __name__ == '__main__':
+    main()
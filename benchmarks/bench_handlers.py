@@ -0,0 +1,403 @@
+#!/usr/bin/env python3
+"""
+Benchmark offline dei handler Lambda (alert-detector, api-handler,
+vitals-simulator, connection-manager) contro DynamoDB e API Gateway
+in memoria (benchmarks/fakes.py): nessuna credenziale né rete.
+
+Per ogni scenario riporta throughput, latenza p50/p99 per invocazione e
+chiamate AWS per invocazione; i risultati sono salvati in JSON
+(benchmarks/results/handlers-<commit>.json) e possono essere confrontati
+con un'esecuzione precedente per individuare regressioni.
+
+Uso:
+  python3 benchmarks/bench_handlers.py [--batch-size 100] [--connections 200]
+                                       [--patients 1000] [--iterations 50]
+                                       [--only alert-detector api-handler ...]
+                                       [--compare benchmarks/results/handlers-abc1234.json]
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import argparse
+import platform
+import subprocess
+import importlib.util
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, 'results')
+
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+# I client boto3 sono creati al primo utilizzo (aws_clients): basta una regione,
+# nessuna chiamata di rete
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+from fakes import CallCounter, FakeGateway, create_project_tables  # noqa: E402
+from connection_registry import ConnectionRegistry  # noqa: E402
+from rollups import RollupWriter  # noqa: E402
+
+HANDLERS = ('alert-detector', 'api-handler', 'vitals-simulator', 'connection-manager')
+
+
+def load_lambda(name):
+    """Importa lambda/<name>/app.py con un nome di modulo univoco"""
+    path = os.path.join(ROOT, 'lambda', name)
+    sys.path.insert(0, path)
+    try:
+        spec = importlib.util.spec_from_file_location(f"{name.replace('-', '_')}_app",
+                                                      os.path.join(path, 'app.py'))
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+    finally:
+        sys.path.remove(path)
+    return module
+
+
+# --- Dati sintetici ---
+
+def make_patients(count, seed=7):
+    rng = random.Random(seed)
+    departments = ('Cardiologia', 'Pneumologia', 'Terapia Intensiva', 'Medicina')
+    return [
+        {
+            'patient_id': f"PT{i:06d}",
+            'full_name': f"Paziente {i}",
+            'name': f"Paziente {i}",
+            'status': 'Stable',
+            'department': departments[i % len(departments)],
+            'room': str(100 + i % 50),
+            'diagnoses': ['I10', 'E11'],
+            'medications': ['Metformina', 'Ramipril'],
+            'baseline_hr': Decimal(rng.randint(60, 90)),
+            'baseline_bp_sys': Decimal(rng.randint(110, 135)),
+            'baseline_bp_dia': Decimal(rng.randint(70, 85)),
+            'baseline_temp': Decimal('36.8'),
+            'baseline_spo2': Decimal(rng.randint(95, 99)),
+        }
+        for i in range(count)
+    ]
+
+
+def make_stream_batch(size, patient_count, batch_number, rng):
+    """Record INSERT di DynamoDB Streams con ~10% di letture fuori soglia"""
+    now = time.time()
+    records = []
+    for i in range(size):
+        sequence = batch_number * size + i
+        abnormal = rng.random() < 0.1
+        image = {
+            'patient_id': {'S': f"PT{rng.randrange(patient_count):06d}"},
+            'patient_name': {'S': 'Paziente'},
+            'timestamp': {'S': datetime.fromtimestamp(now + i / 1000).isoformat()},
+            'ingest_time': {'N': f"{now * 1000:.3f}"},
+            'heart_rate': {'N': str(round(rng.uniform(115, 130) if abnormal else rng.uniform(60, 100), 1))},
+            'bp_systolic': {'N': str(rng.randint(110, 150))},
+            'bp_diastolic': {'N': str(rng.randint(65, 95))},
+            'spo2': {'N': str(rng.randint(85, 89) if abnormal else rng.randint(94, 100))},
+            'temperature': {'N': str(round(rng.uniform(36.0, 37.5), 1))},
+        }
+        records.append({
+            'eventID': f"bench-{sequence}",
+            'eventName': 'INSERT',
+            'dynamodb': {
+                'ApproximateCreationDateTime': int(now),
+                'SequenceNumber': str(100000000 + sequence),
+                'NewImage': image
+            }
+        })
+    return records
+
+
+def make_history(patients, readings=20, alerts=5):
+    """Storico VitalSigns e Alerts per gli endpoint di dettaglio"""
+    start = datetime(2024, 1, 1)
+    vitals, alert_items = [], []
+    for patient in patients:
+        pid = patient['patient_id']
+        for j in range(readings):
+            vitals.append({'patient_id': pid, 'timestamp': (start + timedelta(minutes=j)).isoformat(),
+                           'heart_rate': Decimal('80.5'), 'spo2': 97})
+        for j in range(alerts):
+            alert_items.append({'alert_id': f"{pid}-{j}", 'patient_id': pid,
+                                'timestamp': (start + timedelta(minutes=j)).isoformat(),
+                                'severity': 'CRITICAL', 'message': 'Tachicardia: 130 bpm'})
+    return vitals, alert_items
+
+
+# --- Misure ---
+
+class LambdaContext:
+    function_name = 'bench'
+    aws_request_id = 'bench'
+
+    def get_remaining_time_in_millis(self):
+        return 30000
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def run_scenario(name, invoke, iterations, units_per_call, counter, warmup=2):
+    """Esegue `invoke` più volte (output dei handler soppresso) e riassume i tempi"""
+    sink = io.StringIO()
+    with redirect_stdout(sink):
+        for _ in range(warmup):
+            invoke()
+    counter.reset()
+
+    durations = []
+    with redirect_stdout(sink):
+        for _ in range(iterations):
+            sink.seek(0)
+            sink.truncate()
+            began = time.perf_counter()
+            invoke()
+            durations.append((time.perf_counter() - began) * 1000)
+
+    total_seconds = sum(durations) / 1000
+    calls = {op: round(count / iterations, 2) for op, count in sorted(counter.snapshot().items())}
+    result = {
+        'invocations': iterations,
+        'units_per_invocation': units_per_call,
+        'throughput_per_sec': round(iterations * units_per_call / total_seconds, 1) if total_seconds else None,
+        'p50_ms': round(percentile(durations, 50), 3),
+        'p99_ms': round(percentile(durations, 99), 3),
+        'mean_ms': round(sum(durations) / len(durations), 3),
+        'calls_per_invocation': calls
+    }
+    print(f"{name:<34} {result['throughput_per_sec']:>12,.0f}/s  p50 {result['p50_ms']:>9.2f} ms  "
+          f"p99 {result['p99_ms']:>9.2f} ms  {sum(calls.values()):>8.1f} chiamate AWS")
+    return result
+
+
+# --- Scenari per handler ---
+
+def bench_alert_detector(args, patients):
+    module = load_lambda('alert-detector')
+    counter = CallCounter()
+    db = create_project_tables(counter, args.dynamodb_latency_ms)
+    db.Table('Patients').load(patients)
+    gateway = FakeGateway(counter, args.gateway_latency_ms)
+    connections = db.Table('WebSocketConnections')
+    connections.load({'connectionId': f"conn-{i:05d}"} for i in range(args.connections))
+
+    registry = ConnectionRegistry(connections)
+    module.connection_registry = registry
+    module.fanout_engine.registry = registry
+    module.fanout_engine.gateway_client = gateway
+    module.alerts_table = db.Table('Alerts')
+    module.alert_writer.dynamodb = db
+    module.rollup_writer.dynamodb = db
+    module.baseline_cache.dynamodb = db
+    module.trend_detector.vitals_table = db.Table('VitalSigns')
+    module.alert_suppressor.table = db.Table('AlertSuppression')
+
+    rng = random.Random(11)
+    batches = [make_stream_batch(args.batch_size, len(patients), n, rng)
+               for n in range(args.iterations + 2)]
+    position = iter(range(len(batches)))
+    context = LambdaContext()
+
+    def invoke():
+        module.lambda_handler({'Records': batches[next(position)]}, context)
+
+    return {
+        f"alert-detector (batch {args.batch_size}, {args.connections} conn)":
+            run_scenario('alert-detector', invoke, args.iterations, args.batch_size, counter)
+    }
+
+
+def bench_api_handler(args, patients):
+    module = load_lambda('api-handler')
+    counter = CallCounter()
+    db = create_project_tables(counter, args.dynamodb_latency_ms)
+    db.Table('Patients').load(patients)
+    vitals, alerts = make_history(patients[:200])
+    db.Table('VitalSigns').load(vitals)
+    db.Table('Alerts').load(alerts)
+    module.patients_table = db.Table('Patients')
+    module.vitals_table = db.Table('VitalSigns')
+    module.alerts_table = db.Table('Alerts')
+    module.rollups_table = db.Table('VitalRollups')
+    # Rollup delle ultime ore per lo storico ?range=24h
+    RollupWriter(db, 'VitalRollups').apply(make_stream_batch(5000, 200, 0, random.Random(5)))
+
+    def request(path, params=None, headers=None):
+        return module.lambda_handler({'httpMethod': 'GET', 'path': path,
+                                      'queryStringParameters': params, 'headers': headers}, None)
+
+    def list_uncached():
+        module.patients_cache.clear()
+        request('/patients')
+
+    with redirect_stdout(io.StringIO()):
+        etag = request('/patients')['headers']['ETag']
+    rng = random.Random(3)
+
+    def detail():
+        request(f"/patients/PT{rng.randrange(200):06d}")
+
+    # Cursori 'since' dopo un caricamento completo: il polling senza novità è il caso tipico
+    with redirect_stdout(io.StringIO()):
+        cursors = [json.loads(request(f"/patients/PT{i:06d}")['body'])['since'] for i in range(200)]
+
+    def detail_since():
+        i = rng.randrange(200)
+        request(f"/patients/PT{i:06d}", params={'since': cursors[i]})
+
+    def detail_history():
+        request(f"/patients/PT{rng.randrange(200):06d}", params={'range': '24h'})
+
+    results = {}
+    results['api-handler GET /patients (scan)'] = run_scenario(
+        'api-handler /patients scan', list_uncached, args.iterations, 1, counter)
+    results['api-handler GET /patients (cache)'] = run_scenario(
+        'api-handler /patients cache', lambda: request('/patients'), args.iterations, 1, counter)
+    results['api-handler GET /patients (304)'] = run_scenario(
+        'api-handler /patients 304', lambda: request('/patients', headers={'If-None-Match': etag}),
+        args.iterations, 1, counter)
+    results['api-handler GET /patients/{id}'] = run_scenario(
+        'api-handler /patients/{id}', detail, args.iterations, 1, counter)
+    results['api-handler GET /patients/{id}?since= (204)'] = run_scenario(
+        'api-handler /patients/{id} since', detail_since, args.iterations, 1, counter)
+    results['api-handler GET /patients/{id}?range=24h'] = run_scenario(
+        'api-handler /patients/{id} 24h', detail_history, args.iterations, 1, counter)
+    return results
+
+
+def bench_vitals_simulator(args, patients):
+    module = load_lambda('vitals-simulator')
+    counter = CallCounter()
+    db = create_project_tables(counter, args.dynamodb_latency_ms)
+    db.Table('Patients').load(patients)
+    module.patients_table = db.Table('Patients')
+    module.vitals_table = db.Table('VitalSigns')
+
+    iterations = max(3, args.iterations // 10)
+    return {
+        f"vitals-simulator ({len(patients)} pazienti)": run_scenario(
+            'vitals-simulator', lambda: module.lambda_handler(None, None), iterations, len(patients), counter)
+    }
+
+
+def bench_connection_manager(args, patients):
+    module = load_lambda('connection-manager')
+    counter = CallCounter()
+    db = create_project_tables(counter, args.dynamodb_latency_ms)
+    db.Table('Patients').load(patients)
+    module.connection_table = db.Table('WebSocketConnections')
+    module.patients_table = db.Table('Patients')
+    module.registry = ConnectionRegistry(db.Table('WebSocketConnections'))
+
+    sequence = iter(range(10 ** 9))
+
+    def event(route, connection_id, params=None, body=None):
+        return {'requestContext': {'connectionId': connection_id, 'routeKey': route},
+                'queryStringParameters': params, 'body': body}
+
+    def connect_cycle():
+        connection_id = f"conn-{next(sequence)}"
+        module.lambda_handler(event('$connect', connection_id, {'token': 't'}), None)
+        module.lambda_handler(event('$disconnect', connection_id), None)
+
+    def department_cycle():
+        connection_id = f"conn-{next(sequence)}"
+        module.lambda_handler(event('$connect', connection_id, {'token': 't', 'department': 'Cardiologia'}), None)
+        module.lambda_handler(event('subscribe', connection_id,
+                                    body=json.dumps({'patients': ['PT000001', 'PT000002']})), None)
+        module.lambda_handler(event('$disconnect', connection_id), None)
+
+    return {
+        'connection-manager connect+disconnect': run_scenario(
+            'connection-manager connect', connect_cycle, args.iterations, 2, counter),
+        'connection-manager department+subscribe': run_scenario(
+            'connection-manager department', department_cycle, max(3, args.iterations // 5), 3, counter)
+    }
+
+
+BENCHMARKS = {
+    'alert-detector': bench_alert_detector,
+    'api-handler': bench_api_handler,
+    'vitals-simulator': bench_vitals_simulator,
+    'connection-manager': bench_connection_manager,
+}
+
+
+# --- Risultati ---
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def compare(results, baseline_path):
+    """Stampa le variazioni rispetto a un file di risultati precedente"""
+    with open(baseline_path, encoding='utf-8') as baseline_file:
+        baseline = json.load(baseline_file)
+    print(f"\nConfronto con {baseline_path} (commit {baseline.get('commit')}):")
+    for name, current in results['scenarios'].items():
+        previous = baseline.get('scenarios', {}).get(name)
+        if not previous:
+            print(f"   {name}: nuovo scenario")
+            continue
+        throughput = (current['throughput_per_sec'] / previous['throughput_per_sec'] - 1) * 100
+        p99 = (current['p99_ms'] / previous['p99_ms'] - 1) * 100 if previous['p99_ms'] else 0.0
+        calls = sum(current['calls_per_invocation'].values()) - sum(previous['calls_per_invocation'].values())
+        flag = '  <-- regressione' if throughput < -10 or p99 > 10 or calls > 0 else ''
+        print(f"   {name}: throughput {throughput:+.1f}%, p99 {p99:+.1f}%, chiamate AWS {calls:+.2f}{flag}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark offline dei handler Lambda')
+    parser.add_argument('--only', nargs='+', choices=HANDLERS, default=list(HANDLERS))
+    parser.add_argument('--batch-size', type=int, default=100, help='record per batch di stream')
+    parser.add_argument('--connections', type=int, default=200, help='connessioni WebSocket')
+    parser.add_argument('--patients', type=int, default=1000)
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--gateway-latency-ms', type=float, default=0.0,
+                        help='latenza simulata di post_to_connection')
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0,
+                        help='latenza simulata delle chiamate DynamoDB')
+    parser.add_argument('--output', help='file JSON dei risultati (default benchmarks/results/handlers-<commit>.json)')
+    parser.add_argument('--compare', help='file JSON di un\'esecuzione precedente')
+    args = parser.parse_args()
+
+    patients = make_patients(args.patients)
+    results = {
+        'commit': git_commit(),
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'parameters': {key: value for key, value in vars(args).items() if key not in ('output', 'compare', 'only')},
+        'scenarios': {}
+    }
+
+    print(f"{'scenario':<34} {'throughput':>14}  {'latenza':>30}")
+    print("-" * 100)
+    for name in args.only:
+        results['scenarios'].update(BENCHMARKS[name](args, patients))
+
+    output = args.output or os.path.join(RESULTS_DIR, f"handlers-{results['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w', encoding='utf-8') as output_file:
+        json.dump(results, output_file, indent=2)
+    print(f"\nRisultati salvati in {output}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark della serializzazione di api-handler e alert-detector.
+
+- Body HTTP: risposta DynamoDB (formato wire) -> JSON. Confronta il
+  percorso originale (TypeDeserializer con Decimal + json.dumps con
+  DecimalEncoder) con serialization (int/float nativi + encoder riusato).
+- Frame WebSocket: batchUpdate per più gruppi di sottoscrizione. Confronta
+  il filtro + json.dumps(default=str) per gruppo con encode_groups
+  (ogni elemento codificato una volta, frame composti dai frammenti).
+  Riporta anche la dimensione dei frame con chiavi abbreviate.
+
+Uso: python3 benchmarks/bench_serialization.py [--items 20 500 5000]
+                                               [--batch-size 100] [--groups 1 10 50]
+"""
+import os
+import sys
+import json
+import time
+import random
+import argparse
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'alert-detector'))
+
+# Il modulo crea client boto3 all'import: basta una regione, nessuna chiamata di rete
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+import app  # noqa: E402
+import serialization  # noqa: E402
+
+
+class DecimalEncoder(json.JSONEncoder):
+    """L'encoder originale di api-handler"""
+
+    def default(self, obj):
+        if isinstance(obj, Decimal):
+            return float(obj)
+        return super(DecimalEncoder, self).default(obj)
+
+
+def legacy_filter_payload(payload, patients):
+    """Il filtro per sottoscrizione originale di alert-detector"""
+    data = payload['data']
+    vitals = [v for v in data['vitals'] if v['patient_id'] in patients]
+    alerts = [a for a in data['alerts'] if a['patient_id'] in patients]
+    if not vitals and not alerts:
+        return None
+    return {"action": "batchUpdate", "data": dict(data, vitals=vitals, alerts=alerts)}
+
+
+def legacy_encode_groups(payload, subscriptions):
+    groups = []
+    for patients, connection_ids in subscriptions.items():
+        group_payload = payload if patients is None else legacy_filter_payload(payload, patients)
+        if group_payload is not None:
+            groups.append((connection_ids, json.dumps(group_payload, default=str).encode('utf-8')))
+    return groups
+
+
+def make_wire_items(count, rng):
+    """Letture VitalSigns come le restituisce il client di basso livello"""
+    return [{
+        'patient_id': {'S': f"PT{i % 200:06d}"},
+        'timestamp': {'S': f"2024-01-01T00:{i // 60 % 60:02d}:{i % 60:02d}"},
+        'patient_name': {'S': f"Paziente {i % 200}"},
+        'heart_rate': {'N': str(round(rng.uniform(60, 120), 1))},
+        'bp_systolic': {'N': str(rng.randint(110, 150))},
+        'bp_diastolic': {'N': str(rng.randint(65, 95))},
+        'spo2': {'N': str(rng.randint(90, 100))},
+        'temperature': {'N': str(round(rng.uniform(36.0, 37.5), 1))},
+        'ingest_time': {'N': f"{1704067200000 + i:.3f}"},
+    } for i in range(count)]
+
+
+def make_batch_payload(size, rng):
+    """batchUpdate con i valori come arrivano dallo stream (float) e ~10% di allarmi"""
+    vitals, alerts = [], []
+    for i in range(size):
+        pid = f"PT{i:06d}"
+        vitals.append(app.build_vitals_data(
+            pid, f"Paziente {i}", round(rng.uniform(60, 120), 1), float(rng.randint(110, 150)),
+            float(rng.randint(65, 95)), float(rng.randint(90, 100)), round(rng.uniform(36.0, 37.5), 1),
+            'Stable', False, '2024-01-01T00:00:00'))
+        if rng.random() < 0.1:
+            alerts.append({'alert_id': f"alert-{i}", 'patient_id': pid, 'name': f"Paziente {i}",
+                           'violations': ['Tachicardia: 130 bpm'], 'severity': 'CRITICAL',
+                           'timestamp': '2024-01-01T00:00:00', 'ingest_time': 1704067200000.0})
+    return {"action": "batchUpdate", "data": {"vitals": vitals, "alerts": alerts, "sent_at": 1704067200000}}
+
+
+def make_subscriptions(groups, size, rng):
+    """Un gruppo senza filtro (tutti i pazienti) e gruppi con ~10 pazienti ciascuno"""
+    subscriptions = {None: ['conn-all']}
+    for g in range(groups - 1):
+        subscriptions[frozenset(f"PT{rng.randrange(size):06d}" for _ in range(10))] = [f"conn-{g}"]
+    return subscriptions
+
+
+def timed(func, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark serializzazione API e WebSocket')
+    parser.add_argument('--items', type=int, nargs='+', default=[20, 500, 5000])
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--groups', type=int, nargs='+', default=[1, 10, 50])
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+    rng = random.Random(7)
+    deserializer = TypeDeserializer()
+
+    print("Body HTTP (wire -> JSON)")
+    print(f"{'item':>8} | {'Decimal+DecimalEncoder':>22} | {'nativo+encoder':>15} | {'speedup':>8}")
+    print("-" * 64)
+    for count in args.items:
+        wire = make_wire_items(count, rng)
+
+        def legacy():
+            items = [{k: deserializer.deserialize(v) for k, v in item.items()} for item in wire]
+            return json.dumps({'history': items}, cls=DecimalEncoder)
+
+        def native():
+            return serialization.dumps({'history': [serialization.native_item(item) for item in wire]})
+
+        if json.loads(legacy()) != json.loads(native()):
+            print(f"❌ JSON diverso per {count} item")
+            sys.exit(1)
+        t_legacy, t_native = timed(legacy, args.repeat), timed(native, args.repeat)
+        print(f"{count:>8} | {t_legacy * 1000:>20.2f}ms | {t_native * 1000:>13.2f}ms | "
+              f"{t_legacy / t_native:>7.1f}x")
+
+    payload = make_batch_payload(args.batch_size, rng)
+    print(f"\nFrame WebSocket (batchUpdate di {args.batch_size} pazienti)")
+    print(f"{'gruppi':>8} | {'json.dumps/gruppo':>18} | {'frammenti':>10} | {'speedup':>8} | "
+          f"{'bytes':>8} | {'compatto':>8}")
+    print("-" * 78)
+    for groups in args.groups:
+        subscriptions = make_subscriptions(groups, args.batch_size, rng)
+        legacy_frames = legacy_encode_groups(payload, subscriptions)
+        frames = app.encode_groups(payload, subscriptions)
+        if [json.loads(f) for _, f in legacy_frames] != [json.loads(f) for _, f in frames]:
+            print(f"❌ Frame diversi con {groups} gruppi")
+            sys.exit(1)
+
+        t_legacy = timed(lambda: legacy_encode_groups(payload, subscriptions), args.repeat)
+        t_new = timed(lambda: app.encode_groups(payload, subscriptions), args.repeat)
+        app.WS_COMPACT_KEYS = True
+        compact_frames = app.encode_groups(payload, subscriptions)
+        app.WS_COMPACT_KEYS = False
+        size = sum(len(f) for _, f in legacy_frames)
+        compact_size = sum(len(f) for _, f in compact_frames)
+        print(f"{groups:>8} | {t_legacy * 1000:>16.2f}ms | {t_new * 1000:>8.2f}ms | "
+              f"{t_legacy / t_new:>7.1f}x | {size:>8,} | {compact_size:>8,}")
+
+
+if __name__ == '__main__':
+    main()
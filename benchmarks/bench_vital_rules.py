@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark della valutazione soglie dell'alert-detector.
+
+Confronta il percorso per singolo record (check_vitals) con quello
+vettoriale (check_vitals_batch / rule_engine) su batch sintetici di
+10, 1.000 e 100.000 record. La prima colonna è il check_vitals
+originale (soglie scritte a mano e decodifica con get_val), copiato
+dal commit iniziale: prima di misurare, messaggi e stato critico dei
+due percorsi nuovi devono coincidere con i suoi, record per record.
+
+Uso: python3 benchmarks/bench_vital_rules.py [--sizes 10 1000 100000]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'alert-detector'))
+
+# Il modulo crea client boto3 all'import: basta una regione, nessuna chiamata di rete
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+import app  # noqa: E402
+import rule_engine  # noqa: E402
+
+
+def make_records(count, seed=42):
+    """
+    Genera record di stream INSERT con ~10% di letture anomale, che
+    toccano tutte le soglie (tachicardia e bradicardia, ipertensione,
+    ipossia, febbre)
+    """
+    rng = random.Random(seed)
+    records = []
+    for i in range(count):
+        abnormal = rng.random() < 0.1
+        if abnormal:
+            heart_rate = rng.uniform(115, 130) if rng.random() < 0.7 else rng.uniform(35, 50)
+        else:
+            heart_rate = rng.uniform(60, 100)
+        image = {
+            'patient_id': {'S': f"PT{i % 5000:06d}"},
+            'patient_name': {'S': f"Paziente {i % 5000}"},
+            'timestamp': {'S': f"2024-01-01T00:00:{i % 60:02d}"},
+            'heart_rate': {'N': str(round(heart_rate, 1))},
+            'bp_systolic': {'N': str(rng.randint(150, 175) if abnormal else rng.randint(110, 150))},
+            'bp_diastolic': {'N': str(rng.randint(65, 95))},
+            'spo2': {'N': str(rng.randint(85, 89) if abnormal else rng.randint(94, 100))},
+            'temperature': {'N': str(round(rng.uniform(37.5, 39.5) if abnormal else rng.uniform(36.0, 37.5), 1))},
+        }
+        records.append({'eventName': 'INSERT', 'dynamodb': {'NewImage': image}})
+    return records
+
+
+def timed(func, records, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(records)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def legacy_check_vitals(record):
+    """
+    check_vitals di lambda/alert-detector/app.py nel commit iniziale,
+    copiato senza modifiche: è il codice sostituito da rule_engine
+    """
+    new_image = record['dynamodb']['NewImage']
+    
+    def get_val(key):
+        if 'N' in new_image.get(key, {}):
+            return float(new_image[key]['N'])
+        return None
+
+    # Estraiamo i dati
+    hr = get_val('heart_rate')
+    sys = get_val('bp_systolic')
+    dia = get_val('bp_diastolic')
+    spo2 = get_val('spo2')
+    temp = get_val('temperature')
+    pid = new_image['patient_id']['S']
+    pname = new_image.get('patient_name', {}).get('S', 'Sconosciuto')
+    
+    # Status iniziale dal database (se presente)
+    current_status = new_image.get('status', {}).get('S', 'Stable')
+
+    violations = []
+    is_critical = False
+
+    # Soglie Critiche
+    if hr and hr > 110:
+        violations.append(f"Tachicardia: {hr} bpm")
+        is_critical = True
+    elif hr and hr < 45:
+        violations.append(f"Bradicardia: {hr} bpm")
+        is_critical = True
+    
+    if sys and sys > 160:
+        violations.append(f"Ipertensione: {sys} mmHg")
+        is_critical = True
+    
+    if spo2 and spo2 < 90:
+        violations.append(f"Ipossia: {spo2}%")
+        is_critical = True
+    
+    if temp and temp > 38.5:
+        violations.append(f"Febbre alta: {temp}°C")
+        is_critical = True
+
+    # Determina lo status finale
+    if is_critical:
+        final_status = 'Critical'
+    elif current_status == 'Critical':
+        # Mantieni Critical se era già Critical (non declassare automaticamente)
+        final_status = 'Critical'
+    else:
+        # Altrimenti usa lo status del database
+        final_status = current_status
+
+    # Dati completi per il frontend
+    vitals_data = {
+        "patient_id": pid,
+        "name": pname,
+        "heart_rate": hr,
+        "bp_systolic": sys,
+        "bp_diastolic": dia,
+        "spo2": spo2,
+        "temperature": temp,
+        "status": final_status,
+        "timestamp": datetime.now().isoformat()
+    }
+
+    return pid, pname, violations, vitals_data, is_critical
+
+
+
+def legacy_per_record(records):
+    return [legacy_check_vitals(record) for record in records if record['eventName'] == 'INSERT']
+
+
+def per_record(records):
+    return app.check_vitals_each(records)
+
+
+def outcome(pid, violations, vitals_data, is_critical):
+    """Parte confrontabile del risultato: messaggi, stato critico e status inviato"""
+    return pid, [str(v) for v in violations], is_critical, vitals_data['status']
+
+
+def check_equivalent(records):
+    """
+    Confronta check_vitals_each e check_vitals_batch con il check_vitals
+    originale; ritorna le differenze (lista vuota se coincidono)
+    """
+    expected = [outcome(pid, violations, vitals_data, is_critical)
+                for pid, _, violations, vitals_data, is_critical in legacy_per_record(records)]
+    differences = []
+    for name, check in (('per record', app.check_vitals_each), ('batch', app.check_vitals_batch)):
+        results, errors = check(records)
+        actual = [outcome(pid, violations, vitals_data, is_critical)
+                  for _, pid, _, violations, vitals_data, is_critical in results]
+        if errors:
+            differences.append(f"{name}: {len(errors)} record non decodificati")
+        if len(actual) != len(expected):
+            differences.append(f"{name}: {len(actual)} risultati invece di {len(expected)}")
+        differences += [f"{name}: {got} invece di {want}"
+                        for got, want in zip(actual, expected) if got != want][:5]
+    return differences
+
+
+def rules_only(records):
+    batch, _ = rule_engine.decode_batch(records)
+    return rule_engine.evaluate(batch)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark soglie: per record vs vettoriale')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 1000, 100000])
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    if not rule_engine.HAS_NUMPY:
+        print("NumPy non disponibile: impossibile eseguire il percorso vettoriale")
+        sys.exit(1)
+
+    print(f"{'record':>8} | {'originale':>14} | {'per record':>14} | {'batch':>14} | "
+          f"{'decode+rules':>14} | {'speedup':>7}")
+    print("-" * 87)
+    for size in args.sizes:
+        records = make_records(size)
+        repeat = args.repeat if size <= 10000 else 1
+
+        differences = check_equivalent(records)
+        if differences:
+            print(f"❌ Risultati diversi dal check_vitals originale ({size} record):")
+            for difference in differences:
+                print(f"   {difference}")
+            sys.exit(1)
+
+        t_legacy = timed(legacy_per_record, records, repeat)
+        t_single = timed(per_record, records, repeat)
+        t_batch = timed(app.check_vitals_batch, records, repeat)
+        t_rules = timed(rules_only, records, repeat)
+
+        print(f"{size:>8} | {size / t_legacy:>10.0f} r/s | {size / t_single:>10.0f} r/s | "
+              f"{size / t_batch:>10.0f} r/s | {size / t_rules:>10.0f} r/s | {t_legacy / t_batch:>6.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,518 @@
+"""
+Stand-in in memoria di DynamoDB e API Gateway Management per i benchmark.
+
+Implementano solo la parte di API usata dalle Lambda del progetto
+(risorsa boto3: Table.put_item/get_item/update_item/delete_item/scan/query,
+batch_writer, batch_get_item, batch_write_item; post_to_connection) e
+contano ogni chiamata, così i benchmark riportano anche il numero di
+richieste AWS per invocazione. FakeDynamoDBEndpoint serve invece i client
+di basso livello di botocore (item in formato AttributeValue).
+
+Limiti noti: le ConditionExpression in formato stringa non vengono
+valutate (la scrittura riesce sempre); FilterExpression e
+KeyConditionExpression supportano le condizioni boto3 più comuni
+(eq, lt, lte, gt, gte, between, begins_with, &).
+"""
+import re
+import json
+import time
+import threading
+from collections import Counter
+from decimal import Decimal
+
+from botocore.awsrequest import AWSResponse
+
+# Item restituiti per pagina di scan (emula il limite di 1 MB)
+SCAN_PAGE_SIZE = 100
+
+
+class CallCounter:
+    """Contatore thread-safe delle chiamate AWS, per servizio.operazione"""
+
+    def __init__(self):
+        self._counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, amount=1):
+        with self._lock:
+            self._counts[name] += amount
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+
+# --- Valutazione delle condizioni boto3 (Key/Attr) ---
+
+def _attr_name(operand):
+    return getattr(operand, 'name', None)
+
+
+def evaluate_condition(condition, item):
+    """Valuta una condizione boto3.dynamodb.conditions su un item"""
+    expression = condition.get_expression()
+    operator = expression['operator']
+    values = expression['values']
+
+    if operator == 'AND':
+        return all(evaluate_condition(value, item) for value in values)
+    if operator == 'OR':
+        return any(evaluate_condition(value, item) for value in values)
+    if operator == 'NOT':
+        return not evaluate_condition(values[0], item)
+
+    actual = item.get(_attr_name(values[0]))
+    if operator == 'attribute_exists':
+        return actual is not None
+    if operator == 'attribute_not_exists':
+        return actual is None
+    if actual is None:
+        return False
+    if operator == '=':
+        return actual == values[1]
+    if operator == '<>':
+        return actual != values[1]
+    if operator == '<':
+        return actual < values[1]
+    if operator == '<=':
+        return actual <= values[1]
+    if operator == '>':
+        return actual > values[1]
+    if operator == '>=':
+        return actual >= values[1]
+    if operator == 'BETWEEN':
+        return values[1] <= actual <= values[2]
+    if operator == 'begins_with':
+        return str(actual).startswith(values[1])
+    if operator == 'contains':
+        return values[1] in actual
+    raise NotImplementedError(f"Operatore non supportato dal fake: {operator}")
+
+
+def _equality_key(condition, attribute):
+    """Valore richiesto per `attribute` in una KeyConditionExpression (None se assente)"""
+    expression = condition.get_expression()
+    if expression['operator'] == 'AND':
+        for value in expression['values']:
+            found = _equality_key(value, attribute)
+            if found is not None:
+                return found
+        return None
+    values = expression['values']
+    if expression['operator'] == '=' and _attr_name(values[0]) == attribute:
+        return values[1]
+    return None
+
+
+def project(item, projection, names=None):
+    """Applica una ProjectionExpression (solo attributi di primo livello)"""
+    if not projection:
+        return dict(item)
+    names = names or {}
+    attributes = [names.get(a.strip(), a.strip()) for a in projection.split(',')]
+    return {a: item[a] for a in attributes if a in item}
+
+
+# --- Tabelle ---
+
+class FakeBatchWriter:
+    def __init__(self, table):
+        self.table = table
+        self.pending = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        # Flush finale: una BatchWriteItem ogni 25 scritture
+        if self.pending:
+            self.table.counter.add('dynamodb.BatchWriteItem', -(-self.pending // 25))
+        return False
+
+    def put_item(self, Item):
+        self.table._store(Item)
+        self.pending += 1
+
+    def delete_item(self, Key):
+        self.table._remove(Key)
+        self.pending += 1
+
+
+class FakeTable:
+    """Tabella con chiave hash (+ range opzionale) e indici secondari globali"""
+
+    def __init__(self, name, hash_key, range_key=None, indexes=None, counter=None,
+                 latency_ms=0.0, page_size=SCAN_PAGE_SIZE):
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes or {}    # nome -> (hash_key, range_key)
+        self.counter = counter or CallCounter()
+        self.latency = latency_ms / 1000
+        self.page_size = page_size
+        self.items = {}
+        self._lock = threading.Lock()
+
+    def _call(self, operation):
+        self.counter.add(f"dynamodb.{operation}")
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _key(self, item):
+        if self.range_key:
+            return (item[self.hash_key], item[self.range_key])
+        return item[self.hash_key]
+
+    def _key_dict(self, item, index=None):
+        keys = {self.hash_key, self.range_key} - {None}
+        if index:
+            keys |= set(self.indexes[index]) - {None}
+        return {k: item[k] for k in keys}
+
+    def _store(self, item):
+        with self._lock:
+            self.items[self._key(item)] = dict(item)
+
+    def _remove(self, key):
+        with self._lock:
+            return self.items.pop(self._key(key), None)
+
+    def load(self, items):
+        """Popola la tabella senza contare chiamate"""
+        for item in items:
+            self._store(item)
+
+    def put_item(self, Item, **kwargs):
+        self._call('PutItem')
+        self._store(Item)
+        return {}
+
+    def get_item(self, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **kwargs):
+        self._call('GetItem')
+        item = self.items.get(self._key(Key))
+        if item is None:
+            return {}
+        return {'Item': project(item, ProjectionExpression, ExpressionAttributeNames)}
+
+    def delete_item(self, Key, **kwargs):
+        self._call('DeleteItem')
+        self._remove(Key)
+        return {}
+
+    def update_item(self, Key, UpdateExpression, ExpressionAttributeValues=None,
+                    ExpressionAttributeNames=None, **kwargs):
+        self._call('UpdateItem')
+        values = ExpressionAttributeValues or {}
+        names = ExpressionAttributeNames or {}
+        with self._lock:
+            item = self.items.setdefault(self._key(Key), dict(Key))
+            for action, body in re.findall(r'(SET|REMOVE|ADD)\s+(.*?)(?=\s+(?:SET|REMOVE|ADD)\s|$)',
+                                           UpdateExpression.strip()):
+                # Le virgole dentro if_not_exists(...) non separano le clausole
+                for clause in re.split(r',(?![^()]*\))', body):
+                    clause = clause.strip()
+                    if action == 'REMOVE':
+                        item.pop(names.get(clause, clause), None)
+                    elif action == 'SET':
+                        attribute, _, value = (part.strip() for part in clause.partition('='))
+                        attribute = names.get(attribute, attribute)
+                        match = re.match(r'if_not_exists\(\s*\S+\s*,\s*(\S+)\s*\)\s*\+\s*(\S+)', value)
+                        if match:
+                            item[attribute] = item.get(attribute, values[match.group(1)]) + values[match.group(2)]
+                        else:
+                            item[attribute] = values[value]
+                    else:
+                        attribute, value = clause.split()
+                        attribute = names.get(attribute, attribute)
+                        item[attribute] = item.get(attribute, 0) + values[value]
+        return {}
+
+    def _page(self, candidates, Limit=None, ExclusiveStartKey=None, index=None):
+        """Pagina di risultati con LastEvaluatedKey, come DynamoDB"""
+        start = 0
+        if ExclusiveStartKey:
+            # Sugli indici la chiave include anche gli attributi dell'indice
+            target = ExclusiveStartKey if index else self._key(ExclusiveStartKey)
+            for position, item in enumerate(candidates):
+                if (self._key_dict(item, index) if index else self._key(item)) == target:
+                    start = position + 1
+                    break
+        size = min(Limit or self.page_size, self.page_size)
+        page = candidates[start:start + size]
+        last_key = self._key_dict(page[-1], index) if page and start + size < len(candidates) else None
+        return page, last_key
+
+    def scan(self, ProjectionExpression=None, ExpressionAttributeNames=None, FilterExpression=None,
+             Limit=None, ExclusiveStartKey=None, Segment=None, TotalSegments=None, **kwargs):
+        self._call('Scan')
+        candidates = list(self.items.values())
+        if TotalSegments:
+            candidates = [item for item in candidates
+                          if hash(str(self._key(item))) % TotalSegments == Segment]
+        page, last_key = self._page(candidates, Limit, ExclusiveStartKey)
+        if FilterExpression is not None:
+            page = [item for item in page if evaluate_condition(FilterExpression, item)]
+        response = {
+            'Items': [project(item, ProjectionExpression, ExpressionAttributeNames) for item in page],
+            'Count': len(page)
+        }
+        if last_key:
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+    def query(self, KeyConditionExpression, IndexName=None, ScanIndexForward=True, Limit=None,
+              ExclusiveStartKey=None, ProjectionExpression=None, ExpressionAttributeNames=None,
+              FilterExpression=None, **kwargs):
+        self._call('Query')
+        hash_key, range_key = self.indexes[IndexName] if IndexName else (self.hash_key, self.range_key)
+        value = _equality_key(KeyConditionExpression, hash_key)
+        candidates = [item for item in self.items.values()
+                      if item.get(hash_key) == value and evaluate_condition(KeyConditionExpression, item)]
+        if range_key:
+            candidates.sort(key=lambda item: item.get(range_key), reverse=not ScanIndexForward)
+        page, last_key = self._page(candidates, Limit, ExclusiveStartKey, IndexName)
+        if FilterExpression is not None:
+            page = [item for item in page if evaluate_condition(FilterExpression, item)]
+        response = {
+            'Items': [project(item, ProjectionExpression, ExpressionAttributeNames) for item in page],
+            'Count': len(page)
+        }
+        if last_key:
+            response['LastEvaluatedKey'] = last_key
+        return response
+
+    def batch_writer(self, **kwargs):
+        return FakeBatchWriter(self)
+
+
+class FakeDynamoDB:
+    """Risorsa DynamoDB con le tabelle del progetto"""
+
+    table_class = FakeTable
+
+    def __init__(self, counter=None, latency_ms=0.0):
+        self.counter = counter or CallCounter()
+        self.latency_ms = latency_ms
+        self.tables = {}
+
+    def create_table(self, name, hash_key, range_key=None, indexes=None):
+        table = self.table_class(name, hash_key, range_key, indexes, self.counter, self.latency_ms)
+        self.tables[name] = table
+        return table
+
+    def Table(self, name):
+        return self.tables[name]
+
+    def batch_get_item(self, RequestItems, **kwargs):
+        self.counter.add('dynamodb.BatchGetItem')
+        responses = {}
+        for name, request in RequestItems.items():
+            table = self.tables[name]
+            found = []
+            for key in request['Keys']:
+                item = table.items.get(table._key(key))
+                if item is not None:
+                    found.append(project(item, request.get('ProjectionExpression'),
+                                         request.get('ExpressionAttributeNames')))
+            responses[name] = found
+        return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def batch_write_item(self, RequestItems, **kwargs):
+        self.counter.add('dynamodb.BatchWriteItem')
+        for name, requests in RequestItems.items():
+            table = self.tables[name]
+            for request in requests:
+                if 'PutRequest' in request:
+                    table._store(request['PutRequest']['Item'])
+                else:
+                    table._remove(request['DeleteRequest']['Key'])
+        return {'UnprocessedItems': {}}
+
+
+def create_project_tables(counter=None, latency_ms=0.0, dynamodb_class=FakeDynamoDB):
+    """Le tabelle definite in terraform/main.tf (nomi senza suffisso d'ambiente)"""
+    db = dynamodb_class(counter, latency_ms)
+    db.create_table('Patients', 'patient_id')
+    db.create_table('VitalSigns', 'patient_id', 'timestamp')
+    db.create_table('Alerts', 'alert_id',
+                    indexes={'patient_id-timestamp-index': ('patient_id', 'timestamp')})
+    db.create_table('WebSocketConnections', 'connectionId')
+    db.create_table('AlertSuppression', 'dedup_key')
+    db.create_table('VitalRollups', 'series', 'bucket')
+    return db
+
+
+# --- Endpoint DynamoDB per client di basso livello ---
+
+class FakeValidationError(Exception):
+    pass
+
+
+class _RawBody:
+    """Corpo di risposta per AWSResponse (botocore legge raw.stream())"""
+
+    def __init__(self, data):
+        self.data = data
+
+    def stream(self, **kwargs):
+        yield self.data
+
+
+_COMPARISON = re.compile(r'^(\S+)\s*(<=|>=|<>|<|>|=)\s*(\S+)$')
+
+
+def _scalar(value):
+    """AttributeValue S/N -> valore confrontabile (altri tipi: errore di validazione)"""
+    if not isinstance(value, dict) or len(value) != 1:
+        raise FakeValidationError(f"AttributeValue non valido: {value!r}")
+    kind, raw = next(iter(value.items()))
+    if kind == 'S' and isinstance(raw, str):
+        return kind, raw
+    if kind == 'N' and isinstance(raw, str):
+        return kind, Decimal(raw)
+    raise FakeValidationError(f"AttributeValue non supportato dal fake: {value!r}")
+
+
+class FakeDynamoDBEndpoint:
+    """
+    DynamoDB in memoria dietro un client botocore vero: le richieste
+    arrivano già serializzate (hook before-send), quindi viene verificato
+    anche il formato AttributeValue sul filo. Supporta Scan (anche a
+    segmenti, FilterExpression con confronti uniti da AND/OR) e
+    BatchWriteItem; ogni tabella ha chiave patient_id + timestamp se non
+    indicato diversamente.
+    """
+
+    def __init__(self, counter=None, page_size=SCAN_PAGE_SIZE):
+        self.counter = counter or CallCounter()
+        self.page_size = page_size
+        self.tables = {}                # nome -> (chiavi, {chiave: item})
+        self._lock = threading.Lock()
+
+    def create_table(self, name, hash_key='patient_id', range_key='timestamp'):
+        self.tables[name] = (tuple(k for k in (hash_key, range_key) if k), {})
+
+    def load(self, name, items):
+        keys, stored = self.tables[name]
+        for item in items:
+            stored[self._key(keys, item)] = item
+
+    def items(self, name):
+        return list(self.tables[name][1].values())
+
+    def attach(self, client):
+        client.meta.events.register('before-send.dynamodb', self._handle)
+        return client
+
+    @staticmethod
+    def _key(keys, item):
+        return tuple(_scalar(item[k]) for k in keys)
+
+    def _handle(self, request, **kwargs):
+        target = request.headers['X-Amz-Target']
+        operation = (target.decode() if isinstance(target, bytes) else target).rsplit('.', 1)[-1]
+        self.counter.add(f"dynamodb.{operation}")
+        try:
+            body = getattr(self, f"_{operation}")(json.loads(request.body))
+            status = 200
+        except (FakeValidationError, KeyError) as e:
+            body = {'__type': 'com.amazonaws.dynamodb.v20120810#ValidationException', 'message': str(e)}
+            status = 400
+        return AWSResponse(request.url, status, {'Content-Type': 'application/x-amz-json-1.0'},
+                           _RawBody(json.dumps(body).encode('utf-8')))
+
+    @staticmethod
+    def _matches(expression, item, names, values):
+        """FilterExpression: confronti tra attributi e valori, uniti da OR/AND"""
+        def operand(token):
+            if token.startswith(':'):
+                return _scalar(values[token])
+            attribute = item.get(names.get(token, token))
+            return None if attribute is None else _scalar(attribute)
+
+        def compare(clause):
+            match = _COMPARISON.match(clause.strip())
+            if not match:
+                raise FakeValidationError(f"Condizione non supportata dal fake: {clause}")
+            left, operator, right = operand(match.group(1)), match.group(2), operand(match.group(3))
+            # Attributo mancante o tipi diversi: la condizione è falsa, come in DynamoDB
+            if left is None or right is None or left[0] != right[0]:
+                return False
+            a, b = left[1], right[1]
+            return {'<': a < b, '<=': a <= b, '>': a > b, '>=': a >= b, '=': a == b, '<>': a != b}[operator]
+
+        return any(all(compare(clause) for clause in re.split(r'\s+AND\s+', part))
+                   for part in re.split(r'\s+OR\s+', expression))
+
+    def _Scan(self, body):
+        keys, stored = self.tables[body['TableName']]
+        with self._lock:
+            candidates = list(stored.items())
+        if 'TotalSegments' in body:
+            candidates = [(key, item) for key, item in candidates
+                          if hash(key) % body['TotalSegments'] == body['Segment']]
+        start = 0
+        if 'ExclusiveStartKey' in body:
+            last = self._key(keys, body['ExclusiveStartKey'])
+            start = next((i + 1 for i, (key, _) in enumerate(candidates) if key == last), len(candidates))
+        page = [item for _, item in candidates[start:start + self.page_size]]
+        expression = body.get('FilterExpression')
+        names, values = body.get('ExpressionAttributeNames', {}), body.get('ExpressionAttributeValues', {})
+        items = [item for item in page
+                 if not expression or self._matches(expression, item, names, values)]
+        response = {'Items': items, 'Count': len(items), 'ScannedCount': len(page)}
+        if start + self.page_size < len(candidates):
+            response['LastEvaluatedKey'] = {k: page[-1][k] for k in keys}
+        return response
+
+    def _BatchWriteItem(self, body):
+        for name, requests in body['RequestItems'].items():
+            keys, stored = self.tables[name]
+            with self._lock:
+                for request in requests:
+                    if 'PutRequest' in request:
+                        item = request['PutRequest']['Item']
+                        stored[self._key(keys, item)] = item
+                    else:
+                        key = request['DeleteRequest']['Key']
+                        if set(key) != set(keys):
+                            raise FakeValidationError(f"Chiave non valida: {key!r}")
+                        stored.pop(self._key(keys, key), None)
+        return {'UnprocessedItems': {}}
+
+
+# --- API Gateway Management API ---
+
+class GoneException(Exception):
+    pass
+
+
+class FakeGatewayExceptions:
+    GoneException = GoneException
+
+
+class FakeGateway:
+    """post_to_connection con latenza simulata e connessioni chiuse"""
+
+    exceptions = FakeGatewayExceptions
+
+    def __init__(self, counter=None, latency_ms=0.0, gone=()):
+        self.counter = counter or CallCounter()
+        self.latency = latency_ms / 1000
+        self.gone = set(gone)
+        self.bytes_sent = 0
+        self._lock = threading.Lock()
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.counter.add('apigateway.PostToConnection')
+        if self.latency:
+            time.sleep(self.latency)
+        if ConnectionId in self.gone:
+            raise GoneException(ConnectionId)
+        with self._lock:
+            self.bytes_sent += len(Data)
+        return {}
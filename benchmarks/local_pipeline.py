@@ -0,0 +1,874 @@
+#!/usr/bin/env python3
+"""
+Pipeline completa in un solo processo, senza AWS:
+
+    schedule -> vitals-simulator -> VitalSigns (stream) -> alert-detector
+             -> WebSocket locale (al posto di API Gateway) -> client
+    HTTP locale -> api-handler            WebSocket locale -> connection-manager
+
+Serve a profilare e a fare load test dell'intero percorso caldo su una
+sola macchina, con gli stessi handler che girano in Lambda.
+
+- Tabelle in memoria (benchmarks/fakes.py) esposte come client DynamoDB
+  "documento" tramite aws_clients.provider.override: gli handler non
+  cambiano. VitalSigns pubblica ogni scrittura su uno stream locale con
+  vista NEW_IMAGE (record nello stesso formato di DynamoDB Streams).
+- Lo stream è diviso in shard per chiave di partizione (--shards): un
+  poller per shard invoca alert-detector con batch fino a --batch-size
+  record, attende al più --batching-window secondi per riempirli e
+  applica ReportBatchItemFailures (ripresa dal primo record fallito,
+  --max-retries tentativi, batch dimezzato dopo un errore del handler),
+  come l'event source mapping di terraform/main.tf.
+- Ogni Lambda è un insieme di "container": istanze del modulo app.py
+  riusate tra invocazioni calde e caricate al bisogno (cold start) fino
+  a --concurrency invocazioni parallele.
+- WebSocket reale (RFC 6455, solo libreria standard): $connect con
+  ?token=..., messaggi instradati su 'action' (subscribe, altrimenti
+  $default), $disconnect alla chiusura. post_to_connection di
+  alert-detector scrive direttamente sulla connessione; le connessioni
+  chiuse sollevano GoneException come API Gateway.
+- HTTP: ogni richiesta diventa un evento proxy di API Gateway per
+  api-handler (GET /patients, /patients/{id}, ...).
+- vitals-simulator parte ogni --interval secondi (al posto di
+  EventBridge); il carico è --patients letture per intervallo.
+
+Limiti: le ConditionExpression in formato stringa non sono valutate
+(vedi fakes.py: la deduplicazione resta quella in memoria di ogni
+container), niente TTL né limiti di capacità di DynamoDB.
+
+Uso:
+  python3 benchmarks/local_pipeline.py [--patients 200] [--interval 5]
+      [--shards 2] [--batch-size 100] [--batching-window 0.5] [--concurrency 10]
+      [--ws-port 8765] [--http-port 8080] [--duration 60] [--profile pipeline.prof]
+  Client WebSocket: ws://localhost:8765/?token=local[&department=Cardiologia]
+  API:              http://localhost:8080/patients
+"""
+import os
+import io
+import sys
+import json
+import time
+import uuid
+import zlib
+import base64
+import struct
+import asyncio
+import hashlib
+import pstats
+import cProfile
+import argparse
+import itertools
+import threading
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+os.environ.setdefault('AWS_DEFAULT_REGION', 'eu-north-1')
+
+from boto3.dynamodb.types import TypeSerializer  # noqa: E402
+
+import aws_clients  # noqa: E402
+from fakes import (CallCounter, FakeDynamoDB, FakeGatewayExceptions, FakeTable,  # noqa: E402
+                   GoneException, create_project_tables)
+from bench_handlers import load_lambda, make_patients, percentile  # noqa: E402
+
+# Attesa massima di un poller senza record, prima di ricontrollare lo stop
+POLL_INTERVAL = 0.25
+
+# Limiti di API Gateway WebSocket
+MAX_MESSAGE_BYTES = 128 * 1024
+HANDSHAKE_TIMEOUT = 10
+POST_TIMEOUT = 3.0
+
+# Route del WebSocket API (route selection expression: $request.body.action)
+WEBSOCKET_ROUTES = ('subscribe',)
+WEBSOCKET_GUID = '258EAFA5-E914-47DA-95CA-C5AB0DC85B11'
+
+OP_CONTINUATION, OP_TEXT, OP_BINARY, OP_CLOSE, OP_PING, OP_PONG = 0x0, 0x1, 0x2, 0x8, 0x9, 0xA
+
+
+# --- DynamoDB e stream ---
+
+class StreamShard:
+    """Coda ordinata di record di uno shard; un batch viene rimosso solo a elaborazione confermata"""
+
+    def __init__(self, shard_id):
+        self.shard_id = shard_id
+        self.records = deque()
+        self.published = 0
+        self._ready = threading.Condition()
+
+    def __len__(self):
+        return len(self.records)
+
+    def append(self, record):
+        with self._ready:
+            self.records.append(record)
+            self.published += 1
+            self._ready.notify()
+
+    def peek(self, batch_size, window, stop):
+        """Primo batch (senza rimuoverlo): pieno, oppure allo scadere della finestra"""
+        with self._ready:
+            deadline = None
+            while not stop.is_set() and len(self.records) < batch_size:
+                if not self.records:
+                    self._ready.wait(POLL_INTERVAL)
+                    continue
+                if deadline is None:
+                    deadline = time.monotonic() + window
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._ready.wait(min(remaining, POLL_INTERVAL))
+            return list(itertools.islice(self.records, batch_size))
+
+    def commit(self, count):
+        with self._ready:
+            for _ in range(count):
+                self.records.popleft()
+
+
+class LocalStream:
+    """DynamoDB Streams in memoria (vista NEW_IMAGE), shard scelto dalla chiave di partizione"""
+
+    def __init__(self, table_arn, shards=1):
+        self.table_arn = table_arn
+        self.shards = [StreamShard(f"shard-{i:03d}") for i in range(shards)]
+        self._sequence = itertools.count(1)
+        self._serializer = TypeSerializer()
+        self._lock = threading.Lock()
+
+    @property
+    def backlog(self):
+        return sum(len(shard) for shard in self.shards)
+
+    @property
+    def published(self):
+        return sum(shard.published for shard in self.shards)
+
+    def publish(self, event_name, keys, image=None):
+        serialize = self._serializer.serialize
+        change = {
+            'ApproximateCreationDateTime': int(time.time()),
+            'Keys': {name: serialize(value) for name, value in keys.items()},
+            'StreamViewType': 'NEW_IMAGE'
+        }
+        if image is not None:
+            change['NewImage'] = {name: serialize(value) for name, value in image.items()}
+        partition = str(next(iter(keys.values())))
+        shard = self.shards[zlib.crc32(partition.encode('utf-8')) % len(self.shards)]
+        with self._lock:
+            # Numeri di sequenza crescenti nell'ordine in cui i record entrano negli shard
+            sequence = next(self._sequence)
+            change['SequenceNumber'] = f"{sequence:021d}"
+            shard.append({
+                'eventID': uuid.uuid4().hex,
+                'eventName': event_name,
+                'eventVersion': '1.1',
+                'eventSource': 'aws:dynamodb',
+                'awsRegion': aws_clients.REGION_NAME,
+                'eventSourceARN': f"{self.table_arn}/stream/local",
+                'dynamodb': change
+            })
+
+
+class StreamingTable(FakeTable):
+    """FakeTable che pubblica INSERT/MODIFY/REMOVE sullo stream, se presente"""
+
+    stream = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._write_lock = threading.RLock()
+
+    def _store(self, item):
+        with self._write_lock:
+            previous = self.items.get(self._key(item))
+            super()._store(item)
+            # Come DynamoDB: una scrittura che non cambia l'item non produce record
+            if previous != item:
+                self._publish('MODIFY' if previous is not None else 'INSERT', item)
+
+    def _remove(self, key):
+        with self._write_lock:
+            removed = super()._remove(key)
+            if removed is not None:
+                self._publish('REMOVE', removed)
+            return removed
+
+    def update_item(self, Key, **kwargs):
+        with self._write_lock:
+            previous = self.items.get(self._key(Key))
+            previous = dict(previous) if previous is not None else None
+            response = super().update_item(Key=Key, **kwargs)
+            item = self.items[self._key(Key)]
+            if previous != item:
+                self._publish('MODIFY' if previous is not None else 'INSERT', item)
+            return response
+
+    def _publish(self, event_name, item):
+        if self.stream is not None:
+            self.stream.publish(event_name, self._key_dict(item), None if event_name == 'REMOVE' else item)
+
+
+class LocalDynamoDB(FakeDynamoDB):
+    """
+    Le tabelle in memoria con l'interfaccia del client "documento" di
+    aws_clients (operazioni con TableName, tipi Python)
+    """
+
+    table_class = StreamingTable
+
+    def put_item(self, TableName, **kwargs):
+        return self.tables[TableName].put_item(**kwargs)
+
+    def get_item(self, TableName, **kwargs):
+        return self.tables[TableName].get_item(**kwargs)
+
+    def update_item(self, TableName, **kwargs):
+        return self.tables[TableName].update_item(**kwargs)
+
+    def delete_item(self, TableName, **kwargs):
+        return self.tables[TableName].delete_item(**kwargs)
+
+    def query(self, TableName, **kwargs):
+        return self.tables[TableName].query(**kwargs)
+
+    def scan(self, TableName, **kwargs):
+        return self.tables[TableName].scan(**kwargs)
+
+
+# --- Lambda ---
+
+class HandlerOutput(io.TextIOBase):
+    """sys.stdout del processo: scarta le stampe dei thread che eseguono un handler"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._local = threading.local()
+
+    def write(self, text):
+        if getattr(self._local, 'muted', False):
+            return len(text)
+        return self.stream.write(text)
+
+    def flush(self):
+        self.stream.flush()
+
+    @contextmanager
+    def muted(self):
+        previous = getattr(self._local, 'muted', False)
+        self._local.muted = True
+        try:
+            yield
+        finally:
+            self._local.muted = previous
+
+
+class LocalContext:
+    """Context Lambda minimo (nome e tempo residuo rispetto al timeout)"""
+
+    def __init__(self, function_name, timeout):
+        self.function_name = function_name
+        self.aws_request_id = str(uuid.uuid4())
+        self._deadline = time.monotonic() + timeout
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+# load_lambda modifica sys.path: un caricamento alla volta
+_load_lock = threading.Lock()
+
+
+class LocalFunction:
+    """
+    Una Lambda locale: ogni container è un'istanza di lambda/<nome>/app.py,
+    riusata tra invocazioni calde; se sono tutti occupati ne viene caricato
+    uno nuovo (cold start) fino a max_concurrency invocazioni parallele
+    """
+
+    def __init__(self, name, max_concurrency=10, timeout=30, output=None):
+        self.name = name
+        self.timeout = timeout
+        self.output = output
+        self.invocations = 0
+        self.errors = 0
+        self.durations = []
+        self.cold_starts = []
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+    @property
+    def containers(self):
+        return len(self.cold_starts)
+
+    def _acquire(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        began = time.perf_counter()
+        with _load_lock:
+            module = load_lambda(self.name)
+        self.cold_starts.append((time.perf_counter() - began) * 1000)
+        return module
+
+    def invoke(self, event):
+        with self._slots:
+            module = self._acquire()
+            began = time.perf_counter()
+            try:
+                if self.output is None:
+                    return module.lambda_handler(event, LocalContext(self.name, self.timeout))
+                with self.output.muted():
+                    return module.lambda_handler(event, LocalContext(self.name, self.timeout))
+            except Exception:
+                with self._lock:
+                    self.errors += 1
+                raise
+            finally:
+                with self._lock:
+                    self.durations.append((time.perf_counter() - began) * 1000)
+                    self.invocations += 1
+                    self._idle.append(module)
+
+    def summary(self):
+        if not self.invocations:
+            return f"{self.name:<20} nessuna invocazione"
+        cold = sum(self.cold_starts) / len(self.cold_starts) if self.cold_starts else 0.0
+        return (f"{self.name:<20} {self.invocations:>7,} invocazioni, {self.errors} errori, "
+                f"p50 {percentile(self.durations, 50):>8.2f} ms, p99 {percentile(self.durations, 99):>8.2f} ms, "
+                f"{self.containers} container (init ~{cold:.0f} ms)")
+
+
+class StreamPoller:
+    """Event source mapping dello stream: un thread per shard"""
+
+    def __init__(self, stream, function, batch_size=100, batching_window=0.0,
+                 max_retries=3, profile=False):
+        self.stream = stream
+        self.function = function
+        self.batch_size = batch_size
+        self.batching_window = batching_window
+        self.max_retries = max_retries
+        self.profile = profile
+        self.processed = 0
+        self.retried = 0
+        self.dropped = 0
+        self.batches = []            # record per invocazione
+        self.delivery_lags = []      # DeliveryLagMaxMs riportato da alert-detector
+        self.profiles = []
+        self._stop = threading.Event()
+        self._threads = [threading.Thread(target=self._run, args=(shard,), name=f"poller-{shard.shard_id}",
+                                          daemon=True)
+                         for shard in stream.shards]
+
+    def start(self):
+        for thread in self._threads:
+            thread.start()
+
+    def stop(self):
+        self._stop.set()
+        for thread in self._threads:
+            thread.join()
+
+    @staticmethod
+    def retry_from(batch, response):
+        """Posizione da cui ritentare il batch (None = tutto elaborato)"""
+        if response is None:
+            return 0
+        failures = response.get('batchItemFailures') or []
+        if not failures:
+            return None
+        failed = {failure.get('itemIdentifier') for failure in failures}
+        for position, record in enumerate(batch):
+            if record['dynamodb']['SequenceNumber'] in failed:
+                return position
+        # Identificatore sconosciuto: Lambda ritenta l'intero batch
+        return 0
+
+    def _run(self, shard):
+        profiler = cProfile.Profile() if self.profile else None
+        attempts = 0
+        limit = self.batch_size
+        while not self._stop.is_set():
+            batch = shard.peek(limit, self.batching_window, self._stop)
+            if not batch:
+                continue
+            if profiler:
+                profiler.enable()
+            try:
+                response = self.function.invoke({'Records': batch})
+            except Exception as e:
+                print(f"❌ {self.function.name} ({shard.shard_id}): {e}")
+                response = None
+            finally:
+                if profiler:
+                    profiler.disable()
+            self.batches.append(len(batch))
+            self._record_latency(response)
+
+            position = self.retry_from(batch, response)
+            if position is None:
+                shard.commit(len(batch))
+                self.processed += len(batch)
+                attempts, limit = 0, self.batch_size
+                continue
+            # Checkpoint fino al primo record fallito, poi nuovo tentativo
+            shard.commit(position)
+            self.processed += position
+            attempts += 1
+            self.retried += len(batch) - position
+            if response is None:
+                # bisect_batch_on_function_error: il batch successivo è dimezzato
+                limit = max(1, len(batch) // 2)
+            if attempts > self.max_retries:
+                shard.commit(len(batch) - position)
+                self.dropped += len(batch) - position
+                print(f"⚠️ {shard.shard_id}: {len(batch) - position} record scartati dopo {self.max_retries} tentativi")
+                attempts, limit = 0, self.batch_size
+        if profiler:
+            self.profiles.append(profiler)
+
+    def _record_latency(self, response):
+        try:
+            lag = json.loads(response['body'])['latency'].get('DeliveryLagMaxMs')
+        except (TypeError, KeyError, ValueError):
+            return
+        if lag is not None:
+            self.delivery_lags.append(lag)
+
+
+# --- WebSocket (al posto di API Gateway) ---
+
+def encode_frame(opcode, payload):
+    """Frame dal server (FIN, senza maschera)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack('!BB', 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack('!BBH', 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack('!BBQ', 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def unmask(payload, mask):
+    """XOR con la maschera del client, su interi invece che byte per byte"""
+    if not payload:
+        return payload
+    repeated = (mask * (len(payload) // 4 + 1))[:len(payload)]
+    value = int.from_bytes(payload, 'big') ^ int.from_bytes(repeated, 'big')
+    return value.to_bytes(len(payload), 'big')
+
+
+class ProtocolError(Exception):
+    def __init__(self, code, reason):
+        super().__init__(reason)
+        self.code = code
+
+
+async def read_frame(reader):
+    """(fin, opcode, payload) del prossimo frame del client"""
+    first, second = await reader.readexactly(2)
+    length = second & 0x7F
+    if length == 126:
+        length, = struct.unpack('!H', await reader.readexactly(2))
+    elif length == 127:
+        length, = struct.unpack('!Q', await reader.readexactly(8))
+    if length > MAX_MESSAGE_BYTES:
+        raise ProtocolError(1009, 'Messaggio troppo grande')
+    if not second & 0x80:
+        raise ProtocolError(1002, 'Frame del client senza maschera')
+    mask = await reader.readexactly(4)
+    return bool(first & 0x80), first & 0x0F, unmask(await reader.readexactly(length), mask)
+
+
+class WebSocketConnection:
+    def __init__(self, connection_id, writer):
+        self.connection_id = connection_id
+        self.writer = writer
+        self.closed = False
+        self._send_lock = asyncio.Lock()
+
+    async def send(self, opcode, payload):
+        if self.closed:
+            raise ConnectionResetError(self.connection_id)
+        async with self._send_lock:
+            self.writer.write(encode_frame(opcode, payload))
+            await self.writer.drain()
+
+
+class LocalWebSocketServer:
+    """Server WebSocket su un event loop dedicato; le route invocano connection-manager"""
+
+    def __init__(self, function, host='0.0.0.0', port=8765):
+        self.function = function
+        self.host = host
+        self.port = port
+        self.connections = {}
+        self.accepted = 0
+        self.rejected = 0
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.loop = asyncio.new_event_loop()
+        self._server = None
+        self._stats_lock = threading.Lock()
+        self._ready = threading.Event()
+        self._thread = threading.Thread(target=self._serve, name='websocket', daemon=True)
+
+    def start(self):
+        self._thread.start()
+        self._ready.wait()
+
+    def stop(self):
+        async def shutdown():
+            self._server.close()
+            for connection in list(self.connections.values()):
+                connection.writer.close()
+            await self._server.wait_closed()
+
+        asyncio.run_coroutine_threadsafe(shutdown(), self.loop).result(timeout=10)
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def _serve(self):
+        asyncio.set_event_loop(self.loop)
+        self._server = self.loop.run_until_complete(asyncio.start_server(self._handle, self.host, self.port))
+        self._ready.set()
+        self.loop.run_forever()
+
+    def post(self, connection_id, data, timeout=POST_TIMEOUT):
+        """post_to_connection (thread qualsiasi): GoneException se la connessione non c'è più"""
+        connection = self.connections.get(connection_id)
+        if connection is None or connection.closed:
+            raise GoneException(connection_id)
+        future = asyncio.run_coroutine_threadsafe(connection.send(OP_TEXT, data), self.loop)
+        try:
+            future.result(timeout)
+        except (ConnectionError, OSError):
+            raise GoneException(connection_id)
+        with self._stats_lock:
+            self.frames_sent += 1
+            self.bytes_sent += len(data)
+
+    async def _route(self, route_key, connection_id, params=None, body=None):
+        event_type = {'$connect': 'CONNECT', '$disconnect': 'DISCONNECT'}.get(route_key, 'MESSAGE')
+        event = {
+            'requestContext': {'connectionId': connection_id, 'routeKey': route_key,
+                               'eventType': event_type, 'stage': 'local'},
+            'queryStringParameters': params,
+            'body': body
+        }
+        try:
+            return await self.loop.run_in_executor(None, self.function.invoke, event)
+        except Exception as e:
+            print(f"❌ connection-manager {route_key}: {e}")
+            return None
+
+    async def _reject(self, writer, status, reason):
+        self.rejected += 1
+        writer.write(f"HTTP/1.1 {status} {reason}\r\nContent-Length: 0\r\nConnection: close\r\n\r\n".encode())
+        await writer.drain()
+        writer.close()
+
+    async def _handle(self, reader, writer):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), HANDSHAKE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        lines = request.decode('latin-1').split('\r\n')
+        target = lines[0].split(' ')[1] if len(lines[0].split(' ')) > 1 else '/'
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+        key = headers.get('sec-websocket-key')
+        if headers.get('upgrade', '').lower() != 'websocket' or not key:
+            await self._reject(writer, 426, 'Upgrade Required')
+            return
+
+        # API Gateway: $connect prima dell'handshake, rifiuto se il handler non risponde 200
+        connection_id = base64.b64encode(os.urandom(12)).decode()
+        params = {name: values[-1] for name, values in parse_qs(urlsplit(target).query).items()} or None
+        response = await self._route('$connect', connection_id, params=params)
+        if not response or response.get('statusCode') != 200:
+            await self._reject(writer, 403, 'Forbidden')
+            return
+
+        accept = base64.b64encode(hashlib.sha1((key + WEBSOCKET_GUID).encode()).digest()).decode()
+        writer.write(("HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+                      f"Sec-WebSocket-Accept: {accept}\r\n\r\n").encode())
+        connection = WebSocketConnection(connection_id, writer)
+        self.connections[connection_id] = connection
+        self.accepted += 1
+        try:
+            await self._receive(connection, reader)
+        except ProtocolError as e:
+            await self._close(connection, e.code)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            connection.closed = True
+            self.connections.pop(connection_id, None)
+            writer.close()
+            await self._route('$disconnect', connection_id)
+
+    async def _receive(self, connection, reader):
+        fragments = []
+        while True:
+            fin, opcode, payload = await read_frame(reader)
+            if opcode == OP_PING:
+                await connection.send(OP_PONG, payload)
+                continue
+            if opcode == OP_PONG:
+                continue
+            if opcode == OP_CLOSE:
+                await self._close(connection, struct.unpack('!H', payload[:2])[0] if len(payload) >= 2 else 1000)
+                return
+            if opcode in (OP_TEXT, OP_BINARY):
+                fragments = [payload]
+            elif opcode == OP_CONTINUATION and fragments:
+                fragments.append(payload)
+            else:
+                raise ProtocolError(1002, f"Opcode non valido: {opcode}")
+            if sum(map(len, fragments)) > MAX_MESSAGE_BYTES:
+                raise ProtocolError(1009, 'Messaggio troppo grande')
+            if fin:
+                await self._message(connection, b''.join(fragments).decode('utf-8', errors='replace'))
+                fragments = []
+
+    async def _message(self, connection, body):
+        try:
+            action = json.loads(body).get('action')
+        except (ValueError, AttributeError):
+            action = None
+        route_key = action if action in WEBSOCKET_ROUTES else '$default'
+        await self._route(route_key, connection.connection_id, body=body)
+
+    async def _close(self, connection, code=1000):
+        try:
+            await connection.send(OP_CLOSE, struct.pack('!H', code))
+        except (ConnectionError, OSError):
+            pass
+        connection.closed = True
+
+
+class LocalGateway:
+    """Client apigatewaymanagementapi sostitutivo: invia sul server WebSocket locale"""
+
+    exceptions = FakeGatewayExceptions
+
+    def __init__(self, server):
+        self.server = server
+
+    def post_to_connection(self, ConnectionId, Data):
+        self.server.post(ConnectionId, Data if isinstance(Data, bytes) else str(Data).encode('utf-8'))
+        return {}
+
+
+# --- HTTP (al posto di API Gateway REST) ---
+
+def api_request_handler(function):
+    """Classe per ThreadingHTTPServer: ogni richiesta diventa un evento proxy per api-handler"""
+
+    class ApiRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _invoke(self):
+            url = urlsplit(self.path)
+            event = {
+                'httpMethod': self.command,
+                'path': url.path,
+                'queryStringParameters': {name: values[-1] for name, values in parse_qs(url.query).items()} or None,
+                'headers': dict(self.headers.items()),
+                'requestContext': {'stage': 'local'}
+            }
+            try:
+                response = function.invoke(event)
+            except Exception as e:
+                print(f"❌ api-handler {self.command} {url.path}: {e}")
+                response = {'statusCode': 502, 'body': json.dumps({'message': 'Internal server error'})}
+            body = (response.get('body') or '').encode('utf-8')
+            self.send_response(response.get('statusCode', 200))
+            for name, value in (response.get('headers') or {}).items():
+                self.send_header(name, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        do_GET = do_OPTIONS = _invoke
+
+        def log_message(self, format, *args):
+            pass
+
+    return ApiRequestHandler
+
+
+# --- Pipeline ---
+
+class Schedule:
+    """Al posto della regola EventBridge: invocazioni asincrone a intervallo fisso"""
+
+    def __init__(self, function, interval, max_concurrency=10):
+        self.function = function
+        self.interval = interval
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix='schedule')
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='schedule', daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def _invoke(self):
+        try:
+            self.function.invoke({'source': 'aws.events', 'detail-type': 'Scheduled Event'})
+        except Exception as e:
+            print(f"❌ {self.function.name}: {e}")
+
+    def _run(self):
+        next_run = time.monotonic()
+        while not self._stop.wait(max(0.0, next_run - time.monotonic())):
+            # Come EventBridge: un'invocazione lenta non ritarda la successiva
+            self._executor.submit(self._invoke)
+            next_run = max(next_run + self.interval, time.monotonic())
+
+
+def load_patients(args):
+    if args.patients_csv:
+        sys.path.insert(0, os.path.join(ROOT, 'scripts'))
+        from bulk_loader import read_patients
+        return read_patients(args.patients_csv)
+    return make_patients(args.patients)
+
+
+def report_line(elapsed, poller, websocket, stream):
+    batches = poller.batches[-1000:]
+    lags = poller.delivery_lags[-1000:]
+    text = (f"📊 [{elapsed:>5.0f}s] letture {stream.published:,} ({stream.published / elapsed:,.0f}/s) | "
+            f"stream: backlog {stream.backlog:,}, elaborate {poller.processed:,}")
+    if batches:
+        text += f", batch medio {sum(batches) / len(batches):.0f}"
+    if lags:
+        text += f" | consegna p50 {percentile(lags, 50):.0f} ms p99 {percentile(lags, 99):.0f} ms"
+    return text + f" | WebSocket: {len(websocket.connections)} client, {websocket.frames_sent:,} frame"
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pipeline locale completa (simulatore, stream, allarmi, WebSocket, API)')
+    parser.add_argument('--patients', type=int, default=50, help='pazienti sintetici (letture per intervallo)')
+    parser.add_argument('--patients-csv', help='pazienti da un CSV nel formato di data/patients.csv')
+    parser.add_argument('--interval', type=float, default=10.0, help='secondi tra due invocazioni del simulatore')
+    parser.add_argument('--shards', type=int, default=1, help='shard dello stream = poller in parallelo')
+    parser.add_argument('--batch-size', type=int, default=100, help='record massimi per invocazione')
+    parser.add_argument('--batching-window', type=float, default=0.0,
+                        help='secondi massimi di attesa per riempire un batch')
+    parser.add_argument('--max-retries', type=int, default=3, help='tentativi per batch fallito')
+    parser.add_argument('--concurrency', type=int, default=10, help='invocazioni parallele per Lambda')
+    parser.add_argument('--dynamodb-latency-ms', type=float, default=0.0,
+                        help='latenza simulata delle chiamate DynamoDB')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--ws-port', type=int, default=8765)
+    parser.add_argument('--http-port', type=int, default=8080)
+    parser.add_argument('--duration', type=float, default=0.0, help='secondi di esecuzione (0 = fino a Ctrl+C)')
+    parser.add_argument('--report-interval', type=float, default=10.0)
+    parser.add_argument('--profile', help='salva il profilo cProfile dei poller (alert-detector) in questo file')
+    parser.add_argument('--verbose', action='store_true', help='mostra le stampe dei handler')
+    args = parser.parse_args()
+
+    # Nomi logici delle tabelle: le variabili d'ambiente puntano a tabelle AWS reali
+    for env_var in aws_clients.TABLE_ENV_VARS.values():
+        os.environ.pop(env_var, None)
+
+    output = None
+    if not args.verbose:
+        output = sys.stdout = HandlerOutput(sys.stdout)
+
+    counter = CallCounter()
+    db = create_project_tables(counter, args.dynamodb_latency_ms, dynamodb_class=LocalDynamoDB)
+    patients = load_patients(args)
+    db.Table('Patients').load(patients)
+    stream = LocalStream('arn:aws:dynamodb:local:000000000000:table/VitalSigns', max(1, args.shards))
+    db.Table('VitalSigns').stream = stream
+
+    functions = {name: LocalFunction(name, args.concurrency, output=output)
+                 for name in ('vitals-simulator', 'alert-detector', 'api-handler', 'connection-manager')}
+    websocket = LocalWebSocketServer(functions['connection-manager'], args.host, args.ws_port)
+    aws_clients.provider.override('dynamodb', db)
+    aws_clients.provider.override('apigatewaymanagementapi', LocalGateway(websocket))
+
+    poller = StreamPoller(stream, functions['alert-detector'], args.batch_size, args.batching_window,
+                          args.max_retries, profile=bool(args.profile))
+    http = ThreadingHTTPServer((args.host, args.http_port), api_request_handler(functions['api-handler']))
+    http.daemon_threads = True
+    schedule = Schedule(functions['vitals-simulator'], args.interval, args.concurrency)
+
+    websocket.start()
+    threading.Thread(target=http.serve_forever, name='http', daemon=True).start()
+    poller.start()
+    schedule.start()
+    print(f"🏥 Pipeline locale: {len(patients)} pazienti ogni {args.interval:g}s, "
+          f"{len(stream.shards)} shard, batch {args.batch_size}, finestra {args.batching_window:g}s")
+    print(f"   WebSocket: ws://{args.host}:{args.ws_port}/?token=local")
+    print(f"   API:       http://{args.host}:{args.http_port}/patients")
+
+    started = time.monotonic()
+    next_report = started + args.report_interval
+    try:
+        while not args.duration or time.monotonic() - started < args.duration:
+            time.sleep(min(0.5, max(0.0, next_report - time.monotonic())))
+            if time.monotonic() >= next_report:
+                print(report_line(time.monotonic() - started, poller, websocket, stream))
+                next_report += args.report_interval
+    except KeyboardInterrupt:
+        print("\n⏹️  Arresto...")
+
+    # Prima si ferma il carico, poi si smaltisce lo stream
+    schedule.stop()
+    drain_deadline = time.monotonic() + 30
+    while stream.backlog and time.monotonic() < drain_deadline:
+        time.sleep(0.1)
+    poller.stop()
+    http.shutdown()
+    websocket.stop()
+    elapsed = time.monotonic() - started
+
+    print(f"\n✅ {elapsed:.0f}s, {stream.published:,} record nello stream "
+          f"({stream.published / elapsed:,.0f}/s): {poller.processed:,} elaborati, "
+          f"{poller.retried:,} ritentati, {poller.dropped:,} scartati, {stream.backlog:,} in coda")
+    for function in functions.values():
+        print(f"   {function.summary()}")
+    if poller.delivery_lags:
+        print(f"   Consegna (acquisizione -> WebSocket, max per batch): "
+              f"p50 {percentile(poller.delivery_lags, 50):.0f} ms, p99 {percentile(poller.delivery_lags, 99):.0f} ms")
+    print(f"   WebSocket: {websocket.accepted} connessioni ({websocket.rejected} rifiutate), "
+          f"{websocket.frames_sent:,} frame, {websocket.bytes_sent / 1024:,.0f} KiB")
+    calls = counter.snapshot()
+    print(f"   Chiamate DynamoDB: {sum(calls.values()):,} {dict(sorted(calls.items()))}")
+
+    if args.profile and poller.profiles:
+        stats = pstats.Stats(poller.profiles[0], stream=sys.stdout)
+        for profiler in poller.profiles[1:]:
+            stats.add(profiler)
+        stats.dump_stats(args.profile)
+        print(f"\n🔬 Profilo dei poller salvato in {args.profile} (prime 25 funzioni per tempo cumulativo)")
+        stats.sort_stats('cumulative').print_stats(25)
+
+
+if __name__ == '__main__':
+    main()
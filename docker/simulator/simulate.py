@@ -2,17 +2,33 @@
 """
 Local IoT Simulator - Simula device medicali che inviano dati a DynamoDB
 Questo script wrappa la Lambda vitals-simulator per eseguirla in loop
+
+Modalità (SIMULATOR_MODE):
+- loop: esegue il handler della Lambda ogni SIMULATION_INTERVAL secondi
+- load: generatore di carico a tasso costante (TARGET_RATE letture/s) per
+  il capacity test del percorso stream -> alert-detector -> WebSocket.
+  Lo scheduling è open-loop: ogni device ha la propria cadenza con jitter
+  e le letture partono all'istante pianificato anche se le scritture
+  precedenti sono ancora in corso (niente deriva, niente coordinated
+  omission). A fine test stampa throughput e istogrammi di latenza.
 """
 import os
 import sys
 import time
 import json
+import heapq
+import random
+import asyncio
 from datetime import datetime
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
 
-# Aggiungi il path della Lambda al PYTHONPATH
+# Aggiungi il path della Lambda e del layer condiviso al PYTHONPATH
 sys.path.insert(0, '/app/lambda/vitals-simulator')
+sys.path.insert(0, '/app/lambda/shared/python')
 
 try:
+    import app as simulator
     from app import lambda_handler
 except ImportError as e:
     print(f"Errore import Lambda: {e}")
@@ -22,6 +38,21 @@ except ImportError as e:
 # Configurazione
 SIMULATION_INTERVAL = int(os.environ.get('SIMULATION_INTERVAL', 10))
 NUM_PATIENTS = int(os.environ.get('NUM_PATIENTS', 50))
+SIMULATOR_MODE = os.environ.get('SIMULATOR_MODE', 'loop')
+
+# Modalità load
+TARGET_RATE = float(os.environ.get('TARGET_RATE', 50))          # letture/s totali
+DURATION = float(os.environ.get('DURATION', 60))                # secondi
+DEVICE_JITTER = float(os.environ.get('DEVICE_JITTER', 0.1))     # frazione del periodo
+WRITER_THREADS = int(os.environ.get('WRITER_THREADS', 32))
+REPORT_INTERVAL = float(os.environ.get('REPORT_INTERVAL', 10))
+ANOMALY_RATE = float(os.environ.get('ANOMALY_RATE', 0.01))      # prob. di inizio episodio per lettura
+ANOMALY_DURATION = int(os.environ.get('ANOMALY_DURATION', 12))  # letture per episodio
+ANOMALY_SCENARIOS = [s.strip() for s in os.environ.get(
+    'ANOMALY_SCENARIOS', 'tachycardia,hypoxia,fever,hypertension,desaturation').split(',') if s.strip()]
+
+# Limiti superiori dei bucket degli istogrammi (ms)
+HISTOGRAM_BUCKETS_MS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf'))
 
 def simulate_iot_devices():
     """Simula l'invio continuo di dati da device IoT"""
@@ -83,9 +114,208 @@ def simulate_iot_devices():
         print(f"Attendo {SIMULATION_INTERVAL} secondi prima della prossima iterazione...")
         time.sleep(SIMULATION_INTERVAL)
 
+def apply_scenario(vitals, scenario, step):
+    """Modifica una lettura secondo lo scenario di anomalia (step = lettura dell'episodio)"""
+    if scenario == 'tachycardia':
+        vitals['heart_rate'] = Decimal(str(round(float(vitals['heart_rate']) + 45 + random.uniform(0, 15), 1)))
+    elif scenario == 'hypoxia':
+        vitals['spo2'] = max(70, vitals['spo2'] - 10 - random.randint(0, 4))
+    elif scenario == 'fever':
+        vitals['temperature'] = Decimal(str(round(float(vitals['temperature']) + 2.0 + random.uniform(0, 0.8), 1)))
+    elif scenario == 'hypertension':
+        vitals['bp_systolic'] += 50
+        vitals['blood_pressure'] = f"{vitals['bp_systolic']}/{vitals['bp_diastolic']}"
+    elif scenario == 'desaturation':
+        # Calo progressivo: -1% per lettura
+        vitals['spo2'] = max(70, vitals['spo2'] - step)
+    return vitals
+
+
+class Device:
+    """Un device al letto del paziente: cadenza propria ed eventuale episodio in corso"""
+
+    __slots__ = ('patient', 'period', 'readings', 'scenario', 'scenario_step')
+
+    def __init__(self, patient, period):
+        self.patient = patient
+        self.period = period
+        self.readings = 0
+        self.scenario = None
+        self.scenario_step = 0
+
+    def next_reading(self):
+        """Ritorna (lettura, scenario se inizia ora un episodio)"""
+        started = None
+        if self.scenario is None and ANOMALY_SCENARIOS and random.random() < ANOMALY_RATE:
+            self.scenario = started = random.choice(ANOMALY_SCENARIOS)
+            self.scenario_step = 0
+
+        vitals = simulator.simulate_vital_signs(self.patient)
+        if self.scenario is not None:
+            self.scenario_step += 1
+            apply_scenario(vitals, self.scenario, self.scenario_step)
+            if self.scenario_step >= ANOMALY_DURATION:
+                self.scenario = None
+        self.readings += 1
+        return vitals, started
+
+
+class LoadStats:
+    """Contatori e latenze del generatore di carico"""
+
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.anomalies = {}
+        self.write_ms = []      # durata della put_item
+        self.latency_ms = []    # dall'istante pianificato al completamento
+        self.lag_ms = []        # ritardo dell'invio rispetto alla pianificazione
+
+    def summary(self, elapsed):
+        return {
+            'sent': self.sent,
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 2),
+            'achieved_rate': round(self.sent / elapsed, 1) if elapsed > 0 else 0.0,
+            'target_rate': TARGET_RATE,
+            'anomalies': dict(self.anomalies)
+        }
+
+
+def percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def print_histogram(title, values):
+    """Istogramma testuale a bucket logaritmici, con percentili"""
+    print(f"\n{title} (n={len(values)}, p50={percentile(values, 50):.1f} ms, "
+          f"p90={percentile(values, 90):.1f} ms, p99={percentile(values, 99):.1f} ms, "
+          f"max={max(values, default=0):.1f} ms)")
+    if not values:
+        return
+    counts = [0] * len(HISTOGRAM_BUCKETS_MS)
+    for value in values:
+        for i, bound in enumerate(HISTOGRAM_BUCKETS_MS):
+            if value <= bound:
+                counts[i] += 1
+                break
+    peak = max(counts)
+    for bound, count in zip(HISTOGRAM_BUCKETS_MS, counts):
+        label = "   inf" if bound == float('inf') else f"{bound:>6.0f}"
+        bar = '#' * int(40 * count / peak) if peak else ''
+        print(f"   <= {label} ms | {count:>8} {bar}")
+
+
+def load_devices():
+    """NUM_PATIENTS device: pazienti reali da Patients, completati con pazienti sintetici"""
+    try:
+        patients = simulator.get_all_patients()[:NUM_PATIENTS]
+    except Exception as e:
+        print(f"Impossibile leggere Patients ({str(e)}): uso solo pazienti sintetici")
+        patients = []
+    real_count = len(patients)
+    for i in range(real_count, NUM_PATIENTS):
+        patients.append({'patient_id': f"SIM{i:05d}", 'name': f"Paziente simulato {i}"})
+
+    # Ogni device invia con periodo NUM_PATIENTS / TARGET_RATE: il totale è TARGET_RATE
+    period = len(patients) / TARGET_RATE
+    return [Device(patient, period) for patient in patients], real_count
+
+
+async def run_load_test():
+    devices, real_count = load_devices()
+    stats = LoadStats()
+    loop = asyncio.get_running_loop()
+    executor = ThreadPoolExecutor(max_workers=WRITER_THREADS)
+    start = time.perf_counter()
+    end = start + DURATION
+
+    print("=" * 70)
+    print("Hospital IoT Load Generator - Starting...")
+    print("=" * 70)
+    print(f"   - Device: {len(devices)} (periodo {devices[0].period:.2f}s, jitter {DEVICE_JITTER:.0%})")
+    print(f"   - Tasso obiettivo: {TARGET_RATE:.1f} letture/s per {DURATION:.0f}s")
+    print(f"   - Anomalie: {ANOMALY_RATE:.1%} per lettura, scenari {', '.join(ANOMALY_SCENARIOS) or 'nessuno'}")
+    print(f"   - Thread di scrittura: {WRITER_THREADS}")
+    print("=" * 70)
+
+    def write(item):
+        began = time.perf_counter()
+        simulator.vitals_table.put_item(Item=item)
+        return began, time.perf_counter()
+
+    async def send(device, planned):
+        vitals, scenario = device.next_reading()
+        if scenario:
+            stats.anomalies[scenario] = stats.anomalies.get(scenario, 0) + 1
+        try:
+            began, finished = await loop.run_in_executor(executor, write, vitals)
+        except Exception as e:
+            stats.errors += 1
+            if stats.errors <= 5:
+                print(f"Errore scrittura {device.patient['patient_id']}: {str(e)}")
+            return
+        stats.sent += 1
+        stats.lag_ms.append((began - planned) * 1000)
+        stats.write_ms.append((finished - began) * 1000)
+        stats.latency_ms.append((finished - planned) * 1000)
+
+    # Coda degli istanti pianificati: fase iniziale casuale per ogni device
+    schedule = [(start + random.uniform(0, device.period), i) for i, device in enumerate(devices)]
+    heapq.heapify(schedule)
+    tasks = set()
+    next_report = start + REPORT_INTERVAL
+
+    while schedule and schedule[0][0] < end:
+        planned, i = heapq.heappop(schedule)
+        delay = planned - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        task = asyncio.create_task(send(devices[i], planned))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+
+        # Prossima lettura del device: cadenza fissa + jitter, calcolata
+        # dall'istante pianificato (non da quello effettivo) per non derivare
+        device = devices[i]
+        jitter = random.uniform(-DEVICE_JITTER, DEVICE_JITTER) * device.period
+        heapq.heappush(schedule, (planned + device.period + jitter, i))
+
+        now = time.perf_counter()
+        if now >= next_report:
+            next_report += REPORT_INTERVAL
+            elapsed = now - start
+            print(f"[{elapsed:6.1f}s] inviate {stats.sent} ({stats.sent / elapsed:.1f}/s), "
+                  f"in volo {len(tasks)}, errori {stats.errors}, "
+                  f"p99 {percentile(stats.latency_ms[-5000:], 99):.0f} ms")
+
+    if tasks:
+        await asyncio.gather(*tasks)
+    executor.shutdown()
+    elapsed = time.perf_counter() - start
+
+    summary = stats.summary(elapsed)
+    summary['real_patients'] = real_count
+    print("\n" + "=" * 70)
+    print("Risultati load test")
+    print("=" * 70)
+    print(json.dumps(summary, indent=2))
+    print_histogram("Durata scrittura (put_item)", stats.write_ms)
+    print_histogram("Latenza dalla pianificazione", stats.latency_ms)
+    print_histogram("Ritardo di invio (scheduling)", stats.lag_ms)
+    return summary
+
+
 if __name__ == "__main__":
     try:
-        simulate_iot_devices()
+        if SIMULATOR_MODE == 'load':
+            asyncio.run(run_load_test())
+        else:
+            simulate_iot_devices()
     except KeyboardInterrupt:
         print("\n\nSimulazione interrotta dall'utente")
         print("Simulator stopped gracefully")
@@ -1,4 +1,4 @@
-import React, { useEffect, useState, useCallback } from 'react';
+import React, { useEffect, useState, useCallback, useRef } from 'react';
 import axios from 'axios';
 import { Authenticator } from '@aws-amplify/ui-react';
 import { fetchAuthSession } from 'aws-amplify/auth'; 
@@ -7,10 +7,51 @@ import PatientDetail from './components/PatientDetail';
 import AlertsDropdown from './components/AlertsDropdown';
 import './App.css';
 
+// Applica una lettura vitale (vitalUpdate) al record del paziente
+const withVitals = (patient, vitals) => ({
+  ...patient,
+  status: vitals.status,
+  latest_vitals: {
+    heart_rate: vitals.heart_rate,
+    bp: `${vitals.bp_systolic}/${vitals.bp_diastolic}`,
+    spo2: vitals.spo2,
+    temperature: vitals.temperature,
+    timestamp: vitals.timestamp
+  }
+});
+
+// Chiavi abbreviate dei frame WebSocket compatti (come COMPACT_KEYS in serialization.py)
+const COMPACT_KEYS = {
+  p: 'patient_id', n: 'name', hr: 'heart_rate', bs: 'bp_systolic', bd: 'bp_diastolic',
+  o2: 'spo2', t: 'temperature', s: 'status', ts: 'timestamp', it: 'ingest_time',
+  a: 'alert_id', v: 'violations', sv: 'severity'
+};
+
+const expandKeys = (value) => {
+  if (Array.isArray(value)) return value.map(expandKeys);
+  if (value === null || typeof value !== 'object') return value;
+  const expanded = {};
+  Object.entries(value).forEach(([key, item]) => {
+    expanded[COMPACT_KEYS[key] || key] = expandKeys(item);
+  });
+  return expanded;
+};
+
+// Campioni di latenza di consegna tenuti in memoria (finestra mobile)
+const LATENCY_WINDOW = 200;
+
+const percentile = (values, pct) => {
+  if (values.length === 0) return null;
+  const sorted = [...values].sort((a, b) => a - b);
+  return sorted[Math.min(sorted.length - 1, Math.floor(sorted.length * pct / 100))];
+};
+
 function App() {
   const [patients, setPatients] = useState([]);
   const [selectedPatientId, setSelectedPatientId] = useState(null);
   const [activeAlerts, setActiveAlerts] = useState([]);
+  const [deliveryLatency, setDeliveryLatency] = useState(null);
+  const latencySamples = useRef([]);
 
   const BASE_URL = "https://kok1mewu89.execute-api.eu-north-1.amazonaws.com/prod";
   const WEBSOCKET_URL = "wss://dbohl3t6fa.execute-api.eu-north-1.amazonaws.com/production/";
@@ -45,6 +86,23 @@ function App() {
     fetchPatients();
   }, [BASE_URL, getAuthToken]);
 
+  // Latenza end-to-end: acquisizione della lettura (ingest_time) -> ricezione qui
+  const recordDeliveryLatency = useCallback((items) => {
+    const now = Date.now();
+    const samples = latencySamples.current;
+    items.forEach(item => {
+      if (item && item.ingest_time) {
+        samples.push(now - item.ingest_time);
+      }
+    });
+    if (samples.length > LATENCY_WINDOW) {
+      samples.splice(0, samples.length - LATENCY_WINDOW);
+    }
+    if (samples.length > 0) {
+      setDeliveryLatency({ p50: percentile(samples, 50), p95: percentile(samples, 95) });
+    }
+  }, []);
+
   useEffect(() => {
     let ws;
     let reconnectTimeout;
@@ -73,12 +131,16 @@ function App() {
         
         try {
           const message = JSON.parse(event.data);
+          if (message.compact) {
+            message.data = expandKeys(message.data);
+          }
           console.log("📦 Action:", message.action);
           
           // CASO 1: Nuovo Allarme Critico
           if (message.action === 'newAlert') {
             const newAlert = message.data;
             console.log("🚨 ALERT RICEVUTO:", newAlert);
+            recordDeliveryLatency([newAlert]);
             
             // 1. Aggiungi alla lista allarmi (campanella)
             setActiveAlerts(prev => {
@@ -94,7 +156,7 @@ function App() {
             // 2. Aggiorna lo status del paziente
             setPatients(prev => {
               return prev.map(patient => {
-                if (patient.patient_id === newAlert.patient_id) {
+                if (patient.patient_id === newAlert.patient_id && newAlert.severity === 'CRITICAL') {
                   console.log(`🔄 Aggiornamento: ${patient.name} (${patient.status} → Critical)`);
                   return { ...patient, status: 'Critical' };
                 }
@@ -108,21 +170,48 @@ function App() {
           else if (message.action === 'vitalUpdate') {
             const vitals = message.data;
             console.log(`📊 VitalUpdate: ${vitals.name} - Status: ${vitals.status}`);
+            recordDeliveryLatency([vitals]);
             
             setPatients(prev => {
               return prev.map(patient => {
                 if (patient.patient_id === vitals.patient_id) {
-                  return {
-                    ...patient,
-                    status: vitals.status,
-                    latest_vitals: {
-                      heart_rate: vitals.heart_rate,
-                      bp: `${vitals.bp_systolic}/${vitals.bp_diastolic}`,
-                      spo2: vitals.spo2,
-                      temperature: vitals.temperature,
-                      timestamp: vitals.timestamp
-                    }
-                  };
+                  return withVitals(patient, vitals);
+                }
+                return patient;
+              });
+              // Nessun sorting - mantieni l'ordine originale
+            });
+          }
+          
+          // CASO 3: Batch di un'intera invocazione (vitali deduplicati + allarmi)
+          else if (message.action === 'batchUpdate') {
+            const { vitals = [], alerts = [], sent_at } = message.data;
+            console.log(`📦 BatchUpdate: ${vitals.length} pazienti, ${alerts.length} allarmi` +
+              (sent_at ? ` (fan-out → client ${Date.now() - sent_at} ms)` : ''));
+            recordDeliveryLatency(vitals);
+            
+            if (alerts.length > 0) {
+              setActiveAlerts(prev => {
+                const knownIds = new Set(prev.map(alert => alert.alert_id));
+                const fresh = alerts.filter(alert => !knownIds.has(alert.alert_id));
+                return fresh.length > 0 ? [...fresh.reverse(), ...prev] : prev;
+              });
+            }
+            
+            // Un solo aggiornamento di stato per tutto il batch
+            const vitalsById = new Map(vitals.map(v => [v.patient_id, v]));
+            const criticalIds = new Set(
+              alerts.filter(alert => alert.severity === 'CRITICAL').map(alert => alert.patient_id)
+            );
+            
+            setPatients(prev => {
+              return prev.map(patient => {
+                const update = vitalsById.get(patient.patient_id);
+                if (update) {
+                  return withVitals(patient, update);
+                }
+                if (criticalIds.has(patient.patient_id)) {
+                  return { ...patient, status: 'Critical' };
                 }
                 return patient;
               });
@@ -159,7 +248,7 @@ function App() {
         ws.close();
       }
     };
-  }, [WEBSOCKET_URL, getAuthToken]);
+  }, [WEBSOCKET_URL, getAuthToken, recordDeliveryLatency]);
 
   // ⚠️ POLLING COMPLETAMENTE DISABILITATO
   // Il WebSocket gestisce TUTTI gli aggiornamenti in tempo reale
@@ -235,6 +324,16 @@ function App() {
                   onClearAll={handleClearAllAlerts}
                 />
                 
+                {/* Latenza lettura → schermo (ultimi campioni) */}
+                {deliveryLatency && (
+                  <span
+                    style={{fontSize: '0.75rem', color: '#737373'}}
+                    title="Latenza dall'acquisizione della lettura alla ricezione (p50 / p95)"
+                  >
+                    ⏱️ {Math.round(deliveryLatency.p50)} / {Math.round(deliveryLatency.p95)} ms
+                  </span>
+                )}
+                
                 <span style={{fontSize: '0.9rem'}}>Dr. {user?.username}</span>
                 <button onClick={signOut} style={{cursor: 'pointer', padding: '5px 10px'}}>
                   Esci
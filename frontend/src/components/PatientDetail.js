@@ -2,15 +2,45 @@ import React, { useEffect, useState } from 'react';
 import axios from 'axios';
 import { LineChart, Line, XAxis, YAxis, CartesianGrid, Tooltip, ResponsiveContainer } from 'recharts';
 
+// Intervalli dello storico: 'live' = ultime letture grezze, gli altri usano i rollup (min/max/media)
+const RANGES = [
+  { value: 'live', label: 'Live' },
+  { value: '24h', label: '24h' },
+  { value: '7d', label: '7d' }
+];
+const ROLLUP_FIELDS = ['heart_rate', 'bp_systolic', 'bp_diastolic', 'spo2', 'temperature'];
+// Letture mostrate nel grafico live (come VITALS_WINDOW in api-handler)
+const HISTORY_WINDOW = 20;
+
+// Bucket dei rollup -> righe del grafico (media nel campo del parametro, min/max a parte)
+function rollupsToHistory(rollups) {
+  return rollups.points.map((point) => {
+    const row = { timestamp: point.bucket.replace('T', ' ') };
+    ROLLUP_FIELDS.forEach((field) => {
+      if (point[field]) {
+        row[field] = point[field].mean;
+        row[`${field}_min`] = point[field].min;
+        row[`${field}_max`] = point[field].max;
+      }
+    });
+    return row;
+  });
+}
+
 function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
   const [history, setHistory] = useState([]);
+  const [latestData, setLatestData] = useState({});
+  const [range, setRange] = useState('live');
   const [loading, setLoading] = useState(false);
 
   useEffect(() => {
     if (!patientId) return;
+    // Cursore del polling incrementale (modalità live): dopo il primo caricamento
+    // il server restituisce solo le letture nuove, o 204 se non c'è nulla
+    let since = null;
 
     const fetchHistory = async () => {
-      setLoading(true);
+      if (!since) setLoading(true);
       
       const token = await getAuthToken();
       if (!token) {
@@ -20,11 +50,28 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
 
       try {
         const response = await axios.get(`${apiUrl}/${patientId}`, {
-          headers: { Authorization: token }
+          headers: { Authorization: token },
+          params: range !== 'live' ? { range } : (since ? { since } : {})
         });
         
+        if (response.status === 204) {
+          setLoading(false);
+          return;
+        }
+        
         const reversedData = response.data.history.reverse(); 
-        setHistory(reversedData);
+        if (reversedData.length > 0) {
+          setLatestData(reversedData[reversedData.length - 1]);
+        }
+        
+        if (response.data.rollups) {
+          setHistory(rollupsToHistory(response.data.rollups));
+        } else if (since && !response.data.truncated) {
+          setHistory((current) => current.concat(reversedData).slice(-HISTORY_WINDOW));
+        } else {
+          setHistory(reversedData);
+        }
+        since = range === 'live' ? response.data.since : null;
       } catch (error) {
         console.error("Errore caricamento dettagli:", error);
       }
@@ -32,10 +79,11 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
     };
 
     fetchHistory();
-    const interval = setInterval(fetchHistory, 5000);
+    // I rollup cambiano al più una volta al minuto: niente polling a 5 secondi
+    const interval = setInterval(fetchHistory, range === 'live' ? 5000 : 60000);
     return () => clearInterval(interval);
 
-  }, [patientId, apiUrl, getAuthToken]);
+  }, [patientId, apiUrl, getAuthToken, range]);
 
   if (!patientId) {
     return (
@@ -96,12 +144,35 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
     return null;
   };
 
-  const latestData = history[history.length - 1] || {};
+  const timeFormatter = (value) => range === '7d'
+    ? value.substring(5, 16)
+    : value.split(' ')[1]?.substring(0, 5) || '';
 
   return (
     <div className="patient-detail">
       <h2>{patientName}</h2>
 
+      {/* Intervallo dello storico */}
+      <div style={{ display: 'flex', gap: '0.5rem', marginBottom: '1.5rem' }}>
+        {RANGES.map(({ value, label }) => (
+          <button
+            key={value}
+            onClick={() => setRange(value)}
+            style={{
+              padding: '0.375rem 0.875rem',
+              borderRadius: '6px',
+              border: '1px solid #e8e8e8',
+              background: range === value ? '#0a0a0a' : '#ffffff',
+              color: range === value ? '#ffffff' : '#737373',
+              fontSize: '0.75rem',
+              cursor: 'pointer'
+            }}
+          >
+            {label}
+          </button>
+        ))}
+      </div>
+
       {/* Stats Cards */}
       <div style={{ 
         display: 'grid', 
@@ -206,7 +277,7 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
             <XAxis 
               dataKey="timestamp" 
               tick={{ fontSize: 11, fill: '#999999' }}
-              tickFormatter={(value) => value.split(' ')[1]?.substring(0, 5) || ''}
+              tickFormatter={timeFormatter}
               stroke="#e8e8e8"
             />
             <YAxis 
@@ -224,6 +295,12 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
               activeDot={{ r: 4, fill: '#0a0a0a' }}
               name="Heart Rate"
             />
+            {range !== 'live' && (
+              <Line type="monotone" dataKey="heart_rate_max" stroke="#bfbfbf" strokeWidth={1} dot={false} name="Max" />
+            )}
+            {range !== 'live' && (
+              <Line type="monotone" dataKey="heart_rate_min" stroke="#bfbfbf" strokeWidth={1} dot={false} name="Min" />
+            )}
           </LineChart>
         </ResponsiveContainer>
       </div>
@@ -237,7 +314,7 @@ function PatientDetail({ patientId, patientName, apiUrl, getAuthToken }) {
             <XAxis 
               dataKey="timestamp" 
               tick={{ fontSize: 11, fill: '#999999' }}
-              tickFormatter={(value) => value.split(' ')[1]?.substring(0, 5) || ''}
+              tickFormatter={timeFormatter}
               stroke="#e8e8e8"
             />
             <YAxis 
@@ -1,12 +1,33 @@
+import time
+_init_started = time.perf_counter()
+
+import os
 import json
-import boto3
 import uuid
 from datetime import datetime
 
+import aws_clients
+import rule_engine
+from baselines import BaselineCache
+from suppression import SEVERITY_RANK, AlertSuppressor
+from trends import TrendDetector, record_time
+from persistence import AlertWriter
+from rollups import RollupWriter
+from serialization import array_frame, compact_keys, dumps_bytes, object_frame
+from stream_records import decode_records, is_bulk_record
+from metrics import InvocationMetrics, ingest_time, now_ms
+from connection_registry import ConnectionRegistry
+from fanout import FanoutEngine, FanoutStats, create_gateway_client
+
 # --- CONFIGURAZIONE ---
-dynamodb = boto3.resource('dynamodb')
-alerts_table = dynamodb.Table('Alerts')
-connection_table = dynamodb.Table('WebSocketConnections')
+# Client e tabelle dal provider condiviso: creati al primo utilizzo,
+# nomi reali dalle variabili d'ambiente (ALERTS_TABLE, ...)
+dynamodb = aws_clients.dynamodb()
+alerts_table = aws_clients.table('Alerts')
+connection_table = aws_clients.table('WebSocketConnections')
+vitals_table = aws_clients.table('VitalSigns')
+suppression_table = aws_clients.table('AlertSuppression')
+PATIENTS_TABLE = aws_clients.table_name('Patients')
 
 # WIP: Email aggregate - Temporaneamente disabilitate
 # Client SNS gestito da Lambda separata (hospital-batch-email-sender)
@@ -14,65 +35,72 @@ connection_table = dynamodb.Table('WebSocketConnections')
 # sns_client = boto3.client('sns')
 # SNS_TOPIC_ARN = "arn:aws:sns:eu-north-1:972742752781:HospitalEmergencyAlerts"
 
-# Configurazione WebSocket
-WEBSOCKET_ENDPOINT = 'dbohl3t6fa.execute-api.eu-north-1.amazonaws.com'
-WEBSOCKET_STAGE = 'production'
-REGION_NAME = 'eu-north-1'
+# Configurazione WebSocket (in terraform WEBSOCKET_ENDPOINT include già lo stage)
+WEBSOCKET_ENDPOINT = os.environ.get('WEBSOCKET_ENDPOINT', 'dbohl3t6fa.execute-api.eu-north-1.amazonaws.com')
+WEBSOCKET_STAGE = os.environ.get('WEBSOCKET_STAGE', 'production')
 
-# Client API Gateway (creato fuori dal handler per caching)
-gateway_client = boto3.client(
-    'apigatewaymanagementapi',
-    endpoint_url=f"https://{WEBSOCKET_ENDPOINT}/{WEBSOCKET_STAGE}",
-    region_name=REGION_NAME
-)
+# Margine lasciato libero prima del timeout della Lambda
+DEADLINE_SAFETY_MS = 2000
 
+# Protocollo batch: un solo messaggio 'batchUpdate' per invocazione
+# invece di un 'vitalUpdate'/'newAlert' per ogni record
+BATCH_PROTOCOL = os.environ.get('BATCH_PROTOCOL', 'true').lower() == 'true'
 
-def check_vitals(record):
-    """
-    Analizza i parametri vitali e ritorna dati completi + violazioni
-    """
-    new_image = record['dynamodb']['NewImage']
-    
-    def get_val(key):
-        if 'N' in new_image.get(key, {}):
-            return float(new_image[key]['N'])
-        return None
+# Valutazione vettoriale delle soglie (richiede NumPy, altrimenti per record).
+# Sotto VECTORIZED_MIN_BATCH record l'overhead di NumPy non conviene.
+VECTORIZED_RULES = os.environ.get('VECTORIZED_RULES', 'true').lower() == 'true' and rule_engine.HAS_NUMPY
+VECTORIZED_MIN_BATCH = int(os.environ.get('VECTORIZED_MIN_BATCH', 100))
 
-    # Estraiamo i dati
-    hr = get_val('heart_rate')
-    sys = get_val('bp_systolic')
-    dia = get_val('bp_diastolic')
-    spo2 = get_val('spo2')
-    temp = get_val('temperature')
-    pid = new_image['patient_id']['S']
-    pname = new_image.get('patient_name', {}).get('S', 'Sconosciuto')
-    
-    # Status iniziale dal database (se presente)
-    current_status = new_image.get('status', {}).get('S', 'Stable')
+# Eventi dello stream valutati: MODIFY = lettura riscritta (es. ricarica storica),
+# REMOVE (scadenza TTL) non porta nuovi valori e viene solo contato
+EVALUATED_EVENTS = tuple(e.strip() for e in os.environ.get('EVALUATED_EVENTS', 'INSERT,MODIFY').split(',') if e.strip())
 
-    violations = []
-    is_critical = False
+# Valori mostrati quando la lettura non riporta nome o stato del paziente
+UNKNOWN_NAME = 'Sconosciuto'
+DEFAULT_STATUS = 'Stable'
 
-    # Soglie Critiche
-    if hr and hr > 110:
-        violations.append(f"Tachicardia: {hr} bpm")
-        is_critical = True
-    elif hr and hr < 45:
-        violations.append(f"Bradicardia: {hr} bpm")
-        is_critical = True
-    
-    if sys and sys > 160:
-        violations.append(f"Ipertensione: {sys} mmHg")
-        is_critical = True
-    
-    if spo2 and spo2 < 90:
-        violations.append(f"Ipossia: {spo2}%")
-        is_critical = True
-    
-    if temp and temp > 38.5:
-        violations.append(f"Febbre alta: {temp}°C")
-        is_critical = True
+# Frame WebSocket con chiavi abbreviate (serialization.COMPACT_KEYS, espanse dal frontend)
+WS_COMPACT_KEYS = os.environ.get('WS_COMPACT_KEYS', 'false').lower() == 'true'
+
+# Rollup 1m/15m/1h per lo storico della vista paziente (tabella VitalRollups)
+ROLLUPS_ENABLED = os.environ.get('ROLLUPS_ENABLED', 'true').lower() == 'true'
+
+
+def websocket_url(endpoint=WEBSOCKET_ENDPOINT, stage=WEBSOCKET_STAGE):
+    """URL HTTPS della Management API (aggiunge lo stage se l'endpoint non lo contiene)"""
+    endpoint = endpoint.replace('wss://', '').replace('https://', '').rstrip('/')
+    return f"https://{endpoint}" if '/' in endpoint else f"https://{endpoint}/{stage}"
+
+
+# Client API Gateway (creato al primo invio e riusato tra invocazioni calde)
+gateway_client = create_gateway_client(endpoint_url=websocket_url())
+
+# Registro connessioni (cache tra invocazioni calde, Lambda Layer condiviso)
+connection_registry = ConnectionRegistry(connection_table)
+
+# Motore di fan-out con pool di thread riusato tra invocazioni calde
+fanout_engine = FanoutEngine(gateway_client, connection_registry)
+
+# Baseline dei pazienti per le regole relative (LRU tra invocazioni calde)
+baseline_cache = BaselineCache(dynamodb, PATIENTS_TABLE, rule_engine.BASELINE_FIELDS)
+
+# Finestre per paziente per trend e anomalie persistenti (tra invocazioni calde)
+trend_detector = TrendDetector(vitals_table)
+
+# Deduplicazione allarmi per (paziente, tipo violazione)
+alert_suppressor = AlertSuppressor(suppression_table)
+
+# Scrittura in blocco degli allarmi, in parallelo al fan-out
+alert_writer = AlertWriter(dynamodb, alerts_table.name)
+
+# Aggiornamento incrementale dei rollup, in parallelo ad analisi e fan-out
+rollup_writer = RollupWriter(dynamodb, aws_clients.table_name('VitalRollups'))
 
+aws_clients.mark_initialized(_init_started)
+
+
+def build_vitals_data(pid, pname, hr, sys, dia, spo2, temp, current_status, is_critical, timestamp=None):
+    """Costruisce il payload vitalUpdate con lo status finale del paziente"""
     # Determina lo status finale
     if is_critical:
         final_status = 'Critical'
@@ -84,7 +112,7 @@ def check_vitals(record):
         final_status = current_status
 
     # Dati completi per il frontend
-    vitals_data = {
+    return {
         "patient_id": pid,
         "name": pname,
         "heart_rate": hr,
@@ -93,135 +121,446 @@ def check_vitals(record):
         "spo2": spo2,
         "temperature": temp,
         "status": final_status,
-        "timestamp": datetime.now().isoformat()
+        "timestamp": timestamp or datetime.now().isoformat()
     }
 
+
+def check_vitals(reading, baselines_by_patient=None):
+    """
+    Analizza i parametri vitali di una lettura (stream_records.VitalReading)
+    e ritorna dati completi + violazioni.
+    Le soglie sono quelle compilate da rules.json (rule_engine)
+    """
+    pid = reading.patient_id
+    pname = reading.patient_name or UNKNOWN_NAME
+
+    # Soglie Critiche
+    violations = rule_engine.check_record(reading.vitals(), (baselines_by_patient or {}).get(pid, {}))
+    is_critical = bool(violations)
+
+    vitals_data = build_vitals_data(
+        pid, pname,
+        reading.heart_rate, reading.bp_systolic, reading.bp_diastolic, reading.spo2, reading.temperature,
+        reading.status or DEFAULT_STATUS,  # Status iniziale dal database (se presente)
+        is_critical
+    )
+
     return pid, pname, violations, vitals_data, is_critical
 
 
-def broadcast_websocket(payload):
+def check_vitals_batch(records, baselines_by_patient=None):
+    """
+    Come check_vitals, ma valuta le soglie su tutto il batch in un solo passaggio.
+    Ritorna (risultati, errori): risultati è una lista di
+    (indice, pid, pname, violazioni, vitals_data, is_critical).
+    """
+    batch, errors = rule_engine.decode_batch(records, EVALUATED_EVENTS)
+    batch.attach_baselines(baselines_by_patient or {})
+    masks = rule_engine.evaluate(batch).tolist()
+    columns = batch.python_columns()
+    hr_col, sys_col, dia_col = columns['heart_rate'], columns['bp_systolic'], columns['bp_diastolic']
+    spo2_col, temp_col = columns['spo2'], columns['temperature']
+    # Un solo timestamp di elaborazione per tutto il batch
+    timestamp = datetime.now().isoformat()
+
+    results = []
+    for row, idx in enumerate(batch.indexes):
+        mask = masks[row]
+        violations = rule_engine.violations_for(columns, row, mask)
+        is_critical = mask != 0
+        pid = batch.patient_ids[row]
+        pname = batch.names[row] or UNKNOWN_NAME
+        vitals_data = build_vitals_data(
+            pid, pname,
+            hr_col[row], sys_col[row], dia_col[row], spo2_col[row], temp_col[row],
+            batch.statuses[row] or DEFAULT_STATUS,
+            is_critical,
+            timestamp
+        )
+        results.append((idx, pid, pname, violations, vitals_data, is_critical))
+    return results, errors
+
+
+def check_vitals_each(records, baselines_by_patient=None):
+    """Percorso per singolo record (senza NumPy), stesso formato di check_vitals_batch"""
+    readings, errors = decode_records(records, EVALUATED_EVENTS)
+    results = []
+    for reading in readings:
+        try:
+            results.append((reading.index,) + check_vitals(reading, baselines_by_patient))
+        except Exception as e:
+            errors.append((reading.index, e))
+    return results, errors
+
+
+def load_baselines(records):
+    """
+    Baseline dei pazienti presenti nel batch, lette dalla cache con al più
+    una batch_get_item per i pazienti mancanti (mai una lettura per record)
+    """
+    if not rule_engine.BASELINE_FIELDS:
+        return {}
+    patient_ids = set()
+    for record in records:
+        try:
+            patient_ids.add(record['dynamodb']['NewImage']['patient_id']['S'])
+        except (KeyError, TypeError):
+            continue
+    return baseline_cache.get_many(patient_ids)
+
+
+def encode_element(element):
+    """Un vitale o un allarme in bytes JSON (codificato una sola volta per invocazione)"""
+    return dumps_bytes(compact_keys(element) if WS_COMPACT_KEYS else element)
+
+
+def encode_frame(action, data_fields):
+    """Frame {"action", "data"} da campi di data già codificati"""
+    fields = [('action', dumps_bytes(action)), ('data', object_frame(data_fields))]
+    if WS_COMPACT_KEYS:
+        fields.append(('compact', b'true'))
+    return object_frame(fields)
+
+
+def encode_groups(payload, subscriptions):
+    """
+    Frame (bytes) per ogni gruppo di connessioni: le connessioni con
+    sottoscrizione ricevono solo i propri pazienti, i gruppi senza nulla da
+    ricevere vengono saltati. Il frame completo viene codificato una sola
+    volta; per i gruppi filtrati ogni elemento viene codificato al più una
+    volta e i frame riusano gli stessi frammenti.
+    """
+    action, data = payload['action'], payload['data']
+    groups = []
+    
+    if action != 'batchUpdate':
+        fields = compact_keys(data) if WS_COMPACT_KEYS else data
+        frame = None
+        for patients, connection_ids in subscriptions.items():
+            if patients is None or data.get('patient_id') in patients:
+                frame = frame or encode_frame(action, [(key, dumps_bytes(value)) for key, value in fields.items()])
+                groups.append((connection_ids, frame))
+        return groups
+    
+    fragments = {}   # id(elemento) -> bytes
+    
+    def fragment(element):
+        encoded = fragments.get(id(element))
+        if encoded is None:
+            encoded = fragments[id(element)] = encode_element(element)
+        return encoded
+    
+    full_frame = None
+    extra = None
+    for patients, connection_ids in subscriptions.items():
+        if patients is not None and not patients:
+            # Sottoscrizione vuota (reparto senza pazienti): niente da inviare
+            continue
+        if patients is None:
+            # Tutto il batch in un'unica codifica
+            full_frame = full_frame or encode_frame(action, [
+                (key, dumps_bytes(compact_keys(value) if WS_COMPACT_KEYS else value))
+                for key, value in data.items()])
+            groups.append((connection_ids, full_frame))
+            continue
+        group_vitals = [fragment(v) for v in data['vitals'] if v['patient_id'] in patients]
+        group_alerts = [fragment(a) for a in data['alerts'] if a['patient_id'] in patients]
+        if not group_vitals and not group_alerts:
+            continue
+        if extra is None:
+            extra = [(key, dumps_bytes(value)) for key, value in data.items() if key not in ('vitals', 'alerts')]
+        groups.append((connection_ids, encode_frame(action, [
+            ('vitals', array_frame(group_vitals)),
+            ('alerts', array_frame(group_alerts))
+        ] + extra)))
+    return groups
+
+
+def broadcast_websocket(payload, deadline=None, stats=None):
     """
     Invia messaggi a tutti i client WebSocket connessi
-    Gestisce automaticamente le connessioni morte
+    Gli invii sono paralleli e le connessioni morte vengono rimosse in blocco
+    Le connessioni con sottoscrizione ricevono solo i propri pazienti
     """
     try:
-        # Recupera connessioni attive
-        response = connection_table.scan(ProjectionExpression='connectionId')
-        active_connections = response.get('Items', [])
+        # Connessioni attive (dalla cache del registro), raggruppate per sottoscrizione
+        subscriptions = connection_registry.group_by_subscription()
         
-        if not active_connections:
+        if not subscriptions:
             print("⚠️ Nessun client WebSocket connesso")
             return False
         
-        data_to_send = json.dumps(payload, default=str).encode('utf-8')
+        groups = encode_groups(payload, subscriptions)
         
-        dead_connections = []
-        successful_sends = 0
+        send_stats = fanout_engine.send_groups(groups, deadline=deadline)
+        if stats is not None:
+            stats.merge(send_stats)
         
-        for item in active_connections:
-            connection_id = item['connectionId']
-            try:
-                gateway_client.post_to_connection(
-                    ConnectionId=connection_id,
-                    Data=data_to_send
-                )
-                successful_sends += 1
-                
-            except gateway_client.exceptions.GoneException:
-                dead_connections.append(connection_id)
-                
-            except Exception as e:
-                print(f"❌ Errore invio a {connection_id}: {str(e)}")
-        
-        # Rimuovi connessioni morte
-        for conn_id in dead_connections:
-            try:
-                connection_table.delete_item(Key={'connectionId': conn_id})
-            except Exception as e:
-                print(f"⚠️ Errore rimozione {conn_id}: {str(e)}")
-        
-        if dead_connections:
-            print(f"🗑️ Rimosse {len(dead_connections)} connessioni morte")
+        if send_stats.skipped:
+            print(f"⏱️ Deadline raggiunta: {send_stats.skipped} invii saltati")
         
-        return successful_sends > 0
+        return send_stats.sent > 0
         
     except Exception as e:
         print(f"❌ Errore broadcast: {str(e)}")
         return False
 
 
+def alert_id_for(record):
+    """
+    alert_id deterministico dal record di stream: se Lambda ritenta il batch
+    l'allarme viene riscritto (e rinviato) con lo stesso id, senza duplicati
+    """
+    event_id = record.get('eventID')
+    if not event_id:
+        return str(uuid.uuid4())
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"alert-detector/{event_id}"))
+
+
+def records_of_patients(records, patient_ids):
+    """Indici dei record INSERT che appartengono ai pazienti indicati (None = tutti)"""
+    indexes = set()
+    for idx, record in enumerate(records):
+        if record.get('eventName') != 'INSERT':
+            continue
+        try:
+            if patient_ids is None or record['dynamodb']['NewImage']['patient_id']['S'] in patient_ids:
+                indexes.add(idx)
+        except (KeyError, TypeError):
+            continue
+    return indexes
+
+
+def batch_item_failures(records, indexes):
+    """Risposta ReportBatchItemFailures per i record da ritentare"""
+    failures = []
+    for idx in sorted(indexes):
+        sequence_number = records[idx].get('dynamodb', {}).get('SequenceNumber')
+        if sequence_number:
+            failures.append({'itemIdentifier': sequence_number})
+    return failures
+
+
+def compute_deadline(context):
+    """Deadline (time.monotonic) per gli invii dell'invocazione corrente"""
+    if context is None or not hasattr(context, 'get_remaining_time_in_millis'):
+        return None
+    remaining_ms = context.get_remaining_time_in_millis() - DEADLINE_SAFETY_MS
+    return time.monotonic() + max(0, remaining_ms) / 1000
+
+
 def lambda_handler(event, context):
     """
     Gestisce i nuovi record DynamoDB Stream e invia notifiche
     """
     print(f"🏥 Ricevuti {len(event['Records'])} record")
+    metrics = InvocationMetrics(event['Records'])
     
     alerts_count = 0
     updates_count = 0
+    deadline = compute_deadline(context)
+    fanout_stats = FanoutStats()
     
-    for idx, record in enumerate(event['Records']):
-        if record['eventName'] == 'INSERT':
-            try:
-                pid, pname, violations, vitals_data, is_critical = check_vitals(record)
-                
-                # --- 1. ALLARME CRITICO (se ci sono violazioni) ---
-                if violations:
-                    alerts_count += 1
-                    timestamp = datetime.now().isoformat()
-                    
-                    print(f"\n🚨 ALLARME #{alerts_count}: {pname} ({pid})")
-                    print(f"   Violazioni: {', '.join(violations)}")
-                    
-                    # Salva in database
-                    alert_id = str(uuid.uuid4())
-                    alerts_table.put_item(Item={
-                        'alert_id': alert_id,
-                        'patient_id': pid,
-                        'patient_name': pname,
-                        'timestamp': timestamp,
-                        'severity': 'CRITICAL',
-                        'message': ' | '.join(violations),
-                        'status': 'NEW'
-                    })
-                    
-                    # WebSocket: Notifica allarme critico
-                    alert_payload = {
-                        "action": "newAlert",
-                        "data": {
-                            "alert_id": alert_id,
-                            "patient_id": pid,
-                            "name": pname,
-                            "violations": violations,
-                            "severity": "CRITICAL",
-                            "timestamp": timestamp
-                        }
-                    }
-                    broadcast_websocket(alert_payload)
-                    print(f"   📤 Allarme critico inviato via WebSocket")
+    # Messaggi raccolti durante l'invocazione e inviati alla fine
+    latest_vitals = {}   # patient_id -> ultimo vitals_data (deduplicato)
+    new_alerts = []
+    alert_items = []     # item Alerts da scrivere in blocco
+    alert_sources = {}   # alert_id -> (indice record, pid, violazioni)
+    failed_records = set()
+    
+    # Valutazione delle soglie su tutto il batch (vettoriale se NumPy è disponibile)
+    with metrics.stage('Baselines'):
+        baselines = load_baselines(event['Records'])
+    with metrics.stage('RuleEval'):
+        if VECTORIZED_RULES and len(event['Records']) >= VECTORIZED_MIN_BATCH:
+            results, errors = check_vitals_batch(event['Records'], baselines)
+        else:
+            results, errors = check_vitals_each(event['Records'], baselines)
+    
+    for idx, error in errors:
+        print(f"❌ Errore record #{idx}: {str(error)}")
+    
+    # Letture rimosse (scadenza TTL): nessun valore da valutare
+    removed = sum(1 for record in event['Records'] if record.get('eventName') == 'REMOVE')
+    if removed:
+        print(f"🗑️ Record REMOVE ignorati: {removed}")
+    
+    # Rollup dello storico in background (idempotenti: i record ritentati non contano due volte)
+    pending_rollups = rollup_writer.submit(event['Records']) if ROLLUPS_ENABLED else None
+    
+    # Letture storiche di bulk_loader: solo rollup, niente trend, allarmi né fan-out
+    bulk = {idx for idx, record in enumerate(event['Records']) if is_bulk_record(record)}
+    if bulk:
+        results = [result for result in results if result[0] not in bulk]
+        print(f"📚 Record storici (bulk) senza allarmi né notifiche: {len(bulk)}")
+    
+    # Warm-up delle finestre di trend dei pazienti nuovi, in parallelo e prima del ciclo
+    with metrics.stage('TrendWarmup'):
+        warmup = trend_detector.prepare((result[1], record_time(event['Records'][result[0]]))
+                                        for result in results)
+    if warmup['failed'] or warmup['skipped']:
+        print(f"⚠️ Warm-up trend: {warmup['failed']} falliti, {warmup['skipped']} oltre il tempo massimo")
+    
+    analysis_started = time.perf_counter()
+    for idx, pid, pname, violations, vitals_data, is_critical in results:
+        try:
+            # Istante di acquisizione, per la latenza misurata dal frontend
+            reading_time = ingest_time(event['Records'][idx])
+            if reading_time is not None:
+                vitals_data['ingest_time'] = reading_time
+            
+            # --- 0. TREND E ANOMALIE PERSISTENTI (finestra per paziente) ---
+            fired = trend_detector.observe(pid, record_time(event['Records'][idx]), vitals_data)
+            if fired:
+                violations = violations + fired
+            
+            # Deduplicazione: al più un allarme per (paziente, violazione) per finestra
+            if violations:
+                violations = alert_suppressor.filter(pid, violations)
+            
+            # --- 1. ALLARME CRITICO (se ci sono violazioni) ---
+            if violations:
+                alerts_count += 1
+                timestamp = datetime.now().isoformat()
+                severity = max((v.severity for v in violations), key=SEVERITY_RANK.get)
                 
-                # --- 2. AGGIORNAMENTO PARAMETRI VITALI (SEMPRE) ---
-                updates_count += 1
-                update_payload = {
-                    "action": "vitalUpdate",
-                    "data": vitals_data
-                }
-                broadcast_websocket(update_payload)
+                print(f"\n🚨 ALLARME #{alerts_count}: {pname} ({pid})")
+                print(f"   Violazioni: {', '.join(violations)}")
                 
-                status_emoji = "🚨" if vitals_data['status'] == 'Critical' else "💚"
-                print(f"{status_emoji} VitalUpdate: {pname} ({pid}) - Status: {vitals_data['status']}")
+                # Salvataggio in database rimandato: scrittura in blocco a fine batch
+                alert_id = alert_id_for(event['Records'][idx])
+                alert_items.append({
+                    'alert_id': alert_id,
+                    'patient_id': pid,
+                    'patient_name': pname,
+                    'timestamp': timestamp,
+                    'severity': severity,
+                    'message': ' | '.join(violations),
+                    'status': 'NEW'
+                })
+                alert_sources[alert_id] = (idx, pid, violations)
                 
-            except Exception as e:
-                print(f"❌ Errore record #{idx}: {str(e)}")
-                import traceback
-                print(traceback.format_exc())
-                continue
+                # WebSocket: Notifica allarme critico
+                alert_data = {
+                    "alert_id": alert_id,
+                    "patient_id": pid,
+                    "name": pname,
+                    "violations": violations,
+                    "severity": severity,
+                    "timestamp": timestamp,
+                    "ingest_time": reading_time
+                }
+                if BATCH_PROTOCOL:
+                    new_alerts.append(alert_data)
+                else:
+                    with metrics.stage('Fanout'):
+                        broadcast_websocket({"action": "newAlert", "data": alert_data}, deadline, fanout_stats)
+                    print(f"   📤 Allarme critico inviato via WebSocket")
+            
+            # --- 2. AGGIORNAMENTO PARAMETRI VITALI (SEMPRE) ---
+            updates_count += 1
+            if BATCH_PROTOCOL:
+                # Vale solo l'ultima lettura di ogni paziente nel batch
+                latest_vitals.pop(pid, None)
+                latest_vitals[pid] = vitals_data
+            else:
+                with metrics.stage('Fanout'):
+                    broadcast_websocket({"action": "vitalUpdate", "data": vitals_data}, deadline, fanout_stats)
+            
+            status_emoji = "🚨" if vitals_data['status'] == 'Critical' else "💚"
+            print(f"{status_emoji} VitalUpdate: {pname} ({pid}) - Status: {vitals_data['status']}")
+            
+        except Exception as e:
+            print(f"❌ Errore record #{idx}: {str(e)}")
+            import traceback
+            print(traceback.format_exc())
+            failed_records.add(idx)
+            continue
+    # Trend, deduplicazione e preparazione messaggi (senza il fan-out per record)
+    metrics.add_duration('Analysis', (time.perf_counter() - analysis_started) * 1000
+                         - metrics.durations.get('Fanout', 0.0))
+    
+    # --- 3. SCRITTURA ALLARMI IN BLOCCO (in parallelo al fan-out) ---
+    pending_write = alert_writer.submit(alert_items) if alert_items else None
+    
+    # --- 4. UN SOLO FRAME PER CLIENT CON TUTTO IL BATCH ---
+    if BATCH_PROTOCOL and (latest_vitals or new_alerts):
+        batch_payload = {
+            "action": "batchUpdate",
+            "data": {
+                "vitals": list(latest_vitals.values()),
+                "alerts": new_alerts,
+                "sent_at": now_ms()
+            }
+        }
+        with metrics.stage('Fanout'):
+            broadcast_websocket(batch_payload, deadline, fanout_stats)
+        print(f"📤 BatchUpdate inviato: {len(latest_vitals)} pazienti, {len(new_alerts)} allarmi")
+    
+    metrics.delivered()
+    
+    if pending_write is not None:
+        try:
+            with metrics.stage('PersistenceWait'):
+                failed_alerts = pending_write.result()
+            metrics.add_duration('Persistence', alert_writer.last_write_ms)
+        except Exception as e:
+            print(f"❌ Errore scrittura allarmi: {str(e)}")
+            failed_alerts = set(alert_sources)
+        for alert_id in failed_alerts:
+            idx, pid, violations = alert_sources[alert_id]
+            # Il record verrà ritentato: la deduplicazione non deve bloccarlo
+            alert_suppressor.release(pid, violations)
+            failed_records.add(idx)
+        if failed_alerts:
+            print(f"⚠️ Allarmi non salvati: {len(failed_alerts)} di {len(alert_items)}")
+    
+    if pending_rollups is not None:
+        try:
+            with metrics.stage('RollupsWait'):
+                failed_patients = pending_rollups.result()
+            metrics.add_duration('Rollups', rollup_writer.last_write_ms)
+        except Exception as e:
+            print(f"❌ Errore aggiornamento rollup: {str(e)}")
+            failed_patients = None
+        if failed_patients is None or failed_patients:
+            print(f"⚠️ Rollup non salvati per {'tutti i' if failed_patients is None else len(failed_patients)} pazienti")
+            failed_records.update(records_of_patients(event['Records'], failed_patients))
     
     print(f"\n🏁 Completato: {alerts_count} allarmi, {updates_count} aggiornamenti vitali")
+    print(f"📈 Fan-out: {fanout_stats.sent} invii, {fanout_stats.sends_per_sec:.0f} invii/s, "
+          f"p99 {fanout_stats.percentile_ms(99):.0f} ms")
+    suppression = alert_suppressor.take_metrics()
+    if suppression['suppressed']:
+        print(f"🔕 Allarmi soppressi: {suppression['suppressed']} {suppression['suppressed_by_rule']}")
+    
+    # Solo i record falliti vengono ritentati da Lambda (ReportBatchItemFailures);
+    # i record malformati (errors) non sono ritentabili e vengono scartati
+    failures = batch_item_failures(event['Records'], failed_records)
+    if failures:
+        print(f"🔁 Record da ritentare: {len(failures)}")
+    
+    metrics.put('Records', len(event['Records']), 'Count')
+    metrics.put('Alerts', alerts_count, 'Count')
+    metrics.put('Removed', removed, 'Count')
+    metrics.put('TrendWarmups', warmup['warmed'], 'Count')
+    metrics.put('TrendWarmupFailures', warmup['failed'], 'Count')
+    metrics.put('TrendWarmupSkipped', warmup['skipped'], 'Count')
+    metrics.put('Failures', len(failures), 'Count')
+    cold_start = aws_clients.cold_start_report()
+    if cold_start:
+        print(f"❄️ Cold start: {cold_start}")
+        metrics.put('InitMs', cold_start['init_ms'] or 0)
+    metrics.emit(getattr(context, 'function_name', None))
     
     return {
         'statusCode': 200,
+        'batchItemFailures': failures,
         'body': json.dumps({
             'alerts': alerts_count,
-            'updates': updates_count
+            'updates': updates_count,
+            'fanout': fanout_stats.as_dict(),
+            'suppression': suppression,
+            'latency': metrics.as_dict()
         })
     }
\ No newline at end of file
@@ -0,0 +1,103 @@
+"""
+Cache delle baseline dei pazienti per le regole relative.
+
+Le baseline (baseline_hr, baseline_spo2, ...) vengono lette dalla tabella
+Patients con batch_get_item, una sola volta per batch di stream e solo per
+i pazienti mancanti o scaduti. La cache è LRU, limitata in dimensione, e
+vive tra le invocazioni "calde" della Lambda; ogni voce viene riletta dopo
+BASELINE_REFRESH_SECONDS.
+"""
+import os
+import time
+from collections import OrderedDict
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+BASELINE_CACHE_SIZE = int(os.environ.get('BASELINE_CACHE_SIZE', 5000))
+BASELINE_REFRESH_SECONDS = float(os.environ.get('BASELINE_REFRESH_SECONDS', 300))
+
+# Limite di DynamoDB per una singola batch_get_item
+BATCH_GET_LIMIT = 100
+
+
+class BaselineCache:
+    """patient_id -> {campo_baseline: float}, con scadenza per voce"""
+
+    def __init__(self, dynamodb, table_name, fields,
+                 max_size=BASELINE_CACHE_SIZE, refresh_seconds=BASELINE_REFRESH_SECONDS):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.fields = tuple(fields)
+        self.max_size = max_size
+        self.refresh_seconds = refresh_seconds
+        self._entries = OrderedDict()   # patient_id -> (caricato_il, baselines)
+        self.hits = 0
+        self.misses = 0
+        self.reads = 0
+
+    def get_many(self, patient_ids):
+        """Ritorna {patient_id: baselines} leggendo solo le voci mancanti o scadute"""
+        if not self.fields:
+            return {}
+
+        now = time.monotonic()
+        result = {}
+        to_load = []
+        for pid in set(patient_ids):
+            entry = self._entries.get(pid)
+            if entry is not None and now - entry[0] < self.refresh_seconds:
+                self._entries.move_to_end(pid)
+                result[pid] = entry[1]
+                self.hits += 1
+            else:
+                to_load.append(pid)
+                self.misses += 1
+
+        if to_load:
+            try:
+                loaded = self._load(to_load)
+            except Exception as e:
+                # In caso di errore si usano le baseline scadute (se presenti)
+                print(f"⚠️ Errore lettura baseline: {str(e)}")
+                for pid in to_load:
+                    if pid in self._entries:
+                        result[pid] = self._entries[pid][1]
+                return result
+
+            for pid in to_load:
+                # Anche i pazienti senza baseline vengono messi in cache (dict vuoto)
+                baselines = loaded.get(pid, {})
+                self._store(pid, baselines, now)
+                result[pid] = baselines
+
+        return result
+
+    def _store(self, pid, baselines, now):
+        self._entries[pid] = (now, baselines)
+        self._entries.move_to_end(pid)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def _load(self, patient_ids):
+        """Legge le baseline con batch_get_item (100 chiavi per richiesta)"""
+        projection = ', '.join(('patient_id',) + self.fields)
+        loaded = {}
+        for i in range(0, len(patient_ids), BATCH_GET_LIMIT):
+            request = {
+                self.table_name: {
+                    'Keys': [{'patient_id': pid} for pid in patient_ids[i:i + BATCH_GET_LIMIT]],
+                    'ProjectionExpression': projection
+                }
+            }
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                self.reads += 1
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    loaded[item['patient_id']] = {
+                        field: float(item[field])
+                        for field in self.fields
+                        if item.get(field) is not None
+                    }
+                request = response.get('UnprocessedKeys') or None
+                if request:
+                    time.sleep(0.05)
+        return loaded
@@ -0,0 +1,183 @@
+"""
+Fan-out concorrente dei messaggi WebSocket verso API Gateway.
+
+Le chiamate post_to_connection vengono eseguite da un pool di thread limitato
+che condivide un unico client HTTP con connessioni persistenti. Ogni batch ha
+una deadline: gli invii non ancora partiti allo scadere vengono saltati, così
+la Lambda non consuma tutto il timeout su client lenti.
+"""
+import os
+import math
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+import aws_clients
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+FANOUT_MAX_WORKERS = int(os.environ.get('FANOUT_MAX_WORKERS', 32))
+FANOUT_DEADLINE_SECONDS = float(os.environ.get('FANOUT_DEADLINE_SECONDS', 10))
+
+# Esiti di un singolo invio
+SENT = 'sent'
+GONE = 'gone'
+FAILED = 'failed'
+SKIPPED = 'skipped'
+
+
+def create_gateway_client(endpoint_url, max_pool_connections=FANOUT_MAX_WORKERS):
+    """
+    Client API Gateway Management (dal provider condiviso, creato al primo
+    invio) con un pool HTTP dimensionato sul numero di worker, keep-alive
+    attivo e retry limitati
+    """
+    return aws_clients.lazy_client(
+        'apigatewaymanagementapi',
+        endpoint_url=endpoint_url,
+        max_pool_connections=max_pool_connections,
+        read_timeout=3,
+        retries={'max_attempts': 2, 'mode': 'standard'}
+    )
+
+
+class FanoutStats:
+    """Statistiche aggregate degli invii (per broadcast o per invocazione)"""
+
+    def __init__(self):
+        self.sent = 0
+        self.gone = 0
+        self.failed = 0
+        self.skipped = 0
+        self.pruned = 0
+        self.elapsed = 0.0
+        self.latencies = []
+
+    def record(self, outcome, latency):
+        if outcome == SENT:
+            self.sent += 1
+        elif outcome == GONE:
+            self.gone += 1
+        elif outcome == FAILED:
+            self.failed += 1
+        else:
+            self.skipped += 1
+        if latency is not None:
+            self.latencies.append(latency)
+
+    def merge(self, other):
+        self.sent += other.sent
+        self.gone += other.gone
+        self.failed += other.failed
+        self.skipped += other.skipped
+        self.pruned += other.pruned
+        self.elapsed += other.elapsed
+        self.latencies.extend(other.latencies)
+
+    @property
+    def sends_per_sec(self):
+        return self.sent / self.elapsed if self.elapsed > 0 else 0.0
+
+    def percentile_ms(self, pct):
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        index = max(0, math.ceil(pct / 100 * len(ordered)) - 1)
+        return ordered[index] * 1000
+
+    def as_dict(self):
+        return {
+            'sent': self.sent,
+            'gone': self.gone,
+            'failed': self.failed,
+            'skipped': self.skipped,
+            'pruned': self.pruned,
+            'elapsed_ms': round(self.elapsed * 1000, 1),
+            'sends_per_sec': round(self.sends_per_sec, 1),
+            'p99_ms': round(self.percentile_ms(99), 1)
+        }
+
+
+class FanoutEngine:
+    """
+    Invia lo stesso payload a molte connessioni in parallelo.
+    Il pool di thread vive a livello di modulo e viene riusato
+    tra le invocazioni "calde" della Lambda.
+    """
+
+    def __init__(self, gateway_client, registry,
+                 max_workers=FANOUT_MAX_WORKERS, deadline_seconds=FANOUT_DEADLINE_SECONDS):
+        self.gateway_client = gateway_client
+        self.registry = registry
+        self.deadline_seconds = deadline_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='fanout')
+
+    def _post(self, connection_id, data, deadline):
+        """Singolo invio: ritorna (connection_id, esito, latenza in secondi)"""
+        if time.monotonic() >= deadline:
+            return connection_id, SKIPPED, None
+
+        start = time.perf_counter()
+        try:
+            self.gateway_client.post_to_connection(ConnectionId=connection_id, Data=data)
+            return connection_id, SENT, time.perf_counter() - start
+        except self.gateway_client.exceptions.GoneException:
+            return connection_id, GONE, time.perf_counter() - start
+        except Exception as e:
+            print(f"❌ Errore invio a {connection_id}: {str(e)}")
+            return connection_id, FAILED, time.perf_counter() - start
+
+    def send(self, connection_ids, data, deadline=None):
+        """
+        Invia `data` (bytes) a tutte le connessioni entro la deadline.
+        `deadline` è un istante time.monotonic(); se assente si usa
+        FANOUT_DEADLINE_SECONDS a partire da ora.
+        """
+        return self.send_groups([(connection_ids, data)], deadline)
+
+    def send_groups(self, groups, deadline=None):
+        """
+        Come send(), ma con payload diversi per gruppi di connessioni:
+        `groups` è una lista di (connection_ids, data). Tutti gli invii
+        condividono lo stesso pool e la stessa deadline.
+        """
+        stats = FanoutStats()
+        if not any(connection_ids for connection_ids, _ in groups):
+            return stats
+
+        start = time.monotonic()
+        if deadline is None:
+            deadline = start + self.deadline_seconds
+
+        futures = [
+            self._executor.submit(self._post, connection_id, data, deadline)
+            for connection_ids, data in groups
+            for connection_id in connection_ids
+        ]
+        done, not_done = wait(futures, timeout=max(0.0, deadline - time.monotonic()))
+
+        dead_connections = []
+        for future in done:
+            connection_id, outcome, latency = future.result()
+            stats.record(outcome, latency)
+            if outcome == GONE:
+                dead_connections.append(connection_id)
+
+        # Gli invii non completati entro la deadline vengono abbandonati
+        for future in not_done:
+            future.cancel()
+            stats.record(SKIPPED, None)
+
+        stats.elapsed = time.monotonic() - start
+        stats.pruned = self.prune(dead_connections)
+        return stats
+
+    def prune(self, dead_connections):
+        """Rimuove in blocco le connessioni morte (GoneException) dal registro"""
+        if not dead_connections:
+            return 0
+        try:
+            removed = self.registry.remove_many(dead_connections)
+        except Exception as e:
+            print(f"⚠️ Errore rimozione connessioni morte: {str(e)}")
+            return 0
+        print(f"🗑️ Rimosse {removed} connessioni morte")
+        return removed
@@ -0,0 +1,103 @@
+"""
+Metriche di latenza per invocazione, in formato CloudWatch Embedded
+Metric Format (EMF): una riga JSON nei log che CloudWatch converte in
+metriche senza chiamate PutMetricData.
+
+Misura:
+- ritardo dello stream (ApproximateCreationDateTime -> elaborazione)
+- ritardo dall'acquisizione (ingest_time scritto dal simulatore)
+- durata delle fasi: valutazione soglie, analisi, persistenza, fan-out
+"""
+import os
+import json
+import time
+from contextlib import contextmanager
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'HospitalMonitoring')
+METRICS_ENABLED = os.environ.get('METRICS_ENABLED', 'true').lower() == 'true'
+
+
+def now_ms():
+    return time.time() * 1000
+
+
+def ingest_time(record):
+    """ingest_time (epoch ms) del NewImage, None se la lettura non lo riporta"""
+    try:
+        return float(record['dynamodb']['NewImage']['ingest_time']['N'])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def stream_time(record):
+    """Istante (epoch ms) in cui DynamoDB ha registrato la modifica (risoluzione 1 s)"""
+    try:
+        return float(record['dynamodb']['ApproximateCreationDateTime']) * 1000
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+class InvocationMetrics:
+    """Durate e ritardi di una singola invocazione"""
+
+    def __init__(self, records=()):
+        self.started = time.perf_counter()
+        self.durations = {}      # fase -> ms (cumulati)
+        self.values = {}         # metrica -> (valore, unità)
+        received = now_ms()
+        self.ingest_times = [t for t in map(ingest_time, records) if t is not None]
+        stream_lags = [received - t for t in map(stream_time, records) if t is not None]
+        ingest_lags = [received - t for t in self.ingest_times]
+        if stream_lags:
+            self.put('StreamLagMaxMs', max(stream_lags))
+        if ingest_lags:
+            self.put('IngestLagMaxMs', max(ingest_lags))
+            self.put('IngestLagAvgMs', sum(ingest_lags) / len(ingest_lags))
+
+    @contextmanager
+    def stage(self, name):
+        """Misura una fase; più blocchi con lo stesso nome si sommano"""
+        began = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_duration(name, (time.perf_counter() - began) * 1000)
+
+    def add_duration(self, name, ms):
+        self.durations[name] = self.durations.get(name, 0.0) + ms
+
+    def put(self, name, value, unit='Milliseconds'):
+        self.values[name] = (value, unit)
+
+    def delivered(self):
+        """Ritardo massimo acquisizione -> invio WebSocket (a fan-out completato)"""
+        if self.ingest_times:
+            self.put('DeliveryLagMaxMs', now_ms() - min(self.ingest_times))
+
+    def as_dict(self):
+        result = {f"{name}Ms": round(ms, 1) for name, ms in self.durations.items()}
+        result.update({name: round(value, 1) for name, (value, _) in self.values.items()})
+        return result
+
+    def emit(self, function_name=None):
+        """Stampa la riga EMF (una per invocazione)"""
+        self.add_duration('Total', (time.perf_counter() - self.started) * 1000)
+        if not METRICS_ENABLED:
+            return
+        metrics = {f"{name}Ms": (ms, 'Milliseconds') for name, ms in self.durations.items()}
+        metrics.update(self.values)
+
+        document = {
+            '_aws': {
+                'Timestamp': int(now_ms()),
+                'CloudWatchMetrics': [{
+                    'Namespace': METRICS_NAMESPACE,
+                    'Dimensions': [['FunctionName']],
+                    'Metrics': [{'Name': name, 'Unit': unit} for name, (_, unit) in metrics.items()]
+                }]
+            },
+            'FunctionName': function_name or os.environ.get('AWS_LAMBDA_FUNCTION_NAME', 'alert-detector')
+        }
+        for name, (value, _) in metrics.items():
+            document[name] = round(value, 3)
+        print(json.dumps(document))
@@ -0,0 +1,69 @@
+"""
+Scrittura in blocco degli allarmi di un'invocazione.
+
+Gli allarmi vengono raccolti durante l'elaborazione del batch e scritti
+alla fine con batch_write_item (25 item per richiesta), ritentando gli
+UnprocessedItems con backoff esponenziale. La scrittura gira in un thread
+separato, in parallelo al fan-out WebSocket, e ritorna gli alert_id che
+non è stato possibile salvare (per i batchItemFailures dello stream).
+"""
+import os
+import time
+import random
+from concurrent.futures import ThreadPoolExecutor
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+ALERT_WRITE_MAX_ATTEMPTS = int(os.environ.get('ALERT_WRITE_MAX_ATTEMPTS', 5))
+ALERT_WRITE_BASE_DELAY = float(os.environ.get('ALERT_WRITE_BASE_DELAY', 0.05))
+
+# Limite di DynamoDB per una singola batch_write_item
+BATCH_WRITE_LIMIT = 25
+
+
+class AlertWriter:
+    """Scrive gli item Alerts in blocco e riporta quelli non salvati"""
+
+    def __init__(self, dynamodb, table_name,
+                 max_attempts=ALERT_WRITE_MAX_ATTEMPTS, base_delay=ALERT_WRITE_BASE_DELAY):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        # Un solo thread: le scritture di un'invocazione sono già in blocco
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='alert-writer')
+        self.requests = 0
+        self.retries = 0
+        self.last_write_ms = 0.0
+
+    def submit(self, items):
+        """Avvia la scrittura in background; ritorna un Future con gli alert_id falliti"""
+        return self._executor.submit(self.write, items)
+
+    def write(self, items):
+        """Scrive tutti gli item; ritorna l'insieme degli alert_id non salvati"""
+        began = time.perf_counter()
+        failed = set()
+        for i in range(0, len(items), BATCH_WRITE_LIMIT):
+            failed.update(self._write_chunk(items[i:i + BATCH_WRITE_LIMIT]))
+        self.last_write_ms = (time.perf_counter() - began) * 1000
+        return failed
+
+    def _write_chunk(self, chunk):
+        requests = [{'PutRequest': {'Item': item}} for item in chunk]
+        for attempt in range(self.max_attempts):
+            try:
+                response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+                self.requests += 1
+            except Exception as e:
+                print(f"⚠️ Errore scrittura allarmi (tentativo {attempt + 1}): {str(e)}")
+                response = {'UnprocessedItems': {self.table_name: requests}}
+
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return set()
+
+            # Backoff esponenziale con jitter prima di ritentare i non processati
+            self.retries += 1
+            time.sleep(self.base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+        return {request['PutRequest']['Item']['alert_id'] for request in requests}
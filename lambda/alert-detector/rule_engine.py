@@ -0,0 +1,212 @@
+"""
+Valutazione vettoriale delle soglie sui parametri vitali.
+
+Le regole sono definite in modo dichiarativo in rules.json (o nel file
+indicato da RULES_FILE) e compilate una sola volta per container in
+closure: una scalare (percorso per singolo record) e una vettoriale.
+Una regola può essere assoluta ("value") o relativa alla baseline del
+paziente ("baseline" + "offset", es. HR > baseline_hr + 30).
+
+Tutti i NewImage di un batch dello stream vengono decodificati in array
+colonnari (uno per parametro, stream_records.decode_columns) e le regole
+sono valutate con NumPy in un solo passaggio. Il risultato è una bitmask
+di violazioni per record; i messaggi generati sono identici a quelli del
+percorso per singolo record.
+
+NumPy non è incluso nel runtime Lambda: se manca (layer non configurato)
+HAS_NUMPY è False e app.py usa il percorso per singolo record.
+"""
+import os
+import json
+import operator
+
+from stream_records import VITAL_FIELDS, decode_columns
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+# File con le definizioni delle regole (letto una volta per container)
+RULES_FILE = os.environ.get(
+    'RULES_FILE',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'rules.json')
+)
+
+OPERATORS = {
+    '>': operator.gt,
+    '>=': operator.ge,
+    '<': operator.lt,
+    '<=': operator.le,
+}
+
+
+class Violation(str):
+    """
+    Messaggio di violazione (si comporta come una stringa) che ricorda la
+    regola che l'ha generato e la sua gravità
+    """
+
+    def __new__(cls, message, rule, severity='CRITICAL'):
+        violation = super().__new__(cls, message)
+        violation.rule = rule
+        violation.severity = severity
+        return violation
+
+
+class ThresholdRule:
+    """
+    Regola compilata su un singolo parametro; `bit` identifica la violazione
+    nella mask. `check` e `evaluate` sono closure create da compile_rule().
+    """
+
+    def __init__(self, bit, name, field, message, check, evaluate, baseline=None):
+        self.bit = bit
+        self.name = name
+        self.field = field
+        self.message = message
+        self.baseline = baseline
+        self.check = check          # (valore, baselines del paziente) -> bool
+        self.evaluate = evaluate    # (array valori, colonne baseline) -> array bool
+
+    def format(self, value, baseline=None):
+        return Violation(self.message.format(value=value, baseline=baseline), self.name)
+
+
+def compile_rule(definition, bit):
+    """Trasforma una definizione dichiarativa in una ThresholdRule"""
+    compare = OPERATORS[definition['op']]
+    field = definition['field']
+    if field not in VITAL_FIELDS:
+        raise ValueError(f"Parametro sconosciuto nella regola {definition.get('name')}: {field}")
+
+    baseline = definition.get('baseline')
+    if baseline is None:
+        threshold = float(definition['value'])
+
+        # Come in origine: valori mancanti (None/NaN) o zero non generano allarmi
+        def check(value, baselines):
+            return bool(value) and compare(value, threshold)
+
+        def evaluate(values, baseline_columns):
+            return compare(values, threshold) & (values != 0)
+    else:
+        offset = float(definition.get('offset', 0))
+
+        def check(value, baselines):
+            base = baselines.get(baseline) if baselines else None
+            return bool(value) and base is not None and compare(value, base + offset)
+
+        def evaluate(values, baseline_columns):
+            # Baseline mancante = NaN: il confronto è sempre falso
+            return compare(values, baseline_columns[baseline] + offset) & (values != 0)
+
+    return ThresholdRule(bit, definition['name'], field, definition['message'],
+                         check, evaluate, baseline)
+
+
+def load_rules(path=RULES_FILE):
+    """Legge e compila le regole abilitate (chiamata una volta per container)"""
+    with open(path, encoding='utf-8') as rules_file:
+        definitions = json.load(rules_file)['rules']
+
+    enabled = [d for d in definitions if d.get('enabled', True)]
+    if len(enabled) > 32:
+        raise ValueError("Massimo 32 regole (bitmask uint32)")
+    return [compile_rule(definition, 1 << bit) for bit, definition in enumerate(enabled)]
+
+
+# Regole compilate al cold start
+THRESHOLD_RULES = load_rules()
+
+# Campi baseline richiesti dalle regole relative (nessuna lettura se vuoto)
+BASELINE_FIELDS = tuple(sorted({rule.baseline for rule in THRESHOLD_RULES if rule.baseline}))
+
+
+class VitalsBatch:
+    """
+    Batch di letture in forma colonnare (array NumPy per parametro).
+    `indexes` riporta la posizione di ogni riga in event['Records'].
+    """
+
+    def __init__(self, columns):
+        self.indexes = columns.indexes
+        self.events = columns.events
+        self.patient_ids = columns.patient_ids
+        self.names = columns.names
+        self.statuses = columns.statuses
+        # Vista senza copia sugli array 'd' di stream_records
+        self.columns = {field: np.frombuffer(columns.numbers[field], dtype=np.float64)
+                        if len(columns) else np.empty(0) for field in VITAL_FIELDS}
+        self.baselines = {}
+
+    def __len__(self):
+        return len(self.indexes)
+
+    def attach_baselines(self, baselines_by_patient, fields=BASELINE_FIELDS):
+        """Aggiunge una colonna per ogni campo baseline (NaN se sconosciuta)"""
+        for field in fields:
+            self.baselines[field] = np.array([
+                baselines_by_patient.get(pid, {}).get(field, np.nan)
+                for pid in self.patient_ids
+            ], dtype=float)
+        return self
+
+    def python_columns(self):
+        """
+        Colonne (parametri e baseline) come liste Python (float o None,
+        come VitalReading), convertite una sola volta per tutto il batch
+        """
+        columns = dict(self.columns)
+        columns.update(self.baselines)
+        return {
+            field: [None if value != value else value for value in values.tolist()]
+            for field, values in columns.items()
+        }
+
+
+def decode_batch(records, events=('INSERT',)):
+    """
+    Decodifica i NewImage dei record con evento in `events` in array colonnari.
+    Ritorna (batch, errori) dove errori è una lista di (indice, eccezione).
+    """
+    columns, errors = decode_columns(records, events)
+    return VitalsBatch(columns), errors
+
+
+def evaluate(batch, rules=THRESHOLD_RULES):
+    """Ritorna un array uint32 con la bitmask delle violazioni per ogni riga"""
+    masks = np.zeros(len(batch), dtype=np.uint32)
+    for rule in rules:
+        hit = rule.evaluate(batch.columns[rule.field], batch.baselines)
+        masks |= np.where(hit, np.uint32(rule.bit), np.uint32(0))
+    return masks
+
+
+def violations_for(columns, row, mask, rules=THRESHOLD_RULES):
+    """
+    Messaggi di violazione di una riga (stesso testo di check_vitals).
+    `columns` è il risultato di VitalsBatch.python_columns().
+    """
+    if not mask:
+        return []
+    return [
+        rule.format(columns[rule.field][row], columns[rule.baseline][row] if rule.baseline else None)
+        for rule in rules
+        if mask & rule.bit
+    ]
+
+
+def check_record(values, baselines=None, rules=THRESHOLD_RULES):
+    """
+    Percorso scalare: `values` mappa parametro -> float | None.
+    Ritorna la lista dei messaggi di violazione.
+    """
+    violations = []
+    for rule in rules:
+        value = values.get(rule.field)
+        if rule.check(value, baselines):
+            violations.append(rule.format(value, baselines.get(rule.baseline) if rule.baseline else None))
+    return violations
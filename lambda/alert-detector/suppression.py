@@ -0,0 +1,134 @@
+"""
+Deduplicazione e rate limiting degli allarmi per (paziente, tipo violazione).
+
+Un paziente che resta tachicardico genererebbe un allarme a ogni lettura:
+qui ogni coppia (patient_id, regola) può generare al più un allarme per
+finestra (ALERT_SUPPRESSION_SECONDS). Un aumento di gravità (es. da
+WARNING a CRITICAL) viene sempre notificato (escalation).
+
+La decisione passa prima dalla cache del container caldo; se la cache non
+sopprime, la finestra viene "prenotata" con una scrittura condizionale su
+AlertSuppression, così due shard concorrenti non generano lo stesso allarme.
+"""
+import os
+import time
+from collections import OrderedDict
+
+from botocore.exceptions import ClientError
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+ALERT_SUPPRESSION_SECONDS = float(os.environ.get('ALERT_SUPPRESSION_SECONDS', 900))
+ALERT_SUPPRESSION_CACHE_SIZE = int(os.environ.get('ALERT_SUPPRESSION_CACHE_SIZE', 10000))
+
+SEVERITY_RANK = {'INFO': 0, 'WARNING': 1, 'CRITICAL': 2}
+
+
+class AlertSuppressor:
+    """Filtra le violazioni già notificate di recente"""
+
+    def __init__(self, table=None, window_seconds=ALERT_SUPPRESSION_SECONDS,
+                 max_keys=ALERT_SUPPRESSION_CACHE_SIZE):
+        self.table = table
+        self.window_seconds = window_seconds
+        self.max_keys = max_keys
+        self._cache = OrderedDict()     # (patient_id, regola) -> (ultimo invio, rank gravità)
+        self.suppressed = {}            # regola -> allarmi soppressi (dall'ultima take_metrics)
+        self.escalations = 0
+        self.conflicts = 0
+
+    def filter(self, pid, violations, now=None):
+        """Ritorna solo le violazioni da notificare ora"""
+        now = time.time() if now is None else now
+        allowed = []
+        for violation in violations:
+            rule = getattr(violation, 'rule', str(violation))
+            severity = getattr(violation, 'severity', 'CRITICAL')
+            if self._allow((pid, rule), SEVERITY_RANK.get(severity, 2), now):
+                allowed.append(violation)
+            else:
+                self.suppressed[rule] = self.suppressed.get(rule, 0) + 1
+        return allowed
+
+    def _allow(self, key, rank, now):
+        entry = self._cache.get(key)
+        if entry is not None:
+            self._cache.move_to_end(key)
+            last_sent, last_rank = entry
+            if now - last_sent < self.window_seconds:
+                if rank <= last_rank:
+                    return False
+                self.escalations += 1
+
+        if not self._claim(key, rank, now):
+            # Un altro container ha già notificato questa violazione
+            self.conflicts += 1
+            self._remember(key, now, rank)
+            return False
+
+        self._remember(key, now, rank)
+        return True
+
+    def _claim(self, key, rank, now):
+        """Scrittura condizionale: riesce solo se la finestra è libera o c'è escalation"""
+        if self.table is None:
+            return True
+        pid, rule = key
+        try:
+            self.table.put_item(
+                Item={
+                    'dedup_key': f"{pid}#{rule}",
+                    'patient_id': pid,
+                    'rule': rule,
+                    'last_sent': int(now),
+                    'severity_rank': rank,
+                    'expires_at': int(now + 2 * self.window_seconds)
+                },
+                ConditionExpression=(
+                    'attribute_not_exists(dedup_key) OR last_sent < :cutoff OR severity_rank < :rank'
+                ),
+                ExpressionAttributeValues={
+                    ':cutoff': int(now - self.window_seconds),
+                    ':rank': rank
+                }
+            )
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            # Tabella non raggiungibile: meglio un allarme in più che uno perso
+            print(f"⚠️ Errore deduplicazione allarmi: {str(e)}")
+            return True
+
+    def release(self, pid, violations):
+        """
+        Annulla la prenotazione di violazioni il cui allarme non è stato
+        salvato, così il nuovo tentativo dello stream può notificarle
+        """
+        for violation in violations:
+            rule = getattr(violation, 'rule', str(violation))
+            self._cache.pop((pid, rule), None)
+            if self.table is None:
+                continue
+            try:
+                self.table.delete_item(Key={'dedup_key': f"{pid}#{rule}"})
+            except Exception as e:
+                print(f"⚠️ Errore rilascio deduplicazione {pid}#{rule}: {str(e)}")
+
+    def _remember(self, key, now, rank):
+        self._cache[key] = (now, rank)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.max_keys:
+            self._cache.popitem(last=False)
+
+    def take_metrics(self):
+        """Ritorna i contatori accumulati e li azzera (una volta per invocazione)"""
+        metrics = {
+            'suppressed': sum(self.suppressed.values()),
+            'suppressed_by_rule': dict(self.suppressed),
+            'escalations': self.escalations,
+            'conflicts': self.conflicts
+        }
+        self.suppressed = {}
+        self.escalations = 0
+        self.conflicts = 0
+        return metrics
@@ -0,0 +1,391 @@
+"""
+Analisi di trend e di anomalie persistenti sui parametri vitali.
+
+Per ogni paziente viene mantenuta una finestra circolare (ring buffer su
+array a dimensione fissa) delle ultime letture di ciascun parametro
+monitorato. Media mobile, pendenza (regressione lineare) ed EWMA sono
+aggiornate in O(1) per lettura tramite somme correnti; la memoria per
+paziente è costante e il numero di pazienti in memoria è limitato (LRU).
+
+Alla prima lettura di un paziente non in memoria la finestra viene
+"riscaldata" con le ultime letture salvate in VitalSigns. prepare() lo fa
+per tutti i pazienti nuovi di un batch prima dell'analisi, con query in
+parallelo su un piccolo pool ed entro un tempo massimo (oltre il quale
+la finestra parte vuota).
+
+Le regole sono definite in rules.json:
+- "sustained": condizione vera ininterrottamente per almeno N minuti
+- "trends": pendenza della finestra oltre una soglia (unità/minuto)
+"""
+import os
+import json
+import time
+import math
+from array import array
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key
+
+from rule_engine import OPERATORS, RULES_FILE, Violation
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+TREND_WINDOW_SIZE = int(os.environ.get('TREND_WINDOW_SIZE', 30))
+TREND_MAX_PATIENTS = int(os.environ.get('TREND_MAX_PATIENTS', 2000))
+TREND_EWMA_ALPHA = float(os.environ.get('TREND_EWMA_ALPHA', 0.3))
+TREND_WARMUP_WORKERS = int(os.environ.get('TREND_WARMUP_WORKERS', 8))
+TREND_WARMUP_BUDGET_SECONDS = float(os.environ.get('TREND_WARMUP_BUDGET_SECONDS', 1.0))
+
+
+class RollingSeries:
+    """
+    Finestra circolare (tempo, valore) con statistiche O(1).
+    Il tempo è in minuti rispetto a un'origine (la lettura più vecchia della
+    finestra, riallineata a ogni ricalcolo completo), per stabilità numerica.
+    """
+
+    __slots__ = ('capacity', 'times', 'values', 'head', 'count', 'origin', 'pushes',
+                 'sum_t', 'sum_v', 'sum_tv', 'sum_tt', 'ewma', 'alpha')
+
+    def __init__(self, capacity=TREND_WINDOW_SIZE, alpha=TREND_EWMA_ALPHA):
+        self.capacity = capacity
+        self.times = array('d', bytes(8 * capacity))
+        self.values = array('d', bytes(8 * capacity))
+        self.head = 0          # prossima posizione da scrivere
+        self.count = 0
+        self.origin = None
+        self.pushes = 0
+        self.sum_t = self.sum_v = self.sum_tv = self.sum_tt = 0.0
+        self.ewma = None
+        self.alpha = alpha
+
+    def push(self, epoch_seconds, value):
+        if self.origin is None:
+            self.origin = epoch_seconds
+        t = (epoch_seconds - self.origin) / 60.0
+
+        if self.count == self.capacity:
+            # Esce la lettura più vecchia (quella che verrà sovrascritta)
+            old_t = self.times[self.head]
+            old_v = self.values[self.head]
+            self.sum_t -= old_t
+            self.sum_v -= old_v
+            self.sum_tv -= old_t * old_v
+            self.sum_tt -= old_t * old_t
+        else:
+            self.count += 1
+
+        self.times[self.head] = t
+        self.values[self.head] = value
+        self.head = (self.head + 1) % self.capacity
+        self.sum_t += t
+        self.sum_v += value
+        self.sum_tv += t * value
+        self.sum_tt += t * t
+        self.ewma = value if self.ewma is None else self.alpha * value + (1 - self.alpha) * self.ewma
+
+        # Ricalcolo completo ogni `capacity` letture: costo ammortizzato O(1),
+        # evita l'accumulo di errori di arrotondamento nelle somme correnti
+        self.pushes += 1
+        if self.pushes % self.capacity == 0:
+            self._recompute()
+
+    def _recompute(self):
+        # Origine spostata sulla lettura più vecchia: t resta limitato anche
+        # in un container caldo che riceve letture per giorni
+        oldest = self.head if self.count == self.capacity else 0
+        shift = self.times[oldest]
+        if shift:
+            self.origin += shift * 60.0
+            for i in range(self.count):
+                self.times[i] -= shift
+        indexes = range(self.count)
+        self.sum_t = math.fsum(self.times[i] for i in indexes)
+        self.sum_v = math.fsum(self.values[i] for i in indexes)
+        self.sum_tv = math.fsum(self.times[i] * self.values[i] for i in indexes)
+        self.sum_tt = math.fsum(self.times[i] * self.times[i] for i in indexes)
+
+    @property
+    def mean(self):
+        return self.sum_v / self.count if self.count else None
+
+    @property
+    def span_minutes(self):
+        """Intervallo di tempo coperto dalla finestra"""
+        if self.count < 2:
+            return 0.0
+        newest = self.times[(self.head - 1) % self.capacity]
+        oldest = self.times[self.head] if self.count == self.capacity else self.times[0]
+        return newest - oldest
+
+    @property
+    def slope(self):
+        """Pendenza della retta di regressione, in unità al minuto"""
+        n = self.count
+        denominator = n * self.sum_tt - self.sum_t * self.sum_t
+        if n < 2 or denominator <= 1e-9:
+            return None
+        return (n * self.sum_tv - self.sum_t * self.sum_v) / denominator
+
+
+class SustainedRule:
+    """Condizione che deve restare vera per almeno `minutes` minuti"""
+
+    def __init__(self, definition):
+        self.name = definition['name']
+        self.field = definition['field']
+        self.compare = OPERATORS[definition['op']]
+        self.threshold = float(definition['value'])
+        self.minutes = float(definition['minutes'])
+        self.signal = definition.get('signal', 'value')   # value | ewma | mean
+        self.severity = definition.get('severity', 'WARNING')
+        self.message = definition['message']
+
+
+class TrendRule:
+    """Pendenza della finestra sotto/sopra una soglia (unità al minuto)"""
+
+    def __init__(self, definition):
+        self.name = definition['name']
+        self.field = definition['field']
+        self.slope_below = definition.get('slope_below')
+        self.slope_above = definition.get('slope_above')
+        self.min_samples = int(definition.get('min_samples', 5))
+        # Letture troppo ravvicinate danno pendenze senza significato clinico
+        self.min_span_minutes = float(definition.get('min_span_minutes', 5))
+        self.severity = definition.get('severity', 'WARNING')
+        self.message = definition['message']
+
+    def triggered(self, slope):
+        if slope is None:
+            return False
+        if self.slope_below is not None and slope < self.slope_below:
+            return True
+        return self.slope_above is not None and slope > self.slope_above
+
+
+def load_trend_rules(path=RULES_FILE):
+    """Legge le regole 'sustained' e 'trends' abilitate"""
+    with open(path, encoding='utf-8') as rules_file:
+        definitions = json.load(rules_file)
+    sustained = [SustainedRule(d) for d in definitions.get('sustained', []) if d.get('enabled', True)]
+    trends = [TrendRule(d) for d in definitions.get('trends', []) if d.get('enabled', True)]
+    return sustained, trends
+
+
+class PatientState:
+    """Finestre e stato delle regole di un paziente (memoria costante)"""
+
+    __slots__ = ('series', 'breach_since', 'active', 'last_time')
+
+    def __init__(self, fields, sustained, trends):
+        self.series = {field: RollingSeries() for field in fields}
+        self.breach_since = {rule.name: None for rule in sustained}
+        self.active = {rule.name: False for rule in sustained + trends}
+        self.last_time = None
+
+
+class TrendDetector:
+    """Stadio di analisi in streaming: una chiamata observe() per lettura"""
+
+    def __init__(self, vitals_table=None, sustained=None, trends=None,
+                 max_patients=TREND_MAX_PATIENTS, warmup_workers=TREND_WARMUP_WORKERS,
+                 warmup_budget_seconds=TREND_WARMUP_BUDGET_SECONDS):
+        if sustained is None and trends is None:
+            sustained, trends = load_trend_rules()
+        self.sustained = sustained or []
+        self.trends = trends or []
+        self.fields = tuple(sorted({rule.field for rule in self.sustained + self.trends}))
+        self.vitals_table = vitals_table
+        self.max_patients = max_patients
+        self._patients = OrderedDict()
+        self.warmup_budget_seconds = warmup_budget_seconds
+        # Pool riusato tra invocazioni calde (creato al primo prepare)
+        self.warmup_workers = warmup_workers
+        self._executor = None
+        self.warmups = 0
+        self.warmup_failures = 0
+        self.warmup_skipped = 0
+
+    @property
+    def enabled(self):
+        return bool(self.fields)
+
+    def prepare(self, readings):
+        """
+        Warm-up in parallelo dei pazienti non ancora in memoria.
+        `readings` sono coppie (patient_id, secondi epoch) del batch: per
+        ogni paziente nuovo conta la lettura più vecchia. Le query che non
+        finiscono entro warmup_budget_seconds vengono lasciate perdere e la
+        finestra parte vuota. Ritorna {'warmed', 'failed', 'skipped'}.
+        """
+        counts = {'warmed': 0, 'failed': 0, 'skipped': 0}
+        if not self.enabled:
+            return counts
+        first_seen = {}
+        for pid, epoch_seconds in readings:
+            if pid not in self._patients:
+                first_seen[pid] = min(epoch_seconds, first_seen.get(pid, epoch_seconds))
+        if not first_seen:
+            return counts
+        if self.vitals_table is None:
+            for pid in first_seen:
+                self._remember(pid, PatientState(self.fields, self.sustained, self.trends))
+            return counts
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.warmup_workers,
+                                                thread_name_prefix='trend-warmup')
+        futures = {self._executor.submit(self._fetch, pid): pid for pid in first_seen}
+        done, not_done = wait(futures, timeout=self.warmup_budget_seconds)
+
+        for future, pid in futures.items():
+            state = PatientState(self.fields, self.sustained, self.trends)
+            if future in not_done:
+                # Oltre il tempo massimo: la query resta nel pool, il risultato è ignorato
+                future.cancel()
+                counts['skipped'] += 1
+            else:
+                try:
+                    self._apply(state, future.result(), first_seen[pid])
+                    counts['warmed'] += 1
+                except Exception as e:
+                    print(f"⚠️ Errore warm-up finestra {pid}: {str(e)}")
+                    counts['failed'] += 1
+            self._remember(pid, state)
+
+        self.warmups += counts['warmed']
+        self.warmup_failures += counts['failed']
+        self.warmup_skipped += counts['skipped']
+        return counts
+
+    def observe(self, pid, epoch_seconds, values):
+        """
+        Aggiunge una lettura e ritorna le Violation delle regole che
+        scattano ora (ogni episodio genera un solo allarme)
+        """
+        if not self.enabled:
+            return []
+        state = self._state(pid, epoch_seconds)
+        return self._update(state, epoch_seconds, values, emit=True)
+
+    def _state(self, pid, epoch_seconds):
+        state = self._patients.get(pid)
+        if state is not None:
+            self._patients.move_to_end(pid)
+            return state
+
+        # Paziente non passato da prepare(): warm-up singolo
+        state = PatientState(self.fields, self.sustained, self.trends)
+        self._warm(pid, state, epoch_seconds)
+        self._remember(pid, state)
+        return state
+
+    def _remember(self, pid, state):
+        self._patients[pid] = state
+        while len(self._patients) > self.max_patients:
+            self._patients.popitem(last=False)
+
+    def _warm(self, pid, state, before_epoch):
+        """Riempie la finestra con le ultime letture salvate (senza generare allarmi)"""
+        if self.vitals_table is None:
+            return
+        try:
+            items = self._fetch(pid)
+        except Exception as e:
+            print(f"⚠️ Errore warm-up finestra {pid}: {str(e)}")
+            self.warmup_failures += 1
+            return
+        self._apply(state, items, before_epoch)
+        self.warmups += 1
+
+    def _fetch(self, pid):
+        """Ultime letture salvate del paziente (dalla più recente); eseguita anche nel pool"""
+        response = self.vitals_table.query(
+            KeyConditionExpression=Key('patient_id').eq(pid),
+            ScanIndexForward=False,
+            Limit=TREND_WINDOW_SIZE,
+            ProjectionExpression='#ts, ' + ', '.join(self.fields),
+            ExpressionAttributeNames={'#ts': 'timestamp'}
+        )
+        return response.get('Items', [])
+
+    def _apply(self, state, items, before_epoch):
+        for item in reversed(items):
+            epoch = parse_timestamp(item.get('timestamp'))
+            # La lettura corrente è già in tabella: non va contata due volte
+            if epoch is None or epoch >= before_epoch:
+                continue
+            values = {field: float(item[field]) for field in self.fields if item.get(field) is not None}
+            self._update(state, epoch, values, emit=False)
+
+    def _update(self, state, epoch_seconds, values, emit):
+        if state.last_time is not None and epoch_seconds < state.last_time:
+            return []   # lettura fuori ordine: ignorata
+        state.last_time = epoch_seconds
+
+        for field in self.fields:
+            value = values.get(field)
+            if value:
+                state.series[field].push(epoch_seconds, value)
+
+        fired = []
+        for rule in self.sustained:
+            series = state.series[rule.field]
+            if rule.signal == 'ewma':
+                signal = series.ewma
+            elif rule.signal == 'mean':
+                signal = series.mean
+            else:
+                signal = values.get(rule.field)
+
+            if not signal or not rule.compare(signal, rule.threshold):
+                state.breach_since[rule.name] = None
+                state.active[rule.name] = False
+                continue
+
+            if state.breach_since[rule.name] is None:
+                state.breach_since[rule.name] = epoch_seconds
+            minutes = (epoch_seconds - state.breach_since[rule.name]) / 60.0
+            # Durante il warm-up si traccia solo l'inizio dell'episodio: se è
+            # già abbastanza lungo, scatta alla prima lettura reale
+            if emit and minutes >= rule.minutes and not state.active[rule.name]:
+                state.active[rule.name] = True
+                fired.append(Violation(rule.message.format(
+                    value=signal, minutes=int(minutes), mean=series.mean, ewma=series.ewma),
+                    rule.name, rule.severity))
+
+        for rule in self.trends:
+            series = state.series[rule.field]
+            enough = series.count >= rule.min_samples and series.span_minutes >= rule.min_span_minutes
+            slope = series.slope if enough else None
+            if not rule.triggered(slope):
+                state.active[rule.name] = False
+                continue
+            if emit and not state.active[rule.name]:
+                state.active[rule.name] = True
+                fired.append(Violation(rule.message.format(
+                    slope=slope, mean=series.mean, ewma=series.ewma),
+                    rule.name, rule.severity))
+
+        return fired
+
+
+def parse_timestamp(value):
+    """Timestamp ISO di VitalSigns -> secondi epoch (None se non valido)"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+def record_time(record):
+    """Istante della lettura di un record di stream (ora corrente se assente)"""
+    try:
+        epoch = parse_timestamp(record['dynamodb']['NewImage']['timestamp']['S'])
+    except (KeyError, TypeError):
+        epoch = None
+    return epoch if epoch is not None else time.time()
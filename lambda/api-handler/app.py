@@ -1,76 +1,332 @@
+import time
+_init_started = time.perf_counter()
+
+import os
 import json
-import boto3
+import base64
+import hashlib
+from collections import OrderedDict
 from boto3.dynamodb.conditions import Key
-from decimal import Decimal
-
-# Helper per convertire i Decimal di DynamoDB in float per il JSON
-class DecimalEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, Decimal):
-            return float(obj)
-        return super(DecimalEncoder, self).default(obj)
-
-dynamodb = boto3.resource('dynamodb')
-patients_table = dynamodb.Table('Patients')
-vitals_table = dynamodb.Table('VitalSigns')
-alerts_table = dynamodb.Table('Alerts')
-
-def get_patients():
-    """Restituisce la lista di tutti i pazienti"""
-    response = patients_table.scan()
-    return response.get('Items', [])
-
-def get_patient_details(patient_id):
-    """Recupera storico parametri e alert per un singolo paziente"""
+
+import aws_clients
+import rollups
+from serialization import dumps, dumps_bytes
+
+# Tabelle dal provider condiviso (client creato alla prima query).
+# Le letture finiscono solo nel JSON delle risposte: numeri int/float
+# decodificati direttamente dal formato DynamoDB, senza Decimal
+patients_table = aws_clients.table('Patients', native_numbers=True)
+vitals_table = aws_clients.table('VitalSigns', native_numbers=True)
+alerts_table = aws_clients.table('Alerts', native_numbers=True)
+rollups_table = aws_clients.table('VitalRollups')
+
+# Indice (patient_id, timestamp) sulla tabella Alerts
+ALERTS_INDEX = os.environ.get('ALERTS_INDEX', 'patient_id-timestamp-index')
+ALERTS_PAGE_SIZE = 20
+ALERTS_MAX_PAGE_SIZE = 100
+
+# Letture vitali della vista dettaglio (finestra del grafico live)
+VITALS_WINDOW = 20
+
+# Lista pazienti: solo i campi della vista elenco (fields=all per il record completo)
+PATIENT_LIST_FIELDS = ('patient_id', 'name', 'full_name', 'status', 'department', 'room')
+PATIENTS_MAX_PAGE_SIZE = 500
+
+# Cache delle risposte /patients tra invocazioni calde
+PATIENTS_CACHE_TTL = float(os.environ.get('PATIENTS_CACHE_TTL', 15))
+PATIENTS_CACHE_SIZE = 64
+patients_cache = OrderedDict()   # (campi, limite, cursore) -> (caricato_il, body, etag, cursore_successivo)
+
+
+class BadRequest(ValueError):
+    """Parametri della richiesta non validi (HTTP 400)"""
+
+
+def encode_cursor(last_key):
+    """LastEvaluatedKey di DynamoDB -> cursore opaco per il client"""
+    if not last_key:
+        return None
+    return base64.urlsafe_b64encode(dumps_bytes(last_key)).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """Cursore del client -> ExclusiveStartKey (None se assente)"""
+    if not cursor:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise BadRequest('Cursore non valido')
+    if not isinstance(key, dict):
+        raise BadRequest('Cursore non valido')
+    return key
+
+
+def parse_limit(value, default, maximum):
+    """Parametro 'limit' della query string, limitato a [1, maximum]"""
+    if value in (None, ''):
+        return default
+    try:
+        return max(1, min(int(value), maximum))
+    except ValueError:
+        raise BadRequest(f"Limite non valido: {value}")
+
+
+def parse_fields(value):
+    """Parametro 'fields': None = record completo, altrimenti tupla di attributi"""
+    if value == 'all':
+        return None
+    if not value:
+        return PATIENT_LIST_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in value.split(',') if f.strip()))
+    if not fields or not all(f.replace('_', '').isalnum() for f in fields):
+        raise BadRequest(f"Campi non validi: {value}")
+    return fields if 'patient_id' in fields else ('patient_id',) + fields
+
+def get_patients(fields=PATIENT_LIST_FIELDS, limit=None, cursor=None):
+    """
+    Restituisce i pazienti (solo i campi richiesti) e il cursore della pagina
+    successiva. Senza limite legge tutte le pagine della scan (niente
+    troncamento a 1 MB).
+    """
+    scan = {}
+    if fields:
+        # Alias per tutti i campi: name, status e room sono parole riservate
+        names = {f"#f{i}": field for i, field in enumerate(fields)}
+        scan['ProjectionExpression'] = ', '.join(names)
+        scan['ExpressionAttributeNames'] = names
+    if limit:
+        scan['Limit'] = limit
+    start_key = decode_cursor(cursor)
+    if start_key:
+        scan['ExclusiveStartKey'] = start_key
+
+    items = []
+    while True:
+        response = patients_table.scan(**scan)
+        items.extend(response.get('Items', []))
+        last_key = response.get('LastEvaluatedKey')
+        if limit or not last_key:
+            return items, encode_cursor(last_key)
+        scan['ExclusiveStartKey'] = last_key
+
+def get_patients_cached(fields, limit, cursor):
+    """Come get_patients, ma ritorna (body JSON, etag, cursore) con cache a scadenza"""
+    key = (fields, limit, cursor)
+    now = time.monotonic()
+    entry = patients_cache.get(key)
+    if entry is not None and now - entry[0] < PATIENTS_CACHE_TTL:
+        patients_cache.move_to_end(key)
+        return entry[1:]
+
+    items, next_cursor = get_patients(fields, limit, cursor)
+    body = dumps(items)
+    etag = '"' + hashlib.sha1(body.encode('utf-8')).hexdigest() + '"'
+    patients_cache[key] = (now, body, etag, next_cursor)
+    patients_cache.move_to_end(key)
+    while len(patients_cache) > PATIENTS_CACHE_SIZE:
+        patients_cache.popitem(last=False)
+    return body, etag, next_cursor
+
+def get_header(event, name):
+    """Header HTTP della richiesta (nome case-insensitive)"""
+    for key, value in (event.get('headers') or {}).items():
+        if key.lower() == name.lower():
+            return value
+    return None
+
+def get_alerts(patient_id, limit=ALERTS_PAGE_SIZE, cursor=None):
+    """
+    Una pagina di allarmi del paziente, dal più recente, tramite l'indice
+    (patient_id, timestamp): il costo dipende dalla pagina, non dal totale
+    """
+    query = {
+        'IndexName': ALERTS_INDEX,
+        'KeyConditionExpression': Key('patient_id').eq(patient_id),
+        'ScanIndexForward': False,
+        'Limit': limit
+    }
+    start_key = decode_cursor(cursor)
+    if start_key:
+        if start_key.get('patient_id') != patient_id:
+            raise BadRequest('Cursore di un altro paziente')
+        query['ExclusiveStartKey'] = start_key
+    response = alerts_table.query(**query)
+    return response.get('Items', []), encode_cursor(response.get('LastEvaluatedKey'))
+
+def parse_history(range_value, resolution):
+    """range (es. 24h, 7d) e resolution (1m, 15m, 1h) -> (secondi, risoluzione) o None"""
+    if not range_value:
+        if resolution:
+            raise BadRequest('resolution richiede range')
+        return None
+    try:
+        range_seconds = rollups.parse_range(range_value)
+        return range_seconds, rollups.choose_resolution(range_seconds, resolution)
+    except ValueError as e:
+        raise BadRequest(str(e))
+
+
+def encode_since(history, alerts, previous=None):
+    """
+    Cursore 'since' per il polling incrementale: timestamp dell'ultima
+    lettura e dell'ultimo allarme già inviati al client
+    """
+    previous = previous or {}
+    return encode_cursor({
+        'v': history[0]['timestamp'] if history else previous.get('v', ''),
+        'a': alerts[0]['timestamp'] if alerts else previous.get('a', '')
+    })
+
+
+def decode_since(cursor):
+    """Cursore 'since' -> {'v': timestamp, 'a': timestamp}"""
+    since = decode_cursor(cursor)
+    if not all(isinstance(since.get(key, ''), str) for key in ('v', 'a')):
+        raise BadRequest('Cursore non valido')
+    return since
+
+
+def newest_after(table, key_condition, after, limit, index_name=None):
+    """
+    Item con timestamp successivo ad 'after', dal più recente (al più limit).
+    La condizione sulla chiave di ordinamento fa leggere solo i nuovi item.
+    """
+    if after:
+        key_condition = key_condition & Key('timestamp').gt(after)
+    query = {'KeyConditionExpression': key_condition, 'ScanIndexForward': False, 'Limit': limit}
+    if index_name:
+        query['IndexName'] = index_name
+    response = table.query(**query)
+    return response.get('Items', []), 'LastEvaluatedKey' in response
+
+
+def get_patient_updates(patient_id, since, alerts_limit=ALERTS_PAGE_SIZE):
+    """
+    Solo le letture e gli allarmi arrivati dopo il cursore 'since'.
+    Ritorna None se non c'è nulla di nuovo (risposta 204 senza body).
+    """
+    history, truncated = newest_after(vitals_table, Key('patient_id').eq(patient_id),
+                                      since.get('v'), VITALS_WINDOW)
+    alerts, more_alerts = newest_after(alerts_table, Key('patient_id').eq(patient_id),
+                                       since.get('a'), alerts_limit, ALERTS_INDEX)
+    if not history and not alerts:
+        return None
+    return {
+        'history': history,
+        'alerts': alerts,
+        # True se ci sono più novità di quelle restituite: il client ricarica la vista completa
+        'truncated': truncated or more_alerts,
+        'since': encode_since(history, alerts, since)
+    }
+
+
+def get_patient_details(patient_id, alerts_limit=ALERTS_PAGE_SIZE, alerts_cursor=None, history=None):
+    """
+    Recupera storico parametri e alert per un singolo paziente.
+    Con history=(secondi, risoluzione) aggiunge i rollup min/max/media
+    dell'intervallo (pochi item invece di migliaia di letture grezze).
+    """
     
     # 1. Recupera ultimi 20 rilevamenti vitali (Query inversa per data)
     vitals_resp = vitals_table.query(
         KeyConditionExpression=Key('patient_id').eq(patient_id),
         ScanIndexForward=False, # Dal più recente al più vecchio
-        Limit=20
+        Limit=VITALS_WINDOW
     )
     
-    # 2. Recupera eventuali allarmi
-    alerts_resp = alerts_table.query(
-        KeyConditionExpression=Key('patient_id').eq(patient_id)
-    )
+    # 2. Recupera gli allarmi più recenti (paginati con cursore)
+    alerts, next_cursor = get_alerts(patient_id, alerts_limit, alerts_cursor)
     
-    return {
-        'history': vitals_resp.get('Items', []),
-        'alerts': alerts_resp.get('Items', [])
+    history_items = vitals_resp.get('Items', [])
+    details = {
+        'history': history_items,
+        'alerts': alerts,
+        'alerts_cursor': next_cursor,
+        # Cursore per le richieste successive con ?since= (solo novità)
+        'since': encode_since(history_items, [] if alerts_cursor else alerts)
     }
+    
+    # 3. Storico aggregato per il grafico a lungo termine
+    if history:
+        range_seconds, resolution = history
+        details['rollups'] = rollups.query_rollups(rollups_table, patient_id, range_seconds, resolution)
+        details['rollups']['range'] = range_seconds
+    
+    return details
+
+aws_clients.mark_initialized(_init_started)
 
 def lambda_handler(event, context):
     print("Richiesta API ricevuta:", event)
+    cold_start = aws_clients.cold_start_report()
+    if cold_start:
+        print(f"❄️ Cold start: {cold_start}")
     
     http_method = event.get('httpMethod')
     path = event.get('path')
+    params = event.get('queryStringParameters') or {}
     
     headers = {
         'Access-Control-Allow-Origin': '*', # Importante per React (CORS)
         'Access-Control-Allow-Headers': 'Content-Type',
-        'Access-Control-Allow-Methods': 'OPTIONS,GET'
+        'Access-Control-Allow-Methods': 'OPTIONS,GET',
+        'Access-Control-Expose-Headers': 'ETag,X-Next-Cursor'
     }
 
     try:
         if http_method == 'GET':
             if path == '/patients':
-                # Restituisce lista pazienti
-                data = get_patients()
+                # Restituisce lista pazienti (paginata con X-Next-Cursor)
+                body, etag, next_cursor = get_patients_cached(
+                    parse_fields(params.get('fields')),
+                    parse_limit(params.get('limit'), None, PATIENTS_MAX_PAGE_SIZE),
+                    params.get('cursor')
+                )
+                headers = dict(headers)
+                headers['ETag'] = etag
+                headers['Cache-Control'] = 'no-cache'
+                if next_cursor:
+                    headers['X-Next-Cursor'] = next_cursor
+                
+                # Lista invariata: il client riusa la propria copia
+                if get_header(event, 'If-None-Match') == etag:
+                    return {'statusCode': 304, 'headers': headers, 'body': ''}
+                
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps(data, cls=DecimalEncoder)
+                    'body': body
                 }
             
             elif path.startswith('/patients/'):
                 # Estrae ID dall'URL (es. /patients/PT00001)
                 patient_id = path.split('/')[-1]
-                data = get_patient_details(patient_id)
+                alerts_limit = parse_limit(params.get('alerts_limit'), ALERTS_PAGE_SIZE, ALERTS_MAX_PAGE_SIZE)
+                
+                # Polling incrementale: solo le novità dopo il cursore 'since'
+                if params.get('since'):
+                    if params.get('range') or params.get('alerts_cursor'):
+                        raise BadRequest('since non è combinabile con range o alerts_cursor')
+                    data = get_patient_updates(patient_id, decode_since(params['since']), alerts_limit)
+                    if data is None:
+                        return {'statusCode': 204, 'headers': headers, 'body': ''}
+                    return {
+                        'statusCode': 200,
+                        'headers': headers,
+                        'body': dumps(data)
+                    }
+                
+                data = get_patient_details(
+                    patient_id,
+                    alerts_limit=alerts_limit,
+                    alerts_cursor=params.get('alerts_cursor'),
+                    history=parse_history(params.get('range'), params.get('resolution'))
+                )
                 return {
                     'statusCode': 200,
                     'headers': headers,
-                    'body': json.dumps(data, cls=DecimalEncoder)
+                    'body': dumps(data)
                 }
 
         return {
@@ -79,6 +335,13 @@ def lambda_handler(event, context):
             'body': json.dumps({'error': 'Percorso non trovato'})
         }
 
+    except BadRequest as e:
+        return {
+            'statusCode': 400,
+            'headers': headers,
+            'body': json.dumps({'error': str(e)})
+        }
+
     except Exception as e:
         print(f"Errore: {str(e)}")
         return {
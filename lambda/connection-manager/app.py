@@ -1,10 +1,64 @@
+import time
+_init_started = time.perf_counter()
+
 import json
-import boto3
+from boto3.dynamodb.conditions import Attr
+
+import aws_clients
+from connection_registry import ConnectionRegistry
+
+# Tabelle dal provider condiviso (client creato al primo utilizzo)
+connection_table = aws_clients.table('WebSocketConnections')
+patients_table = aws_clients.table('Patients')
+
+# Registro condiviso con alert-detector (Lambda Layer)
+registry = ConnectionRegistry(connection_table)
+
+
+def parse_list(value):
+    """Accetta 'PT1,PT2' oppure ['PT1', 'PT2'] e ritorna una lista pulita"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = value.split(',')
+    return [v.strip() for v in value if v and v.strip()]
+
+
+def resolve_subscription(patients, departments):
+    """
+    Converte i reparti richiesti nei rispettivi patient_id, così
+    l'alert-detector deve filtrare solo per paziente. Se i reparti non
+    hanno pazienti l'insieme è vuoto e la connessione non riceve nulla
+    """
+    patient_ids = set(patients)
+    for department in departments:
+        scan_kwargs = {
+            'ProjectionExpression': 'patient_id',
+            'FilterExpression': Attr('department').eq(department)
+        }
+        while True:
+            response = patients_table.scan(**scan_kwargs)
+            patient_ids.update(item['patient_id'] for item in response.get('Items', []))
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+    return patient_ids
+
+
+def describe_subscription(patients, departments):
+    if patients:
+        return f"{len(patients)} pazienti"
+    return "nessun paziente nei reparti richiesti" if departments else "tutti i pazienti"
+
+
+aws_clients.mark_initialized(_init_started)
 
-dynamodb = boto3.resource('dynamodb')
-connection_table = dynamodb.Table('WebSocketConnections')
 
 def lambda_handler(event, context):
+    cold_start = aws_clients.cold_start_report()
+    if cold_start:
+        print(f"❄️ Cold start: {cold_start}")
+
     # Recuperiamo l'ID connessione
     connection_id = event.get('requestContext', {}).get('connectionId')
     route_key = event.get('requestContext', {}).get('routeKey')
@@ -24,13 +78,30 @@ def lambda_handler(event, context):
         # (Opzionale: Qui potresti validare se il token è scaduto usando librerie JWT)
         # Per ora ci fidiamo che se il token c'è, l'utente viene dal frontend autenticato.
         
+        # Sottoscrizione opzionale: ?patients=PT1,PT2 e/o ?department=Cardiologia
+        departments = parse_list(query_params.get('department'))
+        patients = resolve_subscription(parse_list(query_params.get('patients')), departments)
+
         # Se il token c'è, salviamo la connessione
-        connection_table.put_item(Item={'connectionId': connection_id})
-        print(f"Connesso e Autenticato: {connection_id}")
+        registry.register(connection_id, patients=patients, departments=departments)
+        print(f"Connesso e Autenticato: {connection_id} ({describe_subscription(patients, departments)})")
         return {'statusCode': 200, 'body': 'Connected'}
 
     elif route_key == '$disconnect':
-        connection_table.delete_item(Key={'connectionId': connection_id})
+        registry.unregister(connection_id)
         return {'statusCode': 200, 'body': 'Disconnected'}
+
+    elif route_key == 'subscribe':
+        # Messaggio dal client: {"action": "subscribe", "patients": [...], "department": "..."}
+        try:
+            body = json.loads(event.get('body') or '{}')
+        except ValueError:
+            return {'statusCode': 400, 'body': 'Messaggio non valido'}
+
+        departments = parse_list(body.get('department') or body.get('departments'))
+        patients = resolve_subscription(parse_list(body.get('patients')), departments)
+        registry.subscribe(connection_id, patients=patients, departments=departments)
+        print(f"Sottoscrizione aggiornata: {connection_id} ({describe_subscription(patients, departments)})")
+        return {'statusCode': 200, 'body': 'Subscribed'}
         
     return {'statusCode': 200, 'body': 'OK'}
\ No newline at end of file
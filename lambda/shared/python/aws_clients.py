@@ -0,0 +1,248 @@
+"""
+Client AWS condivisi tra le Lambda (distribuito come Lambda Layer).
+
+- Creazione pigra: nessun client viene creato all'import, solo al primo
+  utilizzo effettivo; una sola sessione boto3 per container.
+- Client di basso livello: invece di boto3.resource (che carica anche il
+  modello delle risorse) le tabelle usano un unico client DynamoDB
+  "documento", a cui sono agganciate le stesse trasformazioni della
+  risorsa (tipi Python <-> AttributeValue, condizioni Key/Attr).
+  Table espone il sottoinsieme dell'API di boto3 Table usato dal progetto.
+  Per le letture destinate solo al JSON esiste una variante del client
+  che restituisce int/float invece di Decimal (native_numbers=True).
+- Configurazione da variabili d'ambiente: regione, nomi delle tabelle
+  (PATIENTS_TABLE, ...), pool di connessioni, keep-alive, timeout, retry.
+- Misura del cold start: tempo di import del handler e di creazione
+  di sessione e client, riportati una volta per container.
+"""
+import os
+import time
+import threading
+
+import boto3
+from botocore.config import Config
+from boto3.dynamodb.table import BatchWriter
+from boto3.dynamodb.transform import TransformationInjector, copy_dynamodb_params
+
+from serialization import NativeDeserializer
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+REGION_NAME = os.environ.get('AWS_REGION') or os.environ.get('AWS_DEFAULT_REGION') or 'eu-north-1'
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get('AWS_MAX_POOL_CONNECTIONS', 50))
+AWS_CONNECT_TIMEOUT = float(os.environ.get('AWS_CONNECT_TIMEOUT', 2))
+AWS_READ_TIMEOUT = float(os.environ.get('AWS_READ_TIMEOUT', 5))
+AWS_MAX_ATTEMPTS = int(os.environ.get('AWS_MAX_ATTEMPTS', 3))
+
+# Nome logico della tabella -> variabile d'ambiente con il nome reale
+# (in terraform le tabelle hanno il suffisso d'ambiente, es. Patients-dev)
+TABLE_ENV_VARS = {
+    'Patients': 'PATIENTS_TABLE',
+    'VitalSigns': 'VITAL_SIGNS_TABLE',
+    'Alerts': 'ALERTS_TABLE',
+    'WebSocketConnections': 'CONNECTIONS_TABLE',
+    'AlertSuppression': 'SUPPRESSION_TABLE',
+    'VitalRollups': 'ROLLUPS_TABLE',
+}
+
+
+def table_name(logical_name):
+    """Nome reale della tabella (variabile d'ambiente, altrimenti il nome logico)"""
+    env_var = TABLE_ENV_VARS.get(logical_name)
+    return (os.environ.get(env_var) if env_var else None) or logical_name
+
+
+def client_config(**overrides):
+    """Config botocore comune: pool HTTP, keep-alive, timeout e retry"""
+    settings = {
+        'region_name': REGION_NAME,
+        'max_pool_connections': AWS_MAX_POOL_CONNECTIONS,
+        'tcp_keepalive': True,
+        'connect_timeout': AWS_CONNECT_TIMEOUT,
+        'read_timeout': AWS_READ_TIMEOUT,
+        'retries': {'max_attempts': AWS_MAX_ATTEMPTS, 'mode': 'standard'},
+    }
+    settings.update(overrides)
+    return Config(**settings)
+
+
+class ClientProvider:
+    """Sessione e client creati al primo utilizzo e riusati tra invocazioni calde"""
+
+    def __init__(self):
+        self._session = None
+        self._clients = {}
+        self._tables = {}
+        self._overrides = {}        # servizio -> client sostitutivo
+        self._lock = threading.RLock()
+        self.timings = {}           # nome -> ms impiegati per la creazione
+
+    def _timed(self, name, factory):
+        began = time.perf_counter()
+        value = factory()
+        self.timings[name] = round((time.perf_counter() - began) * 1000, 1)
+        return value
+
+    def session(self):
+        with self._lock:
+            if self._session is None:
+                self._session = self._timed('session', lambda: boto3.session.Session(region_name=REGION_NAME))
+            return self._session
+
+    def client(self, service, endpoint_url=None, **config_overrides):
+        """Client di basso livello (uno per servizio/endpoint/config)"""
+        if service in self._overrides:
+            return self._overrides[service]
+        key = (service, endpoint_url, tuple(sorted(config_overrides.items())))
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                session = self.session()
+                client = self._timed(f"client:{service}", lambda: session.client(
+                    service, endpoint_url=endpoint_url, config=client_config(**config_overrides)))
+                self._clients[key] = client
+            return client
+
+    def dynamodb(self, native_numbers=False):
+        """
+        Client DynamoDB "documento": accetta e restituisce tipi Python come la risorsa.
+        Con native_numbers=True i numeri letti sono int/float invece di Decimal
+        (più veloce da decodificare e serializzare, ma non riscrivibile così com'è).
+        """
+        if 'dynamodb' in self._overrides:
+            return self._overrides['dynamodb']
+        key = ('dynamodb-native' if native_numbers else 'dynamodb-document', None, ())
+        with self._lock:
+            client = self._clients.get(key)
+            if client is None:
+                session = self.session()
+                name = 'client:dynamodb-native' if native_numbers else 'client:dynamodb'
+                client = self._timed(name, lambda: session.client(
+                    'dynamodb', config=client_config()))
+                enable_document_types(client, NativeDeserializer() if native_numbers else None)
+                self._clients[key] = client
+            return client
+
+    def table(self, logical_name, native_numbers=False):
+        """Tabella per nome logico (il client viene creato al primo utilizzo)"""
+        key = (logical_name, native_numbers)
+        with self._lock:
+            table = self._tables.get(key)
+            if table is None:
+                table = self._tables[key] = Table(table_name(logical_name),
+                                                  lambda: self.dynamodb(native_numbers))
+            return table
+
+    def override(self, service, client):
+        """
+        Sostituisce il client di un servizio (benchmark ed esecuzione locale
+        con stand-in); per 'dynamodb' il sostituto deve accettare tipi Python
+        """
+        with self._lock:
+            if client is None:
+                self._overrides.pop(service, None)
+            else:
+                self._overrides[service] = client
+
+
+def enable_document_types(client, deserializer=None):
+    """Aggancia al client le trasformazioni usate da boto3.resource('dynamodb')"""
+    events = client.meta.events
+    injector = TransformationInjector(deserializer=deserializer)
+    events.register('provide-client-params.dynamodb', copy_dynamodb_params,
+                    unique_id='dynamodb-create-params-copy')
+    events.register('before-parameter-build.dynamodb', injector.inject_condition_expressions,
+                    unique_id='dynamodb-condition-expression')
+    events.register('before-parameter-build.dynamodb', injector.inject_attribute_value_input,
+                    unique_id='dynamodb-attr-value-input')
+    events.register('after-call.dynamodb', injector.inject_attribute_value_output,
+                    unique_id='dynamodb-attr-value-output')
+    return client
+
+
+class Table:
+    """Sottoinsieme di boto3 Table sopra il client documento condiviso"""
+
+    def __init__(self, name, client_factory):
+        self.name = name
+        self._client_factory = client_factory
+
+    @property
+    def client(self):
+        return self._client_factory()
+
+    def put_item(self, **kwargs):
+        return self.client.put_item(TableName=self.name, **kwargs)
+
+    def get_item(self, **kwargs):
+        return self.client.get_item(TableName=self.name, **kwargs)
+
+    def update_item(self, **kwargs):
+        return self.client.update_item(TableName=self.name, **kwargs)
+
+    def delete_item(self, **kwargs):
+        return self.client.delete_item(TableName=self.name, **kwargs)
+
+    def query(self, **kwargs):
+        return self.client.query(TableName=self.name, **kwargs)
+
+    def scan(self, **kwargs):
+        return self.client.scan(TableName=self.name, **kwargs)
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return BatchWriter(self.name, self.client, overwrite_by_pkeys=overwrite_by_pkeys)
+
+
+class LazyClient:
+    """Rimanda la creazione di un client al primo attributo richiesto"""
+
+    def __init__(self, factory):
+        self._factory = factory
+
+    def __getattr__(self, name):
+        return getattr(self._factory(), name)
+
+
+# Provider di default del container
+provider = ClientProvider()
+
+# Istante di inizio dell'init (aggiornato dai handler con mark_initialized)
+_init_started = time.perf_counter()
+_init_ms = None
+_cold_start_reported = False
+
+
+def client(service, endpoint_url=None, **config_overrides):
+    return provider.client(service, endpoint_url, **config_overrides)
+
+
+def lazy_client(service, endpoint_url=None, **config_overrides):
+    return LazyClient(lambda: provider.client(service, endpoint_url, **config_overrides))
+
+
+def dynamodb():
+    """Client documento per le operazioni multi-tabella (batch_get_item, batch_write_item)"""
+    return LazyClient(provider.dynamodb)
+
+
+def table(logical_name, native_numbers=False):
+    return provider.table(logical_name, native_numbers)
+
+
+def mark_initialized(started=None):
+    """Da chiamare a fine import del handler: registra la durata dell'init"""
+    global _init_ms
+    _init_ms = round((time.perf_counter() - (started or _init_started)) * 1000, 1)
+
+
+def cold_start_report():
+    """
+    Durate di init e creazione client, solo alla prima invocazione del
+    container (None nelle invocazioni calde)
+    """
+    global _cold_start_reported
+    if _cold_start_reported:
+        return None
+    _cold_start_reported = True
+    report = {'init_ms': _init_ms}
+    report.update({f"{name}_ms": ms for name, ms in provider.timings.items()})
+    return report
@@ -0,0 +1,200 @@
+"""
+Registro delle connessioni WebSocket condiviso tra connection-manager e
+alert-detector (distribuito come Lambda Layer).
+
+- Cache in memoria degli ID di connessione, valida tra invocazioni "calde"
+  e limitata da un TTL.
+- Scan paginato (nessuna connessione persa oltre il limite di 1 MB).
+- Invalidazione incrementale: connect/disconnect/subscribe incrementano un
+  contatore di versione salvato in un item sentinella; gli altri container
+  rileggono la tabella solo quando la versione cambia. Le connessioni morte
+  vengono tolte dalla cache senza rileggere la tabella.
+- Sottoscrizioni: una connessione può limitarsi a un insieme di pazienti
+  (anche risolto a partire da un reparto); senza sottoscrizione riceve tutto.
+  Un reparto senza pazienti dà una sottoscrizione vuota (non riceve nulla):
+  in tabella resta solo l'attributo departments, perché DynamoDB non
+  ammette insiemi vuoti.
+"""
+import os
+import time
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+CONNECTION_CACHE_TTL = float(os.environ.get('CONNECTION_CACHE_TTL', 60))
+CONNECTION_VERSION_CHECK_SECONDS = float(os.environ.get('CONNECTION_VERSION_CHECK_SECONDS', 2))
+
+# Item sentinella con il contatore di versione del registro
+VERSION_KEY = '#registry-version'
+
+
+def subscription_of(patients, departments):
+    """
+    Sottoscrizione in cache: frozenset dei pazienti, frozenset() se sono
+    stati chiesti reparti senza pazienti, None se non c'è alcun filtro
+    """
+    if patients:
+        return frozenset(patients)
+    return frozenset() if departments else None
+
+
+class ConnectionRegistry:
+    """
+    Accesso alla tabella WebSocketConnections con cache in memoria.
+    La cache mappa connectionId -> frozenset di patient_id sottoscritti
+    (None = nessun filtro, riceve tutti i pazienti; frozenset() = nessuno).
+    """
+
+    def __init__(self, table, ttl_seconds=CONNECTION_CACHE_TTL,
+                 version_check_seconds=CONNECTION_VERSION_CHECK_SECONDS):
+        self.table = table
+        self.ttl_seconds = ttl_seconds
+        self.version_check_seconds = version_check_seconds
+        self._cache = None
+        self._version = None
+        self._loaded_at = 0.0
+        self._version_checked_at = 0.0
+        self.scans = 0
+
+    # --- Scritture (connection-manager) ---
+
+    def register(self, connection_id, patients=None, departments=None):
+        """Salva una nuova connessione con l'eventuale sottoscrizione"""
+        item = {'connectionId': connection_id}
+        if patients:
+            item['patients'] = set(patients)
+        if departments:
+            item['departments'] = set(departments)
+        self.table.put_item(Item=item)
+        self._bump_version()
+        if self._cache is not None:
+            self._cache[connection_id] = subscription_of(patients, departments)
+
+    def subscribe(self, connection_id, patients=None, departments=None):
+        """Aggiorna la sottoscrizione di una connessione esistente"""
+        if patients and departments:
+            self.table.update_item(
+                Key={'connectionId': connection_id},
+                UpdateExpression='SET patients = :p, departments = :d',
+                ExpressionAttributeValues={':p': set(patients), ':d': set(departments)}
+            )
+        elif patients:
+            self.table.update_item(
+                Key={'connectionId': connection_id},
+                UpdateExpression='SET patients = :p REMOVE departments',
+                ExpressionAttributeValues={':p': set(patients)}
+            )
+        elif departments:
+            # Reparti senza pazienti: sottoscrizione vuota, non "tutto"
+            self.table.update_item(
+                Key={'connectionId': connection_id},
+                UpdateExpression='SET departments = :d REMOVE patients',
+                ExpressionAttributeValues={':d': set(departments)}
+            )
+        else:
+            # Nessun paziente: torna a ricevere tutto
+            self.table.update_item(
+                Key={'connectionId': connection_id},
+                UpdateExpression='REMOVE patients, departments'
+            )
+        self._bump_version()
+        if self._cache is not None:
+            self._cache[connection_id] = subscription_of(patients, departments)
+
+    def unregister(self, connection_id):
+        """Rimuove una connessione chiusa dal client"""
+        self.table.delete_item(Key={'connectionId': connection_id})
+        self._bump_version()
+        if self._cache is not None:
+            self._cache.pop(connection_id, None)
+
+    def remove_many(self, connection_ids):
+        """
+        Rimuove in blocco connessioni morte (GoneException) con batch_writer.
+        Non incrementa la versione: gli altri container scopriranno la
+        connessione morta al primo invio.
+        """
+        connection_ids = set(connection_ids)
+        if not connection_ids:
+            return 0
+        with self.table.batch_writer() as batch:
+            for connection_id in connection_ids:
+                batch.delete_item(Key={'connectionId': connection_id})
+        if self._cache is not None:
+            for connection_id in connection_ids:
+                self._cache.pop(connection_id, None)
+        return len(connection_ids)
+
+    def _bump_version(self):
+        try:
+            self.table.update_item(
+                Key={'connectionId': VERSION_KEY},
+                UpdateExpression='ADD registry_version :one',
+                ExpressionAttributeValues={':one': 1}
+            )
+        except Exception as e:
+            # Senza versione aggiornata gli altri container useranno il TTL
+            print(f"⚠️ Errore aggiornamento versione registro: {str(e)}")
+
+    # --- Letture (alert-detector) ---
+
+    def all_connections(self, force=False):
+        """Ritorna {connectionId: frozenset(patients) | None} usando la cache (frozenset() = nessuno)"""
+        now = time.monotonic()
+        expired = self._cache is None or now - self._loaded_at >= self.ttl_seconds
+
+        if not force and not expired:
+            if now - self._version_checked_at < self.version_check_seconds:
+                return self._cache
+            self._version_checked_at = now
+            if self._read_version() == self._version:
+                return self._cache
+
+        self._reload()
+        return self._cache
+
+    def connection_ids(self, force=False):
+        return list(self.all_connections(force))
+
+    def group_by_subscription(self, force=False):
+        """Raggruppa le connessioni per sottoscrizione: {frozenset | None: [id, ...]}"""
+        groups = {}
+        for connection_id, patients in self.all_connections(force).items():
+            groups.setdefault(patients, []).append(connection_id)
+        return groups
+
+    def invalidate(self):
+        self._cache = None
+
+    def _read_version(self):
+        try:
+            response = self.table.get_item(
+                Key={'connectionId': VERSION_KEY},
+                ProjectionExpression='registry_version'
+            )
+            return int(response.get('Item', {}).get('registry_version', 0))
+        except Exception as e:
+            print(f"⚠️ Errore lettura versione registro: {str(e)}")
+            return None
+
+    def _reload(self):
+        """Scan paginato dell'intera tabella (solo chiave e sottoscrizione)"""
+        version = self._read_version()
+        connections = {}
+        scan_kwargs = {
+            'ProjectionExpression': 'connectionId, patients, departments',
+        }
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            self.scans += 1
+            for item in response.get('Items', []):
+                connection_id = item['connectionId']
+                if connection_id == VERSION_KEY:
+                    continue
+                connections[connection_id] = subscription_of(item.get('patients'), item.get('departments'))
+
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+        self._cache = connections
+        self._version = version
+        self._loaded_at = self._version_checked_at = time.monotonic()
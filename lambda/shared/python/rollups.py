@@ -0,0 +1,304 @@
+"""
+Rollup dei parametri vitali per intervalli di tempo (distribuito come
+Lambda Layer: scritti da alert-detector, letti da api-handler).
+
+Per ogni paziente e risoluzione (1m, 15m, 1h) la tabella VitalRollups
+contiene un item per intervallo con conteggio, somma, minimo e massimo di
+ogni parametro: un grafico di 24 ore o 7 giorni legge al più qualche
+centinaio di item invece di migliaia di letture grezze.
+
+- Chiave: series = "<patient_id>#<risoluzione>", bucket = inizio
+  dell'intervallo in ISO 8601 (stesso formato dei timestamp di VitalSigns).
+- Aggiornamento incrementale dallo stream di VitalSigns: le letture di un
+  batch vengono prima aggregate in memoria, poi ogni bucket toccato viene
+  letto (batch_get_item), unito e riscritto (batch_write_item). Le letture
+  di uno stesso paziente arrivano in ordine e dallo stesso shard, quindi
+  non ci sono scritture concorrenti sullo stesso bucket.
+- Idempotenza: ogni bucket ricorda il SequenceNumber dell'ultimo record
+  applicato; se Lambda ritenta un batch i record già contati vengono
+  ignorati, quindi i record falliti possono essere ritentati senza
+  contare due volte.
+- Ogni risoluzione ha la sua conservazione (TTL su expiration_time).
+"""
+import os
+import time
+import random
+from datetime import datetime, timedelta
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+from boto3.dynamodb.conditions import Key
+
+from stream_records import VITAL_FIELDS, StreamDecodeError, decode_record
+
+# Configurazione (sovrascrivibile da variabili d'ambiente)
+ROLLUP_WRITE_MAX_ATTEMPTS = int(os.environ.get('ROLLUP_WRITE_MAX_ATTEMPTS', 5))
+ROLLUP_WRITE_BASE_DELAY = float(os.environ.get('ROLLUP_WRITE_BASE_DELAY', 0.05))
+ROLLUP_TARGET_POINTS = int(os.environ.get('ROLLUP_TARGET_POINTS', 300))
+ROLLUP_MAX_POINTS = int(os.environ.get('ROLLUP_MAX_POINTS', 1500))
+
+# Parametri aggregati
+ROLLUP_FIELDS = VITAL_FIELDS
+
+# Risoluzione -> (secondi per intervallo, giorni di conservazione)
+RESOLUTIONS = {
+    '1m': (60, 2),
+    '15m': (900, 31),
+    '1h': (3600, 400),
+}
+
+# Unità accettate nel parametro range (es. 90m, 24h, 7d)
+RANGE_UNITS = {'m': 60, 'h': 3600, 'd': 86400}
+
+# Limiti di DynamoDB per le operazioni batch
+BATCH_GET_LIMIT = 100
+BATCH_WRITE_LIMIT = 25
+
+
+def series_key(patient_id, resolution):
+    return f"{patient_id}#{resolution}"
+
+
+def bucket_start(timestamp, seconds):
+    """Inizio dell'intervallo che contiene timestamp (stringa ISO 8601)"""
+    moment = datetime.fromisoformat(timestamp) if isinstance(timestamp, str) else timestamp
+    midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+    elapsed = int((moment - midnight).total_seconds())
+    return (midnight + timedelta(seconds=elapsed - elapsed % seconds)).isoformat(timespec='seconds')
+
+
+def reading_from_record(record):
+    """Record di stream INSERT -> (patient_id, timestamp, valori, SequenceNumber), None se non valido"""
+    if record.get('eventName') != 'INSERT':
+        return None
+    try:
+        reading = decode_record(record)
+    except StreamDecodeError:
+        return None
+    values = {}
+    for field in ROLLUP_FIELDS:
+        value = getattr(reading, field)
+        # 0 = lettura mancante (come nel rule engine)
+        if value is not None and value == value and value != 0:
+            values[field] = value
+    return (reading.patient_id, reading.timestamp, values, reading.sequence) if values else None
+
+
+class Bucket:
+    """Aggregato di un intervallo: per parametro [n, somma, minimo, massimo]"""
+
+    __slots__ = ('count', 'sequence', 'stats', 'changed')
+
+    def __init__(self):
+        self.count = 0
+        self.sequence = 0
+        self.stats = {}
+        self.changed = False
+
+    @classmethod
+    def from_item(cls, item):
+        bucket = cls()
+        bucket.count = int(item.get('count', 0))
+        bucket.sequence = int(item.get('seq') or 0)
+        for field in ROLLUP_FIELDS:
+            if f"{field}_n" in item:
+                bucket.stats[field] = [int(item[f"{field}_n"]), float(item[f"{field}_sum"]),
+                                       float(item[f"{field}_min"]), float(item[f"{field}_max"])]
+        return bucket
+
+    def add(self, values, sequence=0):
+        """Aggiunge una lettura; False se il record era già stato contato"""
+        if sequence and sequence <= self.sequence:
+            return False
+        for field, value in values.items():
+            stat = self.stats.get(field)
+            if stat is None:
+                self.stats[field] = [1, value, value, value]
+            else:
+                stat[0] += 1
+                stat[1] += value
+                stat[2] = min(stat[2], value)
+                stat[3] = max(stat[3], value)
+        self.count += 1
+        self.sequence = max(self.sequence, sequence)
+        self.changed = True
+        return True
+
+    def to_item(self, patient_id, resolution, bucket, expiration_time):
+        item = {
+            'series': series_key(patient_id, resolution),
+            'bucket': bucket,
+            'patient_id': patient_id,
+            'resolution': resolution,
+            'count': self.count,
+            'seq': str(self.sequence),
+            'expiration_time': expiration_time
+        }
+        for field, (n, total, low, high) in self.stats.items():
+            item[f"{field}_n"] = n
+            item[f"{field}_sum"] = Decimal(str(round(total, 3)))
+            item[f"{field}_min"] = Decimal(str(round(low, 3)))
+            item[f"{field}_max"] = Decimal(str(round(high, 3)))
+        return item
+
+
+class RollupWriter:
+    """Aggiorna i bucket toccati da un batch di stream (in un thread separato)"""
+
+    def __init__(self, dynamodb, table_name, resolutions=RESOLUTIONS,
+                 max_attempts=ROLLUP_WRITE_MAX_ATTEMPTS, base_delay=ROLLUP_WRITE_BASE_DELAY):
+        self.dynamodb = dynamodb
+        self.table_name = table_name
+        self.resolutions = resolutions
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='rollup-writer')
+        self.reads = 0
+        self.writes = 0
+        self.duplicates = 0
+        self.last_write_ms = 0.0
+
+    def submit(self, records):
+        """Avvia l'aggiornamento in background; ritorna un Future con i patient_id non salvati"""
+        return self._executor.submit(self.apply, records)
+
+    def apply(self, records, now=None):
+        """Aggiorna i bucket; ritorna l'insieme dei patient_id i cui bucket non sono stati salvati"""
+        began = time.perf_counter()
+        pending = {}    # (patient_id, risoluzione, bucket) -> [(seq, valori)] in ordine di stream
+        for reading in map(reading_from_record, records):
+            if reading is None:
+                continue
+            patient_id, timestamp, values, sequence = reading
+            try:
+                for resolution, (seconds, _) in self.resolutions.items():
+                    key = (patient_id, resolution, bucket_start(timestamp, seconds))
+                    pending.setdefault(key, []).append((sequence, values))
+            except ValueError:
+                continue
+        if not pending:
+            return set()
+
+        failed = set()
+        try:
+            stored = self._load(list(pending))
+        except Exception as e:
+            print(f"⚠️ Errore lettura rollup: {str(e)}")
+            return {patient_id for patient_id, _, _ in pending}
+
+        now = time.time() if now is None else now
+        items = []
+        for (patient_id, resolution, bucket), contributions in pending.items():
+            stored_item = stored.get((series_key(patient_id, resolution), bucket))
+            aggregate = Bucket.from_item(stored_item) if stored_item else Bucket()
+            for sequence, values in contributions:
+                if not aggregate.add(values, sequence):
+                    self.duplicates += 1
+            if aggregate.changed:
+                expiration = int(now) + self.resolutions[resolution][1] * 86400
+                items.append(aggregate.to_item(patient_id, resolution, bucket, expiration))
+
+        for i in range(0, len(items), BATCH_WRITE_LIMIT):
+            failed.update(self._write_chunk(items[i:i + BATCH_WRITE_LIMIT]))
+        self.last_write_ms = (time.perf_counter() - began) * 1000
+        return failed
+
+    def _load(self, keys):
+        """Bucket già salvati, letti con batch_get_item (100 chiavi per richiesta)"""
+        request_keys = [{'series': series_key(pid, resolution), 'bucket': bucket}
+                        for pid, resolution, bucket in keys]
+        loaded = {}
+        for i in range(0, len(request_keys), BATCH_GET_LIMIT):
+            request = {self.table_name: {'Keys': request_keys[i:i + BATCH_GET_LIMIT]}}
+            while request:
+                response = self.dynamodb.batch_get_item(RequestItems=request)
+                self.reads += 1
+                for item in response.get('Responses', {}).get(self.table_name, []):
+                    loaded[(item['series'], item['bucket'])] = item
+                request = response.get('UnprocessedKeys') or None
+                if request:
+                    time.sleep(self.base_delay)
+        return loaded
+
+    def _write_chunk(self, chunk):
+        requests = [{'PutRequest': {'Item': item}} for item in chunk]
+        for attempt in range(self.max_attempts):
+            try:
+                response = self.dynamodb.batch_write_item(RequestItems={self.table_name: requests})
+                self.writes += 1
+            except Exception as e:
+                print(f"⚠️ Errore scrittura rollup (tentativo {attempt + 1}): {str(e)}")
+                response = {'UnprocessedItems': {self.table_name: requests}}
+
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return set()
+
+            # Backoff esponenziale con jitter prima di ritentare i non processati
+            time.sleep(self.base_delay * (2 ** attempt) * (0.5 + random.random()))
+
+        return {request['PutRequest']['Item']['patient_id'] for request in requests}
+
+
+# --- Lettura (api-handler) ---
+
+def parse_range(value):
+    """'90m' | '24h' | '7d' -> secondi"""
+    try:
+        amount, unit = int(value[:-1]), RANGE_UNITS[value[-1]]
+    except (KeyError, ValueError, IndexError, TypeError):
+        raise ValueError(f"Intervallo non valido: {value} (es. 90m, 24h, 7d)")
+    if amount <= 0:
+        raise ValueError(f"Intervallo non valido: {value}")
+    return amount * unit
+
+
+def choose_resolution(range_seconds, requested=None,
+                      target_points=ROLLUP_TARGET_POINTS, max_points=ROLLUP_MAX_POINTS):
+    """
+    Risoluzione richiesta (se non supera max_points intervalli) oppure la
+    più fine che resta entro target_points
+    """
+    if requested:
+        if requested not in RESOLUTIONS:
+            raise ValueError(f"Risoluzione non valida: {requested} ({', '.join(RESOLUTIONS)})")
+        if range_seconds / RESOLUTIONS[requested][0] > max_points:
+            raise ValueError(f"Troppi intervalli: usare una risoluzione più ampia di {requested}")
+        return requested
+    for resolution, (seconds, _) in sorted(RESOLUTIONS.items(), key=lambda entry: entry[1][0]):
+        if range_seconds / seconds <= target_points:
+            return resolution
+    coarsest = max(RESOLUTIONS, key=lambda resolution: RESOLUTIONS[resolution][0])
+    if range_seconds / RESOLUTIONS[coarsest][0] > max_points:
+        raise ValueError("Intervallo troppo ampio")
+    return coarsest
+
+
+def summarize(item):
+    """Item VitalRollups -> {bucket, count, <parametro>: {min, max, mean}}"""
+    point = {'bucket': item['bucket'], 'count': int(item.get('count', 0))}
+    for field in ROLLUP_FIELDS:
+        n = int(item.get(f"{field}_n", 0))
+        if n:
+            point[field] = {
+                'min': float(item[f"{field}_min"]),
+                'max': float(item[f"{field}_max"]),
+                'mean': round(float(item[f"{field}_sum"]) / n, 2)
+            }
+    return point
+
+
+def query_rollups(table, patient_id, range_seconds, resolution, now=None):
+    """Bucket dell'intervallo [now - range, now] in ordine cronologico (tutte le pagine)"""
+    now = now or datetime.now()
+    start = bucket_start(now - timedelta(seconds=range_seconds), RESOLUTIONS[resolution][0])
+    query = {
+        'KeyConditionExpression': Key('series').eq(series_key(patient_id, resolution)) & Key('bucket').gte(start)
+    }
+    points = []
+    while True:
+        response = table.query(**query)
+        points.extend(summarize(item) for item in response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return {'resolution': resolution, 'start': start, 'points': points}
+        query['ExclusiveStartKey'] = response['LastEvaluatedKey']
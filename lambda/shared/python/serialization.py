@@ -0,0 +1,128 @@
+"""
+Serializzazione JSON condivisa tra le Lambda (distribuita come Lambda Layer).
+
+- Numeri DynamoDB senza Decimal: NativeDeserializer converte gli
+  AttributeValue del client di basso livello ({'N': '72.5'}) direttamente
+  in int/float. Usato dal client "sola lettura" di aws_clients
+  (table(..., native_numbers=True)), i cui item vanno solo in JSON.
+- Un solo encoder per container: json.dumps(cls=...) o default=...
+  costruisce un nuovo JSONEncoder a ogni chiamata; qui l'encoder C è
+  creato una volta e riusato. Decimal, datetime e set sono gestiti dal
+  fallback (solo per i valori che non sono già tipi JSON).
+- Frammenti: ogni elemento di un messaggio WebSocket viene codificato una
+  sola volta; i frame per i diversi gruppi di connessioni si compongono
+  unendo i frammenti già in bytes (object_frame, array_frame).
+- Formato compatto opzionale: chiavi brevi per i campi più frequenti dei
+  frame WebSocket (COMPACT_KEYS), espanse dal frontend.
+"""
+import json
+from decimal import Decimal
+from datetime import date, datetime
+
+# Chiavi abbreviate nei frame WebSocket compatti (stessa tabella in frontend/src/App.js)
+COMPACT_KEYS = {
+    'patient_id': 'p',
+    'name': 'n',
+    'heart_rate': 'hr',
+    'bp_systolic': 'bs',
+    'bp_diastolic': 'bd',
+    'spo2': 'o2',
+    'temperature': 't',
+    'status': 's',
+    'timestamp': 'ts',
+    'ingest_time': 'it',
+    'alert_id': 'a',
+    'violations': 'v',
+    'severity': 'sv',
+}
+
+
+def native_number(text):
+    """Numero DynamoDB (stringa) -> int se intero, altrimenti float"""
+    if '.' in text or 'e' in text or 'E' in text:
+        return float(text)
+    return int(text)
+
+
+def native_value(value):
+    """AttributeValue -> tipo Python nativo (numeri int/float, mai Decimal)"""
+    # Casi più frequenti senza scomporre il dict
+    if 'S' in value:
+        return value['S']
+    if 'N' in value:
+        return native_number(value['N'])
+    (kind, data), = value.items()
+    if kind == 'M':
+        return {key: native_value(item) for key, item in data.items()}
+    if kind == 'L':
+        return [native_value(item) for item in data]
+    if kind == 'BOOL':
+        return data
+    if kind == 'NULL':
+        return None
+    if kind == 'SS':
+        return list(data)
+    if kind == 'NS':
+        return [native_number(item) for item in data]
+    if kind == 'B':
+        return data
+    if kind == 'BS':
+        return list(data)
+    raise TypeError(f"Tipo DynamoDB non supportato: {kind}")
+
+
+def native_item(item):
+    """Item di basso livello ({'nome': {'S': ...}}) -> dict con tipi nativi"""
+    return {key: native_value(value) for key, value in item.items()}
+
+
+class NativeDeserializer:
+    """Sostituto di TypeDeserializer per TransformationInjector (sola lettura)"""
+
+    def deserialize(self, value):
+        return native_value(value)
+
+
+def _fallback(obj):
+    """Tipi non JSON: Decimal (client documento), datetime, set"""
+    if isinstance(obj, Decimal):
+        return int(obj) if obj == obj.to_integral_value() else float(obj)
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return str(obj)
+
+
+# Encoder riusati (il costruttore di JSONEncoder non viene più chiamato per ogni messaggio)
+_encoder = json.JSONEncoder(default=_fallback)
+_compact_encoder = json.JSONEncoder(default=_fallback, separators=(',', ':'))
+
+
+def dumps(obj):
+    """JSON (str) per i body HTTP, stesso formato di json.dumps"""
+    return _encoder.encode(obj)
+
+
+def dumps_bytes(obj):
+    """JSON senza spazi, in bytes: il formato dei frame WebSocket"""
+    return _compact_encoder.encode(obj).encode('utf-8')
+
+
+def compact_keys(obj):
+    """Abbrevia le chiavi note (ricorsivo su dict e liste)"""
+    if isinstance(obj, dict):
+        return {COMPACT_KEYS.get(key, key): compact_keys(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [compact_keys(value) for value in obj]
+    return obj
+
+
+def array_frame(fragments):
+    """Array JSON da elementi già codificati"""
+    return b'[' + b','.join(fragments) + b']'
+
+
+def object_frame(fields):
+    """Oggetto JSON da coppie (chiave, valore già codificato)"""
+    return b'{' + b','.join(dumps_bytes(key) + b':' + value for key, value in fields) + b'}'
@@ -0,0 +1,261 @@
+"""
+Decodifica dei record DynamoDB Streams della tabella VitalSigns
+(distribuita come Lambda Layer: usata da alert-detector e dai rollup).
+
+Lo schema dei NewImage è fisso (VITALS_SCHEMA): ogni attributo viene
+letto una sola volta con il tipo atteso, invece di ricostruire una
+closure get_val() per ogni record.
+
+- decode_record / decode_records: un VitalReading (NamedTuple) per record.
+- decode_columns: tutto il batch direttamente in colonne (array 'd' della
+  libreria standard, NaN per i valori mancanti), senza oggetti per
+  record; rule_engine le usa come array NumPy senza copia.
+- Validazione: chiavi mancanti o attributi con un tipo diverso da quello
+  dello schema sollevano StreamDecodeError (record non ritentabile).
+- Eventi: INSERT e MODIFY usano NewImage; REMOVE (es. scadenza TTL) porta
+  solo le chiavi con stream_view_type = NEW_IMAGE, i parametri sono None.
+- Origine: le letture storiche di scripts/bulk_loader.py hanno
+  source = BULK_SOURCE (is_bulk_record) e non sono letture dal vivo.
+"""
+from array import array
+from typing import NamedTuple, Optional
+
+# Parametri vitali numerici del NewImage
+VITAL_FIELDS = ('heart_rate', 'bp_systolic', 'bp_diastolic', 'spo2', 'temperature')
+
+# Attributo -> (tipo DynamoDB, obbligatorio)
+VITALS_SCHEMA = {
+    'patient_id': ('S', True),
+    'timestamp': ('S', True),
+    'patient_name': ('S', False),
+    'status': ('S', False),
+    'heart_rate': ('N', False),
+    'bp_systolic': ('N', False),
+    'bp_diastolic': ('N', False),
+    'spo2': ('N', False),
+    'temperature': ('N', False),
+    'ingest_time': ('N', False),
+}
+
+STREAM_EVENTS = ('INSERT', 'MODIFY', 'REMOVE')
+
+# Valore dell'attributo 'source' delle letture caricate in blocco
+BULK_SOURCE = 'bulk'
+
+NAN = float('nan')
+
+
+class StreamDecodeError(ValueError):
+    """Record di stream non conforme allo schema di VitalSigns"""
+
+
+class VitalReading(NamedTuple):
+    """Una lettura decodificata (None per gli attributi assenti)"""
+    index: int
+    event: str
+    sequence: int
+    patient_id: str
+    timestamp: str
+    patient_name: Optional[str]
+    status: Optional[str]
+    heart_rate: Optional[float]
+    bp_systolic: Optional[float]
+    bp_diastolic: Optional[float]
+    spo2: Optional[float]
+    temperature: Optional[float]
+    ingest_time: Optional[float]
+
+    def vitals(self):
+        """Parametro -> valore (None se assente), nel formato di rule_engine.check_record"""
+        return {'heart_rate': self.heart_rate, 'bp_systolic': self.bp_systolic,
+                'bp_diastolic': self.bp_diastolic, 'spo2': self.spo2, 'temperature': self.temperature}
+
+
+def _attribute(image, name, kind, required):
+    attribute = image.get(name)
+    if attribute is None:
+        if required:
+            raise StreamDecodeError(f"Attributo mancante: {name}")
+        return None
+    try:
+        value = attribute[kind]
+    except (KeyError, TypeError):
+        raise StreamDecodeError(f"Tipo non valido per {name}: atteso {kind}, ricevuto {attribute!r}")
+    if kind == 'N':
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise StreamDecodeError(f"Numero non valido per {name}: {value!r}")
+    if not isinstance(value, str):
+        raise StreamDecodeError(f"Tipo non valido per {name}: atteso {kind}")
+    return value
+
+
+def _validated_values(image):
+    """Valori dello schema con errori dettagliati (usato quando il percorso veloce fallisce)"""
+    if not isinstance(image, dict):
+        raise StreamDecodeError('Immagine non valida')
+    return [_attribute(image, name, kind, required) for name, (kind, required) in VITALS_SCHEMA.items()]
+
+
+def _values(image):
+    """
+    Valori dello schema nell'ordine di VitalReading. Il percorso veloce
+    controlla solo il tipo (chiave 'S'/'N') e la conversione dei numeri;
+    al primo errore il record viene rivalidato per un messaggio preciso.
+    """
+    try:
+        get = image.get
+        name, status = get('patient_name'), get('status')
+        hr, sys_, dia = get('heart_rate'), get('bp_systolic'), get('bp_diastolic')
+        spo2, temp, ingest = get('spo2'), get('temperature'), get('ingest_time')
+        return (
+            image['patient_id']['S'],
+            image['timestamp']['S'],
+            None if name is None else name['S'],
+            None if status is None else status['S'],
+            None if hr is None else float(hr['N']),
+            None if sys_ is None else float(sys_['N']),
+            None if dia is None else float(dia['N']),
+            None if spo2 is None else float(spo2['N']),
+            None if temp is None else float(temp['N']),
+            None if ingest is None else float(ingest['N']),
+        )
+    except (KeyError, TypeError, ValueError, AttributeError):
+        return _validated_values(image)
+
+
+def _image(record):
+    """(evento, immagine da decodificare, SequenceNumber) di un record di stream"""
+    event = record.get('eventName')
+    if event not in STREAM_EVENTS:
+        raise StreamDecodeError(f"Evento non supportato: {event}")
+    try:
+        change = record['dynamodb']
+        image = (change.get('OldImage') or change['Keys']) if event == 'REMOVE' else change['NewImage']
+    except (KeyError, TypeError):
+        raise StreamDecodeError(f"Record {event} senza immagine")
+    sequence = change.get('SequenceNumber')
+    try:
+        return event, image, int(sequence) if sequence else 0
+    except (TypeError, ValueError):
+        raise StreamDecodeError(f"SequenceNumber non valido: {sequence!r}")
+
+
+def is_bulk_record(record):
+    """True per i record di letture storiche caricate in blocco (source = BULK_SOURCE)"""
+    try:
+        return record['dynamodb']['NewImage']['source']['S'] == BULK_SOURCE
+    except (KeyError, TypeError):
+        return False
+
+
+def decode_record(record, index=0):
+    """Record di stream -> VitalReading (StreamDecodeError se non valido)"""
+    event, image, sequence = _image(record)
+    return VitalReading(index, event, sequence, *_values(image))
+
+
+def decode_records(records, events=('INSERT',)):
+    """
+    Decodifica i record con evento in `events`.
+    Ritorna (letture, errori) dove errori è una lista di (indice, eccezione).
+    """
+    readings = []
+    errors = []
+    for index, record in enumerate(records):
+        if record.get('eventName') not in events:
+            continue
+        try:
+            readings.append(decode_record(record, index))
+        except StreamDecodeError as e:
+            errors.append((index, e))
+    return readings, errors
+
+
+class VitalColumns:
+    """
+    Batch decodificato in colonne: liste per gli attributi stringa, array
+    'd' (float, NaN se mancante) per i parametri numerici.
+    `indexes` riporta la posizione di ogni riga in event['Records'].
+    """
+
+    def __init__(self):
+        self.indexes = []
+        self.events = []
+        self.sequences = []
+        self.patient_ids = []
+        self.timestamps = []
+        self.names = []
+        self.statuses = []
+        self.numbers = {field: array('d') for field in VITAL_FIELDS + ('ingest_time',)}
+
+    def __len__(self):
+        return len(self.indexes)
+
+
+def decode_columns(records, events=('INSERT',)):
+    """
+    Come decode_records, ma scrive direttamente nelle colonne di un
+    VitalColumns. Gli attributi di VITALS_SCHEMA sono letti uno per uno,
+    senza chiamate né strutture intermedie per record.
+    """
+    columns = VitalColumns()
+    errors = []
+    numbers = columns.numbers
+    hr_col, sys_col, dia_col = numbers['heart_rate'], numbers['bp_systolic'], numbers['bp_diastolic']
+    spo2_col, temp_col, ingest_col = numbers['spo2'], numbers['temperature'], numbers['ingest_time']
+    for index, record in enumerate(records):
+        event = record.get('eventName')
+        if event not in events:
+            continue
+        try:
+            change = record['dynamodb']
+            image = change['NewImage'] if event != 'REMOVE' else (change.get('OldImage') or change['Keys'])
+            get = image.get
+            pid = image['patient_id']['S']
+            timestamp = image['timestamp']['S']
+            name = get('patient_name')
+            name = None if name is None else name['S']
+            status = get('status')
+            status = None if status is None else status['S']
+            hr = get('heart_rate')
+            hr = NAN if hr is None else float(hr['N'])
+            sys_ = get('bp_systolic')
+            sys_ = NAN if sys_ is None else float(sys_['N'])
+            dia = get('bp_diastolic')
+            dia = NAN if dia is None else float(dia['N'])
+            spo2 = get('spo2')
+            spo2 = NAN if spo2 is None else float(spo2['N'])
+            temp = get('temperature')
+            temp = NAN if temp is None else float(temp['N'])
+            ingest = get('ingest_time')
+            ingest = NAN if ingest is None else float(ingest['N'])
+            sequence = change.get('SequenceNumber')
+            sequence = int(sequence) if sequence else 0
+            if event not in STREAM_EVENTS:
+                raise ValueError(event)
+        except (KeyError, TypeError, ValueError, AttributeError):
+            # Rivalidazione del solo record non valido, per un errore preciso
+            try:
+                decode_record(record, index)
+                error = StreamDecodeError('Record non valido')
+            except StreamDecodeError as e:
+                error = e
+            errors.append((index, error))
+            continue
+        # Riga aggiunta solo dopo la validazione completa: nessuna riga parziale
+        columns.indexes.append(index)
+        columns.events.append(event)
+        columns.sequences.append(sequence)
+        columns.patient_ids.append(pid)
+        columns.timestamps.append(timestamp)
+        columns.names.append(name)
+        columns.statuses.append(status)
+        hr_col.append(hr)
+        sys_col.append(sys_)
+        dia_col.append(dia)
+        spo2_col.append(spo2)
+        temp_col.append(temp)
+        ingest_col.append(ingest)
+    return columns, errors
@@ -1,50 +1,114 @@
+import time
+_init_started = time.perf_counter()
+
+import os
 import json
 import random
-import time
-import boto3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from decimal import Decimal
 
-# Inizializziamo la connessione a DynamoDB
-dynamodb = boto3.resource('dynamodb', region_name='eu-north-1')
-patients_table = dynamodb.Table('Patients')
-vitals_table = dynamodb.Table('VitalSigns')
+# NumPy è opzionale (layer Lambda): senza, le letture sono generate una per paziente
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    np = None
+    HAS_NUMPY = False
+
+import aws_clients
+
+# Tabelle dal provider condiviso (client creato al primo utilizzo)
+patients_table = aws_clients.table('Patients')
+vitals_table = aws_clients.table('VitalSigns')
+
+# Configurazione modalità ad alto throughput
+SIMULATOR_WORKERS = int(os.environ.get('SIMULATOR_WORKERS', 8))
+VECTORIZED = os.environ.get('SIMULATOR_VECTORIZED', 'true').lower() == 'true' and HAS_NUMPY
+
+# Finestra "calda" di VitalSigns: le letture scadono (TTL su expiration_time)
+# dopo VITALS_TTL_DAYS giorni; prima vanno archiviate con scripts/vitals_archive.py.
+# 0 = nessuna scadenza
+VITALS_TTL_DAYS = float(os.environ.get('VITALS_TTL_DAYS', 7))
+
+# Campi letti dalla tabella Patients (il loader scrive baseline_hr e full_name,
+# le versioni precedenti baseline_heart_rate e name: si accettano entrambi)
+PATIENT_FIELDS = ('patient_id', 'name', 'full_name', 'baseline_hr', 'baseline_heart_rate',
+                  'baseline_bp_sys', 'baseline_bp_dia', 'baseline_temp', 'baseline_spo2')
+
+# Valori di default per pazienti senza baseline
+DEFAULT_BASELINES = {'hr': 75.0, 'sys': 120.0, 'dia': 80.0, 'temp': 36.8, 'spo2': 97.0}
 
 def get_all_patients():
-    """Scarica la lista dei pazienti attivi dal DB"""
-    response = patients_table.scan()
-    return response['Items']
+    """Scarica la lista dei pazienti attivi dal DB (tutte le pagine, solo i campi utili)"""
+    names = {f"#f{i}": field for i, field in enumerate(PATIENT_FIELDS)}
+    scan = {
+        'ProjectionExpression': ', '.join(names),
+        'ExpressionAttributeNames': names
+    }
+    patients = []
+    while True:
+        response = patients_table.scan(**scan)
+        patients.extend(response['Items'])
+        if 'LastEvaluatedKey' not in response:
+            return patients
+        scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def ingest_time_ms():
+    """Istante di acquisizione ad alta risoluzione (epoch in ms, 3 decimali)"""
+    return Decimal(f"{time.time() * 1000:.3f}")
+
+def expiration_time():
+    """Epoch (secondi) di scadenza di una lettura scritta ora, None senza TTL"""
+    if VITALS_TTL_DAYS <= 0:
+        return None
+    return int(time.time() + VITALS_TTL_DAYS * 86400)
+
+def patient_name(patient):
+    return patient.get('name') or patient.get('full_name') or 'Sconosciuto'
+
+def patient_baselines(patient):
+    """Baseline numeriche del paziente (float), con default se mancanti"""
+    def get(*keys, default):
+        for key in keys:
+            if patient.get(key) is not None:
+                return float(patient[key])
+        return default
+
+    return {
+        'hr': get('baseline_hr', 'baseline_heart_rate', default=DEFAULT_BASELINES['hr']),
+        'sys': get('baseline_bp_sys', default=DEFAULT_BASELINES['sys']),
+        'dia': get('baseline_bp_dia', default=DEFAULT_BASELINES['dia']),
+        'temp': get('baseline_temp', default=DEFAULT_BASELINES['temp']),
+        'spo2': get('baseline_spo2', default=DEFAULT_BASELINES['spo2'])
+    }
 
-def simulate_vital_signs(patient):
+def simulate_vital_signs(patient, timestamp=None):
     """Genera dati realistici basati sulla baseline del paziente"""
-    
+
     # NOTA: I numeri in DynamoDB tornano come Decimal, dobbiamo convertirli per fare calcoli
     # e poi riconvertirli per salvarli.
-    
+    base = patient_baselines(patient)
+
     # 1. Heart Rate
-    base_hr = float(patient['baseline_heart_rate'])
     hr_var = random.uniform(-3, 10) # Variazione un po' più ampia
-    heart_rate = round(base_hr + hr_var, 1)
+    heart_rate = round(base['hr'] + hr_var, 1)
 
     # 2. Pressione
-    base_sys = float(patient['baseline_bp_sys'])
-    base_dia = float(patient['baseline_bp_dia'])
     bp_var = random.uniform(-5, 5)
-    bp_sys = int(base_sys + bp_var)
-    bp_dia = int(base_dia + (bp_var * 0.6))
+    bp_sys = int(base['sys'] + bp_var)
+    bp_dia = int(base['dia'] + (bp_var * 0.6))
 
     # 3. Temperatura & SpO2
-    base_temp = float(patient['baseline_temp'])
-    temp = round(base_temp + random.uniform(-0.2, 0.4), 1)
-    
-    base_spo2 = float(patient['baseline_spo2'])
-    spo2 = int(min(100, base_spo2 + random.uniform(-2, 1)))
+    temp = round(base['temp'] + random.uniform(-0.2, 0.4), 1)
+    spo2 = int(min(100, base['spo2'] + random.uniform(-2, 1)))
 
     # Creiamo l'oggetto da salvare
-    return {
+    item = {
         "patient_id": patient['patient_id'],
-        "timestamp": datetime.now().isoformat(), # La chiave temporale!
-        "patient_name": patient['name'], # Utile averlo qui per la dashboard
+        "timestamp": timestamp or datetime.now().isoformat(), # La chiave temporale!
+        "ingest_time": ingest_time_ms(), # Per la latenza end-to-end (epoch ms)
+        "patient_name": patient_name(patient), # Utile averlo qui per la dashboard
         "heart_rate": Decimal(str(heart_rate)), # DynamoDB vuole Decimal
         "bp_systolic": bp_sys,
         "bp_diastolic": bp_dia,
@@ -52,32 +116,123 @@ def simulate_vital_signs(patient):
         "temperature": Decimal(str(temp)),
         "spo2": spo2
     }
+    expiration = expiration_time()
+    if expiration is not None:
+        item["expiration_time"] = expiration # TTL: fine della finestra calda
+    return item
+
+def simulate_batch(patients, timestamp=None, rng=None):
+    """
+    Come simulate_vital_signs, ma per tutti i pazienti in un colpo solo:
+    variazioni casuali e arrotondamenti sono calcolati su array NumPy
+    """
+    timestamp = timestamp or datetime.now().isoformat()
+    ingest_time = ingest_time_ms()
+    rng = rng or np.random.default_rng()
+    n = len(patients)
+    if n == 0:
+        return []
+
+    baselines = [patient_baselines(p) for p in patients]
+    base = {key: np.fromiter((b[key] for b in baselines), dtype=np.float64, count=n)
+            for key in DEFAULT_BASELINES}
+
+    heart_rate = np.round(base['hr'] + rng.uniform(-3, 10, n), 1)
+    bp_var = rng.uniform(-5, 5, n)
+    bp_sys = (base['sys'] + bp_var).astype(np.int64)
+    bp_dia = (base['dia'] + bp_var * 0.6).astype(np.int64)
+    temp = np.round(base['temp'] + rng.uniform(-0.2, 0.4, n), 1)
+    spo2 = np.minimum(100, base['spo2'] + rng.uniform(-2, 1, n)).astype(np.int64)
+
+    # Conversione a tipi Python una sola volta per colonna
+    hr_text = np.char.mod('%.1f', heart_rate).tolist()
+    temp_text = np.char.mod('%.1f', temp).tolist()
+    sys_list, dia_list, spo2_list = bp_sys.tolist(), bp_dia.tolist(), spo2.tolist()
+
+    items = [
+        {
+            "patient_id": patient['patient_id'],
+            "timestamp": timestamp,
+            "ingest_time": ingest_time,
+            "patient_name": patient_name(patient),
+            "heart_rate": Decimal(hr_text[i]),
+            "bp_systolic": sys_list[i],
+            "bp_diastolic": dia_list[i],
+            "blood_pressure": f"{sys_list[i]}/{dia_list[i]}",
+            "temperature": Decimal(temp_text[i]),
+            "spo2": spo2_list[i]
+        }
+        for i, patient in enumerate(patients)
+    ]
+    expiration = expiration_time()
+    if expiration is not None:
+        for item in items:
+            item["expiration_time"] = expiration
+    return items
+
+def write_chunk(items):
+    """
+    Scrive un blocco di letture con batch_writer (25 item per richiesta,
+    retry automatici); il client di basso livello è condiviso tra i thread
+    """
+    with vitals_table.batch_writer() as batch:
+        for item in items:
+            batch.put_item(Item=item)
+    return len(items)
+
+def write_vitals(items, workers=SIMULATOR_WORKERS):
+    """Distribuisce le scritture su un pool di thread, ognuno con il proprio batch_writer"""
+    if not items:
+        return 0
+    workers = max(1, min(workers, len(items) // 25 or 1))
+    chunk_size = -(-len(items) // workers)
+    chunks = [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+    if len(chunks) == 1:
+        return write_chunk(chunks[0])
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return sum(executor.map(write_chunk, chunks))
+
+aws_clients.mark_initialized(_init_started)
 
 def lambda_handler(event, context):
     print("Connessione al database...")
-    
+    started = time.perf_counter()
+    cold_start = aws_clients.cold_start_report()
+
     # 1. LEGGIAMO i pazienti reali
     patients = get_all_patients()
     print(f"Trovati {len(patients)} pazienti da simulare.")
 
-    generated_count = 0
+    # 2. GENERIAMO i dati (vettoriale se NumPy è disponibile)
+    timestamp = datetime.now().isoformat()
+    if VECTORIZED:
+        items = simulate_batch(patients, timestamp)
+    else:
+        items = [simulate_vital_signs(patient, timestamp) for patient in patients]
+    generated = time.perf_counter()
+
+    # 3. SCRIVIAMO in blocco su più thread
+    generated_count = write_vitals(items)
+    finished = time.perf_counter()
 
-    # 2. GENERIAMO E SCRIVIAMO i dati
-    # In una Lambda reale useremmo 'batch_writer' per velocità, ma iniziamo semplice
-    for patient in patients:
-        vitals = simulate_vital_signs(patient)
-        
-        # Scrittura su DynamoDB
-        vitals_table.put_item(Item=vitals)
-        
-        print(f"Salvati dati per {patient['name']}: HR={vitals['heart_rate']}")
-        generated_count += 1
+    elapsed = finished - started
+    records_per_sec = generated_count / elapsed if elapsed > 0 else 0.0
+    print(f"Salvati {generated_count} record in {elapsed:.2f}s "
+          f"({records_per_sec:.0f} record/s, generazione {generated - started:.2f}s, "
+          f"scrittura {finished - generated:.2f}s, {SIMULATOR_WORKERS} worker)")
 
     return {
         'statusCode': 200,
-        'body': json.dumps(f"Simulazione completata. Generati {generated_count} record.")
+        'body': json.dumps({
+            'message': f"Simulazione completata. Generati {generated_count} record.",
+            'records_written': generated_count,
+            'elapsed_seconds': round(elapsed, 3),
+            'records_per_sec': round(records_per_sec, 1),
+            'vectorized': VECTORIZED,
+            'cold_start': cold_start
+        })
     }
 
 # Test locale
 if __name__ == "__main__":
-    lambda_handler(None, None)
\ No newline at end of file
+    lambda_handler(None, None)
@@ -0,0 +1,409 @@
+#!/usr/bin/env python3
+"""
+Caricamento massivo e riprendibile su DynamoDB (Patients e storico VitalSigns)
+
+- L'input viene diviso in segmenti contigui scritti in parallelo, ognuno
+  da un thread con batch_write_item da 25 item.
+- L'avanzamento di ogni segmento è salvato in un file di checkpoint:
+  se il caricamento si interrompe, la stessa riga di comando riparte da
+  dove era arrivato (--restart per ricominciare da zero). Le scritture
+  sono PutRequest, quindi riscrivere l'ultimo blocco non confermato è
+  innocuo.
+- In caso di throttling (UnprocessedItems o errori di capacità) tutti i
+  thread rallentano con un ritardo condiviso che cresce del 50% a ogni
+  throttling e si riduce del 20% a ogni scrittura riuscita.
+- Riporta periodicamente item scritti e item/s.
+- Le letture VitalSigns ricevono il TTL (expiration_time) come quelle del
+  simulatore: --ttl-days giorni dal caricamento (default VITALS_TTL_DAYS
+  o 7, 0 = nessuna scadenza). Prima della scadenza vanno archiviate in
+  Parquet con scripts/vitals_archive.py.
+- VitalSigns ha lo stream verso alert-detector: le letture storiche sono
+  marcate source = 'bulk' (stream_records.BULK_SOURCE) e alert-detector
+  le usa solo per i rollup dello storico, senza allarmi, trend né
+  aggiornamenti WebSocket ai client collegati.
+
+Uso:
+  python3 scripts/bulk_loader.py patients [--input data/patients.csv]
+  python3 scripts/bulk_loader.py vitals [--input data/processed/chartevents.parquet]
+                                        [--patients data/patients.csv] [--ttl-days 7]
+  opzioni comuni: [--table NOME] [--segments 8] [--checkpoint FILE] [--restart]
+"""
+import os
+import ast
+import sys
+import csv
+import json
+import time
+import random
+import argparse
+import threading
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+import aws_clients  # noqa: E402
+from stream_records import BULK_SOURCE  # noqa: E402
+from botocore.exceptions import ClientError  # noqa: E402
+
+# Limite di DynamoDB per una singola batch_write_item
+BATCH_WRITE_LIMIT = 25
+
+# Errori di capacità che attivano il rallentamento
+THROTTLE_ERRORS = {'ProvisionedThroughputExceededException', 'ThrottlingException', 'RequestLimitExceeded'}
+
+# Tentativi per blocco e ritardi (secondi)
+MAX_ATTEMPTS = 10
+BASE_DELAY = 0.05
+MAX_DELAY = 2.0
+THROTTLE_INCREASE = 1.5
+THROTTLE_DECREASE = 0.8
+
+# Ogni quanti blocchi per segmento si aggiorna il checkpoint
+CHECKPOINT_EVERY = 20
+REPORT_INTERVAL = 5.0
+
+# ITEMID MIMIC-III -> attributo di VitalSigns
+VITAL_ITEMS = {
+    220045: 'heart_rate',
+    220179: 'bp_systolic',
+    220180: 'bp_diastolic',
+    223761: 'temperature',
+    220277: 'spo2'
+}
+
+
+# --- Conversione dell'input in item DynamoDB ---
+
+def decimalize(value):
+    if value is None or value == "" or value == "null":
+        return None
+    try:
+        number = Decimal(str(value))
+    except Exception:
+        return None
+    return number if number.is_finite() else None
+
+
+def parse_contact(value):
+    """emergency_contact: JSON oppure repr di un dict Python (come lo scrive il notebook)"""
+    for parse in (json.loads, ast.literal_eval):
+        try:
+            contact = parse(value)
+        except (ValueError, SyntaxError):
+            continue
+        if isinstance(contact, dict):
+            return contact
+    return None
+
+
+def patient_item(row):
+    """Riga di data/patients.csv -> item della tabella Patients"""
+    item = {
+        "patient_id": row["patient_id"],
+        "full_name": row["full_name"],
+        "gender": row["GENDER"],
+        "birthdate": row["DOB"],
+        "department": row["department"],
+        "room": row["room"],
+        "attending_physician": row["attending_physician"],
+        "status": row["status"],
+        "diagnoses": row["diagnoses"].split("|") if row["diagnoses"] else [],
+        "medications": row["medications"].split("|") if row["medications"] else [],
+        "allergies": row["allergies"],
+        "baseline_hr": decimalize(row["baseline_hr"]),
+        "baseline_bp_sys": decimalize(row["baseline_bp_sys"]),
+        "baseline_bp_dia": decimalize(row["baseline_bp_dia"]),
+        "baseline_temp": decimalize(row["baseline_temp"]),
+        "baseline_spo2": decimalize(row["baseline_spo2"]),
+    }
+
+    # Statistiche aggiuntive delle baseline (baseline_hr_p95, ...) per le regole relative
+    for column, value in row.items():
+        if column.startswith("baseline_") and column not in item:
+            stat = decimalize(value)
+            if stat is not None:
+                item[column] = stat
+
+    if row.get("emergency_contact"):
+        contact = parse_contact(row["emergency_contact"])
+        if contact is not None:
+            item["emergency_contact"] = contact
+    return item
+
+
+def read_patients(path):
+    with open(path, mode='r', encoding='utf-8') as csv_file:
+        return [patient_item(row) for row in csv.DictReader(csv_file)]
+
+
+def read_vitals(path, patients_path):
+    """
+    Misure di chartevents -> letture VitalSigns: le misure dello stesso
+    paziente con lo stesso CHARTTIME diventano una sola lettura
+    """
+    import pandas as pd
+
+    columns = ['SUBJECT_ID', 'ITEMID', 'CHARTTIME', 'VALUENUM']
+    if path.endswith('.parquet'):
+        events = pd.read_parquet(path, columns=columns)
+    elif path.endswith('.feather'):
+        events = pd.read_feather(path, columns=columns)
+    else:
+        events = pd.read_csv(path, usecols=columns)
+    events['CHARTTIME'] = pd.to_datetime(events['CHARTTIME'])
+
+    patients = pd.read_csv(patients_path, usecols=['SUBJECT_ID', 'patient_id', 'full_name'])
+    readings = (events[events['ITEMID'].isin(VITAL_ITEMS.keys())]
+                .pivot_table(index=['SUBJECT_ID', 'CHARTTIME'], columns='ITEMID',
+                             values='VALUENUM', aggfunc='mean')
+                .rename(columns=VITAL_ITEMS)
+                .reset_index()
+                .merge(patients, on='SUBJECT_ID', how='inner')
+                .sort_values(['patient_id', 'CHARTTIME']))
+    for field in VITAL_ITEMS.values():
+        if field not in readings.columns:
+            readings[field] = float('nan')
+
+    # La temperatura MetaVision (223761) è in Fahrenheit
+    fahrenheit = readings['temperature'] > 50
+    readings.loc[fahrenheit, 'temperature'] = (readings.loc[fahrenheit, 'temperature'] - 32) * 5 / 9
+
+    items = []
+    for row in readings.itertuples(index=False):
+        item = {
+            'patient_id': row.patient_id,
+            'timestamp': row.CHARTTIME.isoformat(),
+            'patient_name': row.full_name,
+            'source': BULK_SOURCE
+        }
+        if row.heart_rate == row.heart_rate:
+            item['heart_rate'] = Decimal(f"{row.heart_rate:.1f}")
+        if row.bp_systolic == row.bp_systolic:
+            item['bp_systolic'] = int(row.bp_systolic)
+        if row.bp_diastolic == row.bp_diastolic:
+            item['bp_diastolic'] = int(row.bp_diastolic)
+        if 'bp_systolic' in item and 'bp_diastolic' in item:
+            item['blood_pressure'] = f"{item['bp_systolic']}/{item['bp_diastolic']}"
+        if row.temperature == row.temperature:
+            item['temperature'] = Decimal(f"{row.temperature:.1f}")
+        if row.spo2 == row.spo2:
+            item['spo2'] = int(min(100, row.spo2))
+        items.append(item)
+    return items
+
+
+# --- Caricamento ---
+
+class AdaptiveThrottle:
+    """Ritardo condiviso tra i thread: cresce col throttling, cala con i successi"""
+
+    def __init__(self, max_delay=MAX_DELAY):
+        self.delay = 0.0
+        self.max_delay = max_delay
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        if self.delay:
+            time.sleep(self.delay * random.uniform(0.5, 1.0))
+
+    def on_throttle(self):
+        with self._lock:
+            self.throttled += 1
+            self.delay = min(self.max_delay, max(BASE_DELAY, self.delay * THROTTLE_INCREASE))
+
+    def on_success(self):
+        if self.delay:
+            with self._lock:
+                self.delay = 0.0 if self.delay < BASE_DELAY / 2 else self.delay * THROTTLE_DECREASE
+
+
+class Checkpoint:
+    """Posizione raggiunta da ogni segmento, salvata su file in modo atomico"""
+
+    def __init__(self, path, meta, segments):
+        self.path = path
+        self.meta = meta
+        self.positions = [start for start, _ in segments]
+        self.resumed = False
+        self._lock = threading.Lock()
+
+    def resume(self, segments):
+        """Riprende le posizioni salvate se il checkpoint riguarda lo stesso input"""
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, encoding='utf-8') as f:
+            saved = json.load(f)
+        if saved.get('meta') != self.meta or len(saved.get('positions', [])) != len(segments):
+            print(f"⚠️ Checkpoint {self.path} relativo a un altro input: si riparte da zero")
+            return 0
+        self.positions = [max(start, min(end, position))
+                          for (start, end), position in zip(segments, saved['positions'])]
+        self.resumed = True
+        return sum(position - start for (start, _), position in zip(segments, self.positions))
+
+    def advance(self, segment, position, save=False):
+        with self._lock:
+            self.positions[segment] = position
+            if save:
+                self._save()
+
+    def save(self):
+        with self._lock:
+            self._save()
+
+    def _save(self):
+        temporary = f"{self.path}.tmp"
+        with open(temporary, 'w', encoding='utf-8') as f:
+            json.dump({'meta': self.meta, 'positions': self.positions}, f)
+        os.replace(temporary, self.path)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def split_segments(total, count):
+    """Intervalli [inizio, fine) contigui e di dimensione simile"""
+    if total == 0:
+        return [(0, 0)]
+    count = max(1, min(count, -(-total // BATCH_WRITE_LIMIT)))
+    size = -(-total // count)
+    return [(start, min(total, start + size)) for start in range(0, total, size)]
+
+
+class BulkLoader:
+    def __init__(self, client, table_name, items, segments, checkpoint, throttle=None):
+        self.client = client
+        self.table_name = table_name
+        self.items = items
+        self.segments = segments
+        self.checkpoint = checkpoint
+        self.throttle = throttle or AdaptiveThrottle()
+        self.written = 0
+        self._written_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def run(self):
+        """Scrive tutti i segmenti in parallelo; ritorna il numero di item scritti"""
+        reporter = threading.Thread(target=self._report, daemon=True)
+        self._started = time.perf_counter()
+        reporter.start()
+        try:
+            with ThreadPoolExecutor(max_workers=len(self.segments)) as executor:
+                futures = [executor.submit(self._load_segment, i) for i in range(len(self.segments))]
+                try:
+                    for future in futures:
+                        future.result()
+                except BaseException:
+                    self._stop.set()
+                    raise
+        finally:
+            self._stop.set()
+            self.checkpoint.save()
+        return self.written
+
+    def _load_segment(self, segment):
+        _, end = self.segments[segment]
+        position = self.checkpoint.positions[segment]
+        chunks = 0
+        while position < end and not self._stop.is_set():
+            chunk = self.items[position:min(end, position + BATCH_WRITE_LIMIT)]
+            self._write_chunk(chunk)
+            position += len(chunk)
+            chunks += 1
+            self.checkpoint.advance(segment, position, save=chunks % CHECKPOINT_EVERY == 0)
+            with self._written_lock:
+                self.written += len(chunk)
+
+    def _write_chunk(self, items):
+        """batch_write_item con ritentativi (jitter esponenziale) per gli UnprocessedItems"""
+        requests = [{'PutRequest': {'Item': item}} for item in items]
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.throttle.wait()
+            try:
+                response = self.client.batch_write_item(RequestItems={self.table_name: requests})
+            except ClientError as e:
+                if e.response.get('Error', {}).get('Code') not in THROTTLE_ERRORS:
+                    raise
+                response = {'UnprocessedItems': {self.table_name: requests}}
+
+            requests = response.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                self.throttle.on_success()
+                return
+            self.throttle.on_throttle()
+            time.sleep(random.uniform(0, min(MAX_DELAY, BASE_DELAY * 2 ** attempt)))
+        raise RuntimeError(f"{len(requests)} item non scritti dopo {MAX_ATTEMPTS} tentativi")
+
+    def _report(self):
+        while not self._stop.wait(REPORT_INTERVAL):
+            elapsed = time.perf_counter() - self._started
+            print(f"   ⏳ {self.written:,} item scritti, {self.written / elapsed:,.0f} item/s, "
+                  f"ritardo {self.throttle.delay * 1000:.0f} ms")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Caricamento massivo e riprendibile su DynamoDB')
+    parser.add_argument('dataset', choices=('patients', 'vitals'))
+    parser.add_argument('--input', help='default: data/patients.csv | data/processed/chartevents.parquet')
+    parser.add_argument('--patients', default='data/patients.csv',
+                        help='patients.csv per associare SUBJECT_ID e patient_id (solo vitals)')
+    parser.add_argument('--table', help='default: PATIENTS_TABLE / VITAL_SIGNS_TABLE o Patients / VitalSigns')
+    parser.add_argument('--segments', type=int, default=8, help='segmenti scritti in parallelo')
+    parser.add_argument('--checkpoint', help='file di checkpoint (default: <input>.<tabella>.checkpoint.json)')
+    parser.add_argument('--restart', action='store_true', help='ignora un checkpoint esistente')
+    parser.add_argument('--ttl-days', type=float, default=float(os.environ.get('VITALS_TTL_DAYS', 7)),
+                        help='scadenza delle letture in giorni dal caricamento, 0 = nessuna (solo vitals)')
+    args = parser.parse_args(argv)
+
+    if args.dataset == 'patients':
+        path = args.input or 'data/patients.csv'
+        table_name = args.table or aws_clients.table_name('Patients')
+    else:
+        path = args.input or 'data/processed/chartevents.parquet'
+        table_name = args.table or aws_clients.table_name('VitalSigns')
+
+    print(f"[INFO] Caricamento dati da {path} nella tabella {table_name}...")
+    try:
+        items = read_patients(path) if args.dataset == 'patients' else read_vitals(path, args.patients)
+    except FileNotFoundError as e:
+        print(f"[ERROR] File non trovato: {e.filename}")
+        sys.exit(1)
+    if args.dataset == 'vitals' and args.ttl_days > 0:
+        expiration = int(time.time() + args.ttl_days * 86400)
+        for item in items:
+            item['expiration_time'] = expiration
+        print(f"[INFO] TTL: le letture scadono tra {args.ttl_days:g} giorni")
+
+    segments = split_segments(len(items), args.segments)
+    stat = os.stat(path)
+    meta = {'table': table_name, 'input': os.path.abspath(path), 'size': stat.st_size,
+            'mtime': int(stat.st_mtime), 'items': len(items)}
+    checkpoint = Checkpoint(args.checkpoint or f"{path}.{table_name}.checkpoint.json", meta, segments)
+    already_written = 0 if args.restart else checkpoint.resume(segments)
+    if already_written:
+        print(f"[INFO] Ripresa dal checkpoint: {already_written:,}/{len(items):,} item già scritti")
+
+    loader = BulkLoader(aws_clients.dynamodb(), table_name, items, segments, checkpoint)
+    started = time.perf_counter()
+    try:
+        written = loader.run()
+    except KeyboardInterrupt:
+        print(f"\n[INFO] Interrotto: avanzamento salvato in {checkpoint.path}")
+        sys.exit(130)
+    except Exception as e:
+        print(f"[ERROR] Errore durante il caricamento: {e} (avanzamento salvato in {checkpoint.path})")
+        sys.exit(1)
+
+    elapsed = time.perf_counter() - started
+    checkpoint.remove()
+    print(f"[SUCCESS] Caricati {written:,} item in {elapsed:.1f}s "
+          f"({written / elapsed if elapsed else 0:,.0f} item/s, {len(segments)} segmenti, "
+          f"{loader.throttle.throttled} blocchi rallentati).")
+
+
+if __name__ == '__main__':
+    main()
@@ -2,99 +2,233 @@
 """
 Script per svuotare una tabella DynamoDB in modo sicuro
 Uso: python3 clear_dynamodb.py --table Alerts
+
+Lo scan è parallelo (Segment/TotalSegments su più thread), legge solo
+gli attributi chiave e ogni thread usa un unico batch_writer per tutte
+le pagine. Con --older-than e --patient elimina solo i record
+corrispondenti; se la chiave di partizione è patient_id, i pazienti
+indicati vengono letti con Query invece che con uno scan.
 """
 
 import boto3
 import argparse
 import sys
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
+from boto3.dynamodb.conditions import Attr, Key
+
+
+def key_projection(key_names):
+    """ProjectionExpression con i soli attributi chiave (timestamp è una parola riservata)"""
+    names = {f"#k{i}": name for i, name in enumerate(key_names)}
+    return ', '.join(names), names
+
+
+def build_filter(older_than=None, patient_ids=None):
+    """FilterExpression per le eliminazioni mirate (None = tutta la tabella)"""
+    condition = None
+    if older_than:
+        condition = Attr('timestamp').lt(older_than)
+    if patient_ids:
+        by_patient = Attr('patient_id').is_in(list(patient_ids))
+        condition = by_patient if condition is None else condition & by_patient
+    return condition
+
+
+class DeleteProgress:
+    """Contatori condivisi tra i thread e stampa periodica di velocità ed ETA"""
+
+    def __init__(self, estimated_total, interval=2.0):
+        self.estimated_total = estimated_total
+        self.interval = interval
+        self.scanned = 0
+        self.deleted = 0
+        self.started = time.perf_counter()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._report, daemon=True)
+
+    def add(self, scanned=0, deleted=0):
+        with self._lock:
+            self.scanned += scanned
+            self.deleted += deleted
+
+    def start(self):
+        self._thread.start()
 
-def clear_table(table_name, confirm=True):
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def line(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        rate = self.deleted / elapsed
+        scan_rate = self.scanned / elapsed
+        text = f"   🗑️  Eliminati {self.deleted:,} record ({rate:,.0f}/s), letti {self.scanned:,}"
+        # L'ETA si basa sullo scan: item_count è approssimato (aggiornato da DynamoDB ogni ~6 ore)
+        if self.estimated_total and scan_rate > 0:
+            remaining = max(self.estimated_total - self.scanned, 0) / scan_rate
+            text += f", ETA ~{remaining:,.0f}s"
+        return text
+
+    def _report(self):
+        while not self._stop.wait(self.interval):
+            print(self.line())
+
+
+def delete_keys(batch, items, key_names, dry_run):
+    if not dry_run:
+        for item in items:
+            batch.delete_item(Key={name: item[name] for name in key_names})
+    return len(items)
+
+
+def delete_segment(table_name, region, key_names, segment, total_segments,
+                   filter_expression, progress, dry_run):
+    """Scansiona un segmento ed elimina le chiavi con un solo batch_writer"""
+    # Una risorsa per thread (le risorse boto3 non sono thread-safe)
+    table = boto3.session.Session().resource('dynamodb', region_name=region).Table(table_name)
+    projection, names = key_projection(key_names)
+    scan_kwargs = {
+        'ProjectionExpression': projection,
+        'ExpressionAttributeNames': names,
+        'Segment': segment,
+        'TotalSegments': total_segments
+    }
+    if filter_expression is not None:
+        scan_kwargs['FilterExpression'] = filter_expression
+
+    with table.batch_writer() as batch:
+        while True:
+            response = table.scan(**scan_kwargs)
+            items = response.get('Items', [])
+            deleted = delete_keys(batch, items, key_names, dry_run)
+            progress.add(scanned=response.get('ScannedCount', len(items)), deleted=deleted)
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def delete_patient(table_name, region, key_names, patient_id, older_than, progress, dry_run):
+    """Elimina i record di un paziente con Query sulla chiave di partizione"""
+    table = boto3.session.Session().resource('dynamodb', region_name=region).Table(table_name)
+    condition = Key(key_names[0]).eq(patient_id)
+    if older_than and len(key_names) > 1 and key_names[1] == 'timestamp':
+        condition = condition & Key('timestamp').lt(older_than)
+        filter_expression = None
+    else:
+        filter_expression = Attr('timestamp').lt(older_than) if older_than else None
+
+    projection, names = key_projection(key_names)
+    query_kwargs = {
+        'KeyConditionExpression': condition,
+        'ProjectionExpression': projection,
+        'ExpressionAttributeNames': names
+    }
+    if filter_expression is not None:
+        query_kwargs['FilterExpression'] = filter_expression
+
+    with table.batch_writer() as batch:
+        while True:
+            response = table.query(**query_kwargs)
+            items = response.get('Items', [])
+            deleted = delete_keys(batch, items, key_names, dry_run)
+            progress.add(scanned=response.get('ScannedCount', len(items)), deleted=deleted)
+            if 'LastEvaluatedKey' not in response:
+                break
+            query_kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+
+def clear_table(table_name, confirm=True, region='eu-north-1', segments=8,
+                older_than=None, patient_ids=None, dry_run=False):
     """
-    Svuota completamente una tabella DynamoDB
-    
+    Svuota una tabella DynamoDB (o solo i record che corrispondono ai filtri)
+
     Args:
         table_name: Nome della tabella
         confirm: Se True, chiede conferma prima di procedere
+        region: Regione AWS
+        segments: Thread (e segmenti dello scan) in parallelo
+        older_than: Elimina solo i record con timestamp precedente (ISO 8601)
+        patient_ids: Elimina solo i record di questi pazienti
+        dry_run: Conta i record senza eliminarli
     """
-    dynamodb = boto3.resource('dynamodb', region_name='eu-north-1')
-    
+    dynamodb = boto3.resource('dynamodb', region_name=region)
+    targeted = bool(older_than or patient_ids)
+
     try:
         table = dynamodb.Table(table_name)
-        
+
         # 1. Verifica che la tabella esista
         table.load()
-        
+
         # 2. Ottieni info tabella
         item_count = table.item_count
         table_size_bytes = table.table_size_bytes
         key_schema = table.key_schema
-        
+
         print(f"\n📊 Informazioni Tabella: {table_name}")
         print(f"   Record: ~{item_count}")
         print(f"   Dimensione: {table_size_bytes / 1024 / 1024:.2f} MB")
         print(f"   Chiave: {key_schema}")
-        
+        if targeted:
+            print(f"   Filtro: timestamp < {older_than or '-'}, pazienti: {', '.join(patient_ids or []) or 'tutti'}")
+
         # 3. Conferma
-        if confirm:
-            print(f"\n⚠️  ATTENZIONE: Stai per eliminare TUTTI i dati dalla tabella '{table_name}'")
+        if confirm and not dry_run:
+            what = "i record che corrispondono al filtro" if targeted else "TUTTI i dati"
+            print(f"\n⚠️  ATTENZIONE: Stai per eliminare {what} dalla tabella '{table_name}'")
             response = input("   Sei sicuro? Scrivi 'DELETE' per confermare: ")
-            
+
             if response != 'DELETE':
                 print("❌ Operazione annullata")
                 return False
-        
-        # 4. Ottieni il nome della chiave primaria
-        primary_key = key_schema[0]['AttributeName']
-        sort_key = None
-        if len(key_schema) > 1:
-            sort_key = key_schema[1]['AttributeName']
-        
-        print(f"\n🗑️  Inizio eliminazione...")
-        deleted_count = 0
+
+        # 4. Attributi della chiave primaria (partizione ed eventuale ordinamento)
+        key_names = [key['AttributeName'] for key in
+                     sorted(key_schema, key=lambda key: key['KeyType'] != 'HASH')]
+
+        print(f"\n🗑️  Inizio {'conteggio' if dry_run else 'eliminazione'}...")
         start_time = datetime.now()
-        
-        # 5. Scan e delete in batch
-        response = table.scan()
-        
-        while True:
-            items = response.get('Items', [])
-            
-            if not items:
-                break
-            
-            # Delete in batch (max 25 per volta)
-            with table.batch_writer() as batch:
-                for item in items:
-                    # Costruisci la chiave
-                    key = {primary_key: item[primary_key]}
-                    if sort_key:
-                        key[sort_key] = item[sort_key]
-                    
-                    batch.delete_item(Key=key)
-                    deleted_count += 1
-                    
-                    # Progress ogni 100 record
-                    if deleted_count % 100 == 0:
-                        print(f"   🗑️  Eliminati {deleted_count} record...")
-            
-            # Gestisci paginazione
-            if 'LastEvaluatedKey' not in response:
-                break
-            
-            response = table.scan(ExclusiveStartKey=response['LastEvaluatedKey'])
-        
+
+        # 5. Scan (o Query per paziente) e delete in parallelo
+        use_query = bool(patient_ids) and key_names[0] == 'patient_id'
+        progress = DeleteProgress(None if use_query or not item_count else item_count)
+        progress.start()
+        try:
+            if use_query:
+                segments = max(1, min(segments, len(patient_ids)))
+                with ThreadPoolExecutor(max_workers=segments) as executor:
+                    futures = [executor.submit(delete_patient, table_name, region, key_names,
+                                               patient_id, older_than, progress, dry_run)
+                               for patient_id in patient_ids]
+                    for future in futures:
+                        future.result()
+            else:
+                filter_expression = build_filter(older_than, patient_ids)
+                with ThreadPoolExecutor(max_workers=segments) as executor:
+                    futures = [executor.submit(delete_segment, table_name, region, key_names,
+                                               segment, segments, filter_expression, progress, dry_run)
+                               for segment in range(segments)]
+                    for future in futures:
+                        future.result()
+        finally:
+            progress.stop()
+
         # 6. Risultato finale
         end_time = datetime.now()
-        duration = (end_time - start_time).total_seconds()
-        
-        print(f"\n✅ Completato!")
-        print(f"   Totale eliminati: {deleted_count} record")
+        duration = max((end_time - start_time).total_seconds(), 1e-9)
+
+        print("\n✅ Completato!")
+        print(f"   Totale {'trovati' if dry_run else 'eliminati'}: {progress.deleted} record "
+              f"(letti {progress.scanned})")
         print(f"   Tempo impiegato: {duration:.2f} secondi")
-        print(f"   Velocità: {deleted_count / duration:.0f} record/sec")
-        
+        print(f"   Velocità: {progress.deleted / duration:.0f} record/sec con {segments} thread")
+
         return True
-        
+
     except Exception as e:
         print(f"\n❌ Errore: {str(e)}")
         import traceback
@@ -110,48 +244,84 @@ def main():
 Esempi:
   # Svuota la tabella Alerts (con conferma)
   python3 clear_dynamodb.py --table Alerts
-  
+
   # Svuota senza conferma (automatico)
   python3 clear_dynamodb.py --table Alerts --force
-  
+
   # Svuota con regione specifica
   python3 clear_dynamodb.py --table Alerts --region us-east-1
+
+  # Elimina le letture più vecchie di una data, con 16 thread
+  python3 clear_dynamodb.py --table VitalSigns --older-than 2024-01-01 --segments 16
+
+  # Elimina i dati di alcuni pazienti (prima solo conteggio)
+  python3 clear_dynamodb.py --table VitalSigns --patient PT000001 --patient PT000002 --dry-run
         """
     )
-    
+
     parser.add_argument(
         '--table',
         required=True,
         help='Nome della tabella da svuotare'
     )
-    
+
     parser.add_argument(
         '--force',
         action='store_true',
         help='Non chiedere conferma (pericoloso!)'
     )
-    
+
     parser.add_argument(
         '--region',
         default='eu-north-1',
         help='Regione AWS (default: eu-north-1)'
     )
-    
+
+    parser.add_argument(
+        '--segments',
+        type=int,
+        default=8,
+        help='Segmenti dello scan elaborati in parallelo (default: 8, 1 = sequenziale)'
+    )
+
+    parser.add_argument(
+        '--older-than',
+        help='Elimina solo i record con timestamp precedente (ISO 8601, es. 2024-01-01)'
+    )
+
+    parser.add_argument(
+        '--patient',
+        action='append',
+        dest='patients',
+        help='Elimina solo i record di questo paziente (ripetibile)'
+    )
+
+    parser.add_argument(
+        '--dry-run',
+        action='store_true',
+        help='Conta i record che verrebbero eliminati senza eliminarli'
+    )
+
     args = parser.parse_args()
-    
+
     # Banner
     print("=" * 60)
     print("🗑️  DYNAMODB TABLE CLEANER")
     print("=" * 60)
-    
+
     # Esegui
     success = clear_table(
         table_name=args.table,
-        confirm=not args.force
+        confirm=not args.force,
+        region=args.region,
+        segments=max(1, args.segments),
+        older_than=args.older_than,
+        patient_ids=args.patients,
+        dry_run=args.dry_run
     )
-    
+
     sys.exit(0 if success else 1)
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Estrazione in streaming dei parametri vitali da MIMIC-III CHARTEVENTS
+
+CHARTEVENTS completo pesa decine di GB: invece di caricarlo tutto in
+memoria e filtrare dopo, il file viene diviso in blocchi di byte
+(allineati a fine riga) elaborati in parallelo da un pool di processi.
+Ogni processo legge solo il proprio blocco, lo converte con tipi compatti
+(int32/float32), tiene solo i pazienti e gli ITEMID richiesti e
+restituisce le poche righe rimaste. Il risultato è salvato in formato
+colonnare (Parquet o Feather), che i passi successivi caricano in pochi
+secondi senza ripassare dal CSV.
+
+Nota: si assume che nessun campo contenga a capo (vero per CHARTEVENTS).
+
+Uso:
+  python3 scripts/extract_chartevents.py \\
+      --chartevents data/raw/CHARTEVENTS.csv --patients data/raw/PATIENTS.csv \\
+      [--sample-size 200] [--seed 42] [--workers 8] [--block-mb 64] \\
+      [--output data/processed/chartevents_sample.parquet]
+"""
+import io
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+
+# ITEMID MIMIC-III (MetaVision) dei parametri monitorati
+VITAL_SIGNS_ITEMS = {
+    220045: 'heart_rate',
+    220179: 'systolic_bp',
+    220180: 'diastolic_bp',
+    223761: 'temperature',
+    220210: 'respiratory_rate',
+    220277: 'spo2'
+}
+
+# Colonne estratte e relativi tipi compatti (CHARTTIME convertito dopo il filtro)
+COLUMNS = ['SUBJECT_ID', 'ITEMID', 'CHARTTIME', 'VALUENUM']
+DTYPES = {'SUBJECT_ID': 'int32', 'ITEMID': 'int32', 'CHARTTIME': 'string', 'VALUENUM': 'float32'}
+CHARTTIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+DEFAULT_BLOCK_MB = 64
+
+
+def read_header(path):
+    """Nomi delle colonne (in maiuscolo: il dataset demo li ha in minuscolo)"""
+    with open(path, 'rb') as f:
+        header = f.readline()
+    return [name.strip().strip('"').upper() for name in header.decode('utf-8').split(',')], len(header)
+
+
+def split_blocks(path, start, block_size):
+    """Intervalli di byte [inizio, fine) allineati all'inizio di una riga"""
+    size = os.path.getsize(path)
+    blocks = []
+    with open(path, 'rb') as f:
+        while start < size:
+            f.seek(min(start + block_size, size))
+            f.readline()                 # completa la riga a cavallo del confine
+            end = min(f.tell(), size)
+            blocks.append((start, end))
+            start = end
+    return blocks
+
+
+def extract_block(path, start, end, names, subject_ids, item_ids):
+    """Legge un blocco del CSV e restituisce solo le righe richieste"""
+    with open(path, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+
+    block = pd.read_csv(io.BytesIO(data), header=None, names=names,
+                        usecols=COLUMNS, dtype=DTYPES, engine='c')
+    mask = block['ITEMID'].isin(item_ids)
+    if subject_ids is not None:
+        mask &= block['SUBJECT_ID'].isin(subject_ids)
+    return block[mask], len(block)
+
+
+def extract_chartevents(path, subject_ids=None, item_ids=VITAL_SIGNS_ITEMS,
+                        workers=None, block_size=DEFAULT_BLOCK_MB * 1024 * 1024, verbose=True):
+    """
+    Estrae da CHARTEVENTS le misure dei pazienti (None = tutti) e degli
+    ITEMID indicati, in parallelo su `workers` processi.
+    Ritorna un DataFrame con SUBJECT_ID, ITEMID, CHARTTIME (datetime), VALUENUM.
+    """
+    names, header_size = read_header(path)
+    missing = [c for c in COLUMNS if c not in names]
+    if missing:
+        raise ValueError(f"Colonne mancanti in {path}: {missing}")
+
+    subject_ids = None if subject_ids is None else frozenset(int(s) for s in subject_ids)
+    item_ids = frozenset(int(i) for i in item_ids)
+    blocks = split_blocks(path, header_size, block_size)
+    workers = workers or os.cpu_count() or 1
+    total_bytes = os.path.getsize(path)
+
+    if verbose:
+        print(f"📂 {path}: {total_bytes / 1024 ** 2:,.0f} MB in {len(blocks)} blocchi, {workers} processi")
+
+    started = time.perf_counter()
+    parts, rows_read, bytes_done = [], 0, header_size
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(extract_block, path, start, end, names, subject_ids, item_ids)
+                   for start, end in blocks]
+        # Risultati nell'ordine del file, così l'output è deterministico
+        for (start, end), future in zip(blocks, futures):
+            part, rows = future.result()
+            parts.append(part)
+            rows_read += rows
+            bytes_done += end - start
+            if verbose:
+                elapsed = time.perf_counter() - started
+                print(f"   {bytes_done / total_bytes:6.1%}  {rows_read:,} righe lette  "
+                      f"{bytes_done / 1024 ** 2 / max(elapsed, 1e-9):,.0f} MB/s", end='\r')
+
+    result = pd.concat(parts, ignore_index=True) if parts else pd.DataFrame(columns=COLUMNS).astype(DTYPES)
+    result['CHARTTIME'] = pd.to_datetime(result['CHARTTIME'], format=CHARTTIME_FORMAT, errors='coerce')
+
+    if verbose:
+        elapsed = time.perf_counter() - started
+        print(f"\n✅ {len(result):,} misure estratte da {rows_read:,} righe in {elapsed:.1f}s")
+    return result
+
+
+def save_columnar(df, path):
+    """Salva in Parquet o Feather in base all'estensione"""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    if path.endswith('.feather'):
+        df.reset_index(drop=True).to_feather(path)
+    else:
+        df.to_parquet(path, index=False)
+
+
+def load_columnar(path):
+    return pd.read_feather(path) if path.endswith('.feather') else pd.read_parquet(path)
+
+
+def sample_subject_ids(patients_path, sample_size, seed):
+    """Stesso campione del notebook (patients.sample con random_state)"""
+    if sample_size <= 0:
+        return None          # nessun filtro sui pazienti
+    patients = pd.read_csv(patients_path, usecols=lambda c: c.upper() == 'SUBJECT_ID')
+    patients.columns = ['SUBJECT_ID']
+    if sample_size >= len(patients):
+        return patients['SUBJECT_ID'].tolist()
+    return patients.sample(n=sample_size, random_state=seed)['SUBJECT_ID'].tolist()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Estrazione parallela dei parametri vitali da CHARTEVENTS')
+    parser.add_argument('--chartevents', default='data/raw/CHARTEVENTS.csv')
+    parser.add_argument('--patients', default='data/raw/PATIENTS.csv',
+                        help='PATIENTS.csv da cui campionare i pazienti')
+    parser.add_argument('--sample-size', type=int, default=200, help='0 = tutti i pazienti')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workers', type=int, default=None, help='Processi (default: numero di CPU)')
+    parser.add_argument('--block-mb', type=int, default=DEFAULT_BLOCK_MB, help='Dimensione dei blocchi in MB')
+    parser.add_argument('--output', default='data/processed/chartevents_sample.parquet',
+                        help='File di output (.parquet o .feather)')
+    args = parser.parse_args()
+
+    try:
+        subject_ids = sample_subject_ids(args.patients, args.sample_size, args.seed)
+        print(f"👥 {len(subject_ids) if subject_ids else 'Tutti i'} pazienti selezionati")
+        events = extract_chartevents(args.chartevents, subject_ids, workers=args.workers,
+                                     block_size=args.block_mb * 1024 * 1024)
+        save_columnar(events, args.output)
+        print(f"💾 Salvato {args.output}")
+    except FileNotFoundError as e:
+        print(f"❌ File non trovato: {e.filename}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Calcolo vettoriale delle baseline e dello stato clinico dei pazienti
+
+Sostituisce il ciclo per paziente del notebook (iterrows + filtro
+dell'intero chartevents per ogni paziente e per ogni ITEMID, costo
+O(pazienti × misure)) con un unico groupby per (SUBJECT_ID, ITEMID) e un
+pivot: costo lineare nel numero di misure.
+
+Oltre alla media (baseline_hr, baseline_bp_sys, ...) può calcolare
+statistiche aggiuntive per le regole relative alla baseline, con nomi
+baseline_<parametro>_<statistica>:
+  median, std, count, pNN (percentile, es. p05, p95)
+es. baseline_hr_p95, baseline_spo2_median.
+
+Uso:
+  python3 scripts/patient_baselines.py --chartevents data/processed/chartevents.parquet \\
+      [--stats median std p05 p95] [--output data/processed/baselines.csv]
+"""
+import re
+import argparse
+
+import numpy as np
+import pandas as pd
+
+# ITEMID -> parametro (suffisso delle colonne baseline_*)
+BASELINE_ITEMS = {
+    220045: 'hr',
+    220179: 'bp_sys',
+    220180: 'bp_dia',
+    223761: 'temp',
+    220277: 'spo2'
+}
+
+# Valori usati quando un parametro non ha misure (come nel notebook)
+DEFAULT_BASELINES = {'hr': 75, 'bp_sys': 120, 'bp_dia': 80, 'temp': 36, 'spo2': 98}
+
+# Soglie di stato sulle baseline medie: (stato, hr >, bp_sys >)
+STATUS_THRESHOLDS = (('critical', 100, 140), ('warning', 85, 130))
+
+PERCENTILE_PATTERN = re.compile(r'^p(\d{1,2})$')
+
+
+def parse_stat(stat):
+    """'median' | 'std' | 'count' | 'pNN' -> (nome, quantile o None)"""
+    if stat in ('median', 'std', 'count'):
+        return stat, None
+    match = PERCENTILE_PATTERN.match(stat)
+    if not match:
+        raise ValueError(f"Statistica non supportata: {stat} (median, std, count, pNN)")
+    return stat, int(match.group(1)) / 100
+
+
+def compute_baselines(chartevents, subject_ids=None, stats=(), decimals=1):
+    """
+    Baseline e stato per paziente in un solo passaggio.
+
+    chartevents: DataFrame con SUBJECT_ID, ITEMID, VALUENUM
+    subject_ids: pazienti da includere (anche senza misure); None = quelli presenti
+    stats: statistiche aggiuntive (median, std, count, pNN)
+
+    Ritorna un DataFrame indicizzato per SUBJECT_ID con status,
+    baseline_<parametro> e baseline_<parametro>_<statistica>.
+    """
+    parsed = [parse_stat(s) for s in stats]
+    events = chartevents.loc[chartevents['ITEMID'].isin(BASELINE_ITEMS.keys()),
+                             ['SUBJECT_ID', 'ITEMID', 'VALUENUM']]
+    grouped = events.groupby(['SUBJECT_ID', 'ITEMID'], sort=False)['VALUENUM']
+
+    # Una colonna per (statistica, ITEMID), una riga per paziente
+    aggregations = ['mean'] + [name for name, q in parsed if q is None]
+    table = grouped.agg(aggregations).unstack('ITEMID')
+    for name, q in parsed:
+        if q is not None:
+            quantile = grouped.quantile(q).unstack('ITEMID')
+            quantile.columns = pd.MultiIndex.from_product([[name], quantile.columns])
+            table = table.join(quantile, how='outer')
+
+    if subject_ids is None:
+        index = table.index
+    else:
+        index = pd.Index(pd.unique(np.asarray(subject_ids)), name='SUBJECT_ID')
+    result = pd.DataFrame(index=index)
+    result.index.name = 'SUBJECT_ID'
+
+    def column(stat, itemid):
+        if (stat, itemid) in table.columns:
+            return table[(stat, itemid)].reindex(index).astype('float64')
+        return pd.Series(np.nan, index=index)
+
+    # Medie, con default per i parametri senza misure
+    for itemid, param in BASELINE_ITEMS.items():
+        result[f"baseline_{param}"] = column('mean', itemid).fillna(DEFAULT_BASELINES[param])
+
+    # Stato clinico dalle baseline medie
+    hr, bp_sys = result['baseline_hr'], result['baseline_bp_sys']
+    conditions = [(hr > hr_limit) | (bp_sys > sys_limit) for _, hr_limit, sys_limit in STATUS_THRESHOLDS]
+    result['status'] = np.select(conditions, [status for status, _, _ in STATUS_THRESHOLDS], default='stable')
+
+    # Statistiche aggiuntive (NaN se il parametro non ha misure)
+    for name, _ in parsed:
+        for itemid, param in BASELINE_ITEMS.items():
+            values = column(name, itemid)
+            result[f"baseline_{param}_{name}"] = values.fillna(0).astype('int64') if name == 'count' else values
+
+    return result.round(decimals)
+
+
+def legacy_baselines(patients, chartevents):
+    """Algoritmo originale del notebook (per confronto nei benchmark)"""
+    patient_status = []
+    for _, patient in patients.iterrows():
+        subject_id = patient['SUBJECT_ID']
+        patient_vitals = chartevents[chartevents['SUBJECT_ID'] == subject_id]
+        if len(patient_vitals) == 0:
+            status = 'stable'
+            hr_baseline, bp_sys_baseline, bp_dia_baseline, baseline_temp, baseline_spo2 = 75, 120, 80, 36, 98
+        else:
+            hr_data = patient_vitals[patient_vitals['ITEMID'] == 220045]['VALUENUM']
+            bp_sys_data = patient_vitals[patient_vitals['ITEMID'] == 220179]['VALUENUM']
+            bp_dia_data = patient_vitals[patient_vitals['ITEMID'] == 220180]['VALUENUM']
+            hr_baseline = hr_data.mean() if len(hr_data) > 0 else 75
+            bp_sys_baseline = bp_sys_data.mean() if len(bp_sys_data) > 0 else 120
+            bp_dia_baseline = bp_dia_data.mean() if len(bp_dia_data) > 0 else 80
+            temp_data = patient_vitals[patient_vitals['ITEMID'] == 223761]['VALUENUM']
+            baseline_temp = temp_data.mean() if len(temp_data) > 0 else 36
+            spo2_data = patient_vitals[patient_vitals['ITEMID'] == 220277]['VALUENUM']
+            baseline_spo2 = spo2_data.mean() if len(spo2_data) > 0 else 98
+            if hr_baseline > 100 or bp_sys_baseline > 140:
+                status = 'critical'
+            elif hr_baseline > 85 or bp_sys_baseline > 130:
+                status = 'warning'
+            else:
+                status = 'stable'
+        patient_status.append({
+            'SUBJECT_ID': subject_id,
+            'status': status,
+            'baseline_hr': round(hr_baseline, 1),
+            'baseline_bp_sys': round(bp_sys_baseline, 1),
+            'baseline_bp_dia': round(bp_dia_baseline, 1),
+            'baseline_temp': round(baseline_temp, 1),
+            'baseline_spo2': round(baseline_spo2, 1),
+        })
+    return pd.DataFrame(patient_status).set_index('SUBJECT_ID')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Baseline e stato clinico dei pazienti da chartevents')
+    parser.add_argument('--chartevents', default='data/processed/chartevents.parquet',
+                        help='Misure (.parquet, .feather o .csv)')
+    parser.add_argument('--stats', nargs='*', default=[], help='Statistiche aggiuntive: median std count pNN')
+    parser.add_argument('--output', default='data/processed/baselines.csv')
+    args = parser.parse_args()
+
+    path = args.chartevents
+    if path.endswith('.parquet'):
+        chartevents = pd.read_parquet(path, columns=['SUBJECT_ID', 'ITEMID', 'VALUENUM'])
+    elif path.endswith('.feather'):
+        chartevents = pd.read_feather(path, columns=['SUBJECT_ID', 'ITEMID', 'VALUENUM'])
+    else:
+        chartevents = pd.read_csv(path, usecols=['SUBJECT_ID', 'ITEMID', 'VALUENUM'])
+
+    baselines = compute_baselines(chartevents, stats=args.stats)
+    baselines.to_csv(args.output)
+    print(f"✅ Baseline di {len(baselines)} pazienti salvate in {args.output}")
+    print(baselines['status'].value_counts().to_string())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,415 @@
+#!/usr/bin/env python3
+"""
+Archivio a due livelli delle letture VitalSigns
+
+DynamoDB tiene solo la finestra "calda": simulatore e bulk_loader
+impostano il TTL (expiration_time, VITALS_TTL_DAYS giorni). Questo script
+sposta le letture vecchie o in scadenza in un archivio Parquet "freddo"
+e rilegge da lì lo storico di lungo periodo.
+
+- export: scan parallelo (Segment/TotalSegments, client di basso livello,
+  nessun Decimal) con filtro su timestamp (--older-than-days) e/o su
+  expiration_time (--expiring-within-hours). Gli item sono decodificati
+  in colonne con stream_records.decode_columns (stesso schema dello
+  stream) e scritti a blocchi in Parquet partizionato in stile Hive:
+      <root>/date=YYYY-MM-DD/patient_id=<id>/part-<run>-<segmento>-<blocco>-<n>.parquet
+  La radice è una cartella locale o un URI s3:// (anche MinIO/LocalStack
+  con --endpoint-url). Con --delete le letture archiviate vengono rimosse
+  da DynamoDB solo dopo che il loro blocco è stato scritto.
+- read / HistoryReader: lo storico di un paziente in un intervallo.
+  Con start ed end vengono elencate solo le cartelle date=/patient_id=
+  dell'intervallo (niente discovery dell'intero archivio); i duplicati
+  (stessa lettura esportata due volte) sono scartati. HistoryReader
+  unisce archivio e finestra calda su DynamoDB (che prevale).
+
+L'esportazione è idempotente rispetto alla lettura: riesportare le stesse
+letture crea file in più, ma read_archive restituisce una riga per
+(patient_id, timestamp).
+
+Uso:
+  python3 scripts/vitals_archive.py export --root data/archive/vitals
+      [--older-than-days 7] [--expiring-within-hours 24] [--segments 8] [--delete]
+  python3 scripts/vitals_archive.py read --root s3://bucket/vitals --patient PT000001
+      [--start 2024-01-01] [--end 2024-02-01] [--hot] [--output storico.parquet]
+  opzioni comuni: [--table NOME] [--endpoint-url URL]
+"""
+import os
+import sys
+import time
+import uuid
+import argparse
+import threading
+from urllib.parse import quote
+from datetime import date, datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.fs as pafs
+import pyarrow.parquet as pq
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'lambda', 'shared', 'python'))
+
+import aws_clients  # noqa: E402
+import serialization  # noqa: E402
+from stream_records import VITAL_FIELDS, decode_columns  # noqa: E402
+from boto3.dynamodb.conditions import Key  # noqa: E402
+
+# Colonne dell'archivio (date e patient_id sono anche le partizioni)
+ARCHIVE_SCHEMA = pa.schema(
+    [('patient_id', pa.string()), ('timestamp', pa.string()), ('patient_name', pa.string()),
+     ('status', pa.string())]
+    + [(field, pa.float64()) for field in VITAL_FIELDS + ('ingest_time',)]
+    + [('date', pa.string())])
+PARTITIONING = ds.partitioning(pa.schema([('date', pa.string()), ('patient_id', pa.string())]),
+                               flavor='hive')
+
+# Attributi letti da DynamoDB (timestamp è una parola riservata)
+HOT_FIELDS = tuple(name for name in ARCHIVE_SCHEMA.names if name != 'date')
+
+# Righe per file scritto (e per blocco eliminato con --delete)
+CHUNK_ROWS = 50000
+# Un blocco tocca al più (giorni × pazienti) cartelle
+MAX_PARTITIONS = 100000
+
+BATCH_WRITE_LIMIT = 25
+MAX_ATTEMPTS = 10
+BASE_DELAY = 0.05
+MAX_DELAY = 2.0
+
+
+def open_root(root, endpoint_url=None):
+    """Radice dell'archivio -> (filesystem pyarrow, percorso)"""
+    if root.startswith('s3://'):
+        if endpoint_url:
+            bucket_path = root[len('s3://'):].rstrip('/')
+            return pafs.S3FileSystem(endpoint_override=endpoint_url,
+                                     region=aws_clients.REGION_NAME), bucket_path
+        return pafs.FileSystem.from_uri(root.rstrip('/'))
+    return pafs.LocalFileSystem(), os.path.abspath(root)
+
+
+def scan_filter(older_than=None, expiring_before=None):
+    """FilterExpression dello scan: timestamp vecchio OPPURE in scadenza"""
+    conditions, names, values = [], {}, {}
+    if older_than:
+        conditions.append('#ts < :older_than')
+        names['#ts'] = 'timestamp'
+        values[':older_than'] = {'S': older_than}
+    if expiring_before:
+        conditions.append('expiration_time < :expiring_before')
+        values[':expiring_before'] = {'N': str(int(expiring_before))}
+    if not conditions:
+        raise ValueError("Serve almeno un criterio: older_than o expiring_before")
+    scan = {'FilterExpression': ' OR '.join(conditions), 'ExpressionAttributeValues': values}
+    if names:
+        scan['ExpressionAttributeNames'] = names
+    return scan
+
+
+def items_to_table(items):
+    """
+    Item di basso livello -> (tabella Arrow con ARCHIVE_SCHEMA, item non validi).
+    Gli item passano dal decoder dello stream come se fossero NewImage.
+    """
+    records = [{'eventName': 'INSERT', 'dynamodb': {'NewImage': item}} for item in items]
+    columns, errors = decode_columns(records)
+    arrays = [
+        pa.array(columns.patient_ids, pa.string()),
+        pa.array(columns.timestamps, pa.string()),
+        pa.array(columns.names, pa.string()),
+        pa.array(columns.statuses, pa.string()),
+    ]
+    # NaN (attributo mancante) -> null
+    arrays += [pa.array(np.frombuffer(columns.numbers[field], dtype=np.float64), from_pandas=True)
+               for field in VITAL_FIELDS + ('ingest_time',)]
+    arrays.append(pa.array([timestamp[:10] for timestamp in columns.timestamps], pa.string()))
+    return pa.Table.from_arrays(arrays, schema=ARCHIVE_SCHEMA), [items[index] for index, _ in errors]
+
+
+def write_table(table, filesystem, path, basename):
+    """Scrive un blocco nelle partizioni date=/patient_id= (nomi file univoci per blocco)"""
+    ds.write_dataset(table, path, filesystem=filesystem, format='parquet',
+                     partitioning=PARTITIONING, basename_template=f"{basename}-{{i}}.parquet",
+                     existing_data_behavior='overwrite_or_ignore', max_partitions=MAX_PARTITIONS)
+
+
+def delete_keys(client, table_name, keys):
+    """Elimina le chiavi a blocchi di 25, ritentando gli UnprocessedItems"""
+    for i in range(0, len(keys), BATCH_WRITE_LIMIT):
+        requests = [{'DeleteRequest': {'Key': key}} for key in keys[i:i + BATCH_WRITE_LIMIT]]
+        for attempt in range(MAX_ATTEMPTS):
+            response = client.batch_write_item(RequestItems={table_name: requests})
+            requests = response.get('UnprocessedItems', {}).get(table_name, [])
+            if not requests:
+                break
+            time.sleep(min(MAX_DELAY, BASE_DELAY * 2 ** attempt))
+        else:
+            raise RuntimeError(f"{len(requests)} eliminazioni non completate dopo {MAX_ATTEMPTS} tentativi")
+
+
+class ExportStats:
+    """Contatori condivisi tra i thread dell'esportazione"""
+
+    def __init__(self):
+        self.scanned = 0
+        self.archived = 0
+        self.deleted = 0
+        self.invalid = 0
+        self.files = 0
+        self._lock = threading.Lock()
+
+    def add(self, **counts):
+        with self._lock:
+            for name, count in counts.items():
+                setattr(self, name, getattr(self, name) + count)
+
+
+class ArchiveExporter:
+    """Esportazione parallela VitalSigns -> Parquet (una istanza per esecuzione)"""
+
+    def __init__(self, client, table_name, filesystem, path, scan, segments=8,
+                 delete=False, chunk_rows=CHUNK_ROWS):
+        self.client = client
+        self.table_name = table_name
+        self.filesystem = filesystem
+        self.path = path
+        self.scan = scan
+        self.segments = segments
+        self.delete = delete
+        self.chunk_rows = chunk_rows
+        self.run_id = f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:8]}"
+        self.stats = ExportStats()
+
+    def run(self):
+        with ThreadPoolExecutor(max_workers=self.segments) as executor:
+            futures = [executor.submit(self._export_segment, segment) for segment in range(self.segments)]
+            for future in futures:
+                future.result()
+        return self.stats
+
+    def _export_segment(self, segment):
+        scan = dict(self.scan, TableName=self.table_name, Segment=segment, TotalSegments=self.segments)
+        pending = []
+        chunk = 0
+        while True:
+            response = self.client.scan(**scan)
+            pending.extend(response.get('Items', []))
+            self.stats.add(scanned=response.get('ScannedCount', 0))
+            if len(pending) >= self.chunk_rows:
+                self._flush(pending, segment, chunk)
+                pending, chunk = [], chunk + 1
+            if 'LastEvaluatedKey' not in response:
+                break
+            scan['ExclusiveStartKey'] = response['LastEvaluatedKey']
+        if pending:
+            self._flush(pending, segment, chunk)
+
+    def _flush(self, items, segment, chunk):
+        table, invalid = items_to_table(items)
+        if invalid:
+            print(f"   ⚠️  {len(invalid)} letture non conformi allo schema lasciate in DynamoDB")
+        self.stats.add(invalid=len(invalid))
+        if table.num_rows:
+            write_table(table, self.filesystem, self.path, f"part-{self.run_id}-{segment:03d}-{chunk:05d}")
+            self.stats.add(archived=table.num_rows, files=1)
+        # Solo le letture appena scritte (le non valide restano in tabella)
+        if self.delete and table.num_rows:
+            keys = [{'patient_id': {'S': pid}, 'timestamp': {'S': timestamp}}
+                    for pid, timestamp in zip(table['patient_id'].to_pylist(), table['timestamp'].to_pylist())]
+            delete_keys(self.client, self.table_name, keys)
+            self.stats.add(deleted=len(keys))
+
+
+# --- Lettura ---
+
+def _day_range(start, end):
+    first = date.fromisoformat(start[:10])
+    last = date.fromisoformat(end[:10])
+    return [(first + timedelta(days=i)).isoformat() for i in range((last - first).days + 1)]
+
+
+def archive_dataset(filesystem, path, patient_id=None, start=None, end=None):
+    """
+    Dataset Arrow dell'archivio. Con paziente, start ed end elenca solo le
+    cartelle dei giorni richiesti, altrimenti esplora l'intera radice.
+    """
+    if patient_id is None or start is None or end is None:
+        return ds.dataset(path, filesystem=filesystem, format='parquet', partitioning=PARTITIONING)
+    files = []
+    for day in _day_range(start, end):
+        folder = f"{path}/date={quote(day, safe='')}/patient_id={quote(patient_id, safe='')}"
+        selector = pafs.FileSelector(folder, allow_not_found=True)
+        files.extend(info.path for info in filesystem.get_file_info(selector)
+                     if info.type == pafs.FileType.File and info.path.endswith('.parquet'))
+    return ds.dataset(files, schema=ARCHIVE_SCHEMA, filesystem=filesystem, format='parquet',
+                      partitioning=PARTITIONING, partition_base_dir=path)
+
+
+def read_archive(filesystem, path, patient_id, start=None, end=None):
+    """
+    Letture archiviate di un paziente con start <= timestamp < end, ordinate
+    e senza duplicati (tabella Arrow senza la colonna date)
+    """
+    condition = ds.field('patient_id') == patient_id
+    if start:
+        condition &= (ds.field('date') >= start[:10]) & (ds.field('timestamp') >= start)
+    if end:
+        condition &= (ds.field('date') <= end[:10]) & (ds.field('timestamp') < end)
+    try:
+        dataset = archive_dataset(filesystem, path, patient_id, start, end)
+    except FileNotFoundError:
+        return ARCHIVE_SCHEMA.empty_table().drop_columns(['date'])
+    table = dataset.to_table(columns=list(HOT_FIELDS), filter=condition).sort_by('timestamp')
+    if table.num_rows > 1:
+        timestamps = table['timestamp']
+        changed = pc.not_equal(timestamps.slice(1), timestamps.slice(0, table.num_rows - 1))
+        table = table.filter(pa.concat_arrays([pa.array([True])] + changed.chunks))
+    return table
+
+
+class HistoryReader:
+    """Storico di lungo periodo: archivio Parquet + finestra calda DynamoDB"""
+
+    def __init__(self, root, endpoint_url=None, vitals_table=None):
+        self.filesystem, self.path = open_root(root, endpoint_url)
+        self.vitals_table = vitals_table
+
+    def archived(self, patient_id, start=None, end=None):
+        return read_archive(self.filesystem, self.path, patient_id, start, end).to_pylist()
+
+    def hot(self, patient_id, start=None, end=None):
+        """Letture ancora in DynamoDB (numeri nativi, stessi campi dell'archivio)"""
+        if self.vitals_table is None:
+            self.vitals_table = aws_clients.table('VitalSigns', native_numbers=True)
+        condition = Key('patient_id').eq(patient_id)
+        if start and end:
+            condition &= Key('timestamp').between(start, end)
+        elif start:
+            condition &= Key('timestamp').gte(start)
+        elif end:
+            condition &= Key('timestamp').lte(end)
+        names = {f"#f{i}": field for i, field in enumerate(HOT_FIELDS)}
+        query = {'KeyConditionExpression': condition, 'ProjectionExpression': ', '.join(names),
+                 'ExpressionAttributeNames': names}
+        items = []
+        while True:
+            response = self.vitals_table.query(**query)
+            # between è inclusivo: l'estremo end resta escluso come nell'archivio
+            items.extend(item for item in response['Items'] if not end or item['timestamp'] < end)
+            if 'LastEvaluatedKey' not in response:
+                return items
+            query['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    def history(self, patient_id, start=None, end=None, include_hot=True):
+        """Letture ordinate per timestamp; a parità di chiave prevale DynamoDB"""
+        readings = {row['timestamp']: row for row in self.archived(patient_id, start, end)}
+        if include_hot:
+            for item in self.hot(patient_id, start, end):
+                readings[item['timestamp']] = {field: item.get(field) for field in HOT_FIELDS}
+        return [readings[timestamp] for timestamp in sorted(readings)]
+
+
+# --- Riga di comando ---
+
+def export_command(args):
+    now = time.time()
+    older_than = None
+    if args.older_than_days is not None:
+        # Stesso orologio degli scrittori: vitals-simulator gira in Lambda, dove
+        # datetime.now() è UTC, e scrive timestamp ISO senza fuso. #ts è
+        # confrontato come stringa, quindi il limite è UTC e senza offset
+        cutoff = datetime.now(timezone.utc) - timedelta(days=args.older_than_days)
+        older_than = cutoff.replace(tzinfo=None).isoformat()
+    expiring_before = now + args.expiring_within_hours * 3600 if args.expiring_within_hours is not None else None
+    try:
+        scan = scan_filter(older_than, expiring_before)
+    except ValueError as e:
+        print(f"❌ {e} (--older-than-days / --expiring-within-hours)")
+        sys.exit(2)
+
+    table_name = args.table or aws_clients.table_name('VitalSigns')
+    filesystem, path = open_root(args.root, args.endpoint_url)
+    print(f"📦 Archiviazione {table_name} -> {args.root}")
+    print(f"   Filtro: timestamp < {older_than or '-'}, scadenza < "
+          f"{datetime.fromtimestamp(expiring_before, timezone.utc).isoformat() if expiring_before else '-'}"
+          f"{', con eliminazione' if args.delete else ''}")
+
+    # Client di basso livello: filtro, item scansionati e chiavi da eliminare
+    # sono già in formato AttributeValue ({'S': ...}), come li vuole decode_columns
+    exporter = ArchiveExporter(aws_clients.client('dynamodb'), table_name, filesystem, path, scan,
+                               segments=max(1, args.segments), delete=args.delete,
+                               chunk_rows=args.chunk_rows)
+    started = time.perf_counter()
+    try:
+        stats = exporter.run()
+    except Exception as e:
+        print(f"❌ Errore durante l'archiviazione: {e} (i blocchi già scritti restano nell'archivio)")
+        sys.exit(1)
+    elapsed = max(time.perf_counter() - started, 1e-9)
+    print(f"✅ Archiviate {stats.archived:,} letture in {stats.files} blocchi "
+          f"(lette {stats.scanned:,}, eliminate {stats.deleted:,}, non valide {stats.invalid}) "
+          f"in {elapsed:.1f}s ({stats.archived / elapsed:,.0f} letture/s)")
+
+
+def read_command(args):
+    reader = HistoryReader(args.root, args.endpoint_url,
+                           aws_clients.table(args.table, native_numbers=True) if args.table else None)
+    started = time.perf_counter()
+    if args.hot:
+        rows = reader.history(args.patient, args.start, args.end)
+        table = pa.Table.from_pylist(rows, schema=ARCHIVE_SCHEMA.remove(ARCHIVE_SCHEMA.get_field_index('date')))
+    else:
+        table = read_archive(reader.filesystem, reader.path, args.patient, args.start, args.end)
+    elapsed = time.perf_counter() - started
+
+    if args.output and args.output.endswith('.parquet'):
+        pq.write_table(table, args.output)
+    elif args.output:
+        with open(args.output, 'w', encoding='utf-8') as out:
+            for row in table.to_pylist():
+                out.write(serialization.dumps(row) + '\n')
+    else:
+        for row in table.to_pylist():
+            print(serialization.dumps(row))
+    print(f"📈 {table.num_rows:,} letture di {args.patient} in {elapsed * 1000:.0f}ms", file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Archivio Parquet delle letture VitalSigns')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    export = commands.add_parser('export', help='sposta le letture vecchie o in scadenza in Parquet')
+    export.add_argument('--older-than-days', type=float,
+                        help='letture con timestamp più vecchio di N giorni')
+    export.add_argument('--expiring-within-hours', type=float,
+                        help='letture il cui TTL scade entro N ore')
+    export.add_argument('--segments', type=int, default=8, help='segmenti dello scan in parallelo')
+    export.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help='righe per blocco scritto')
+    export.add_argument('--delete', action='store_true',
+                        help='elimina da DynamoDB le letture archiviate')
+    export.set_defaults(func=export_command)
+
+    read = commands.add_parser('read', help='storico di un paziente dall\'archivio')
+    read.add_argument('--patient', required=True)
+    read.add_argument('--start', help='timestamp ISO 8601 iniziale (incluso)')
+    read.add_argument('--end', help='timestamp ISO 8601 finale (escluso)')
+    read.add_argument('--hot', action='store_true', help='unisce le letture ancora in DynamoDB')
+    read.add_argument('--output', help='file .parquet o JSON lines (default: stdout)')
+    read.set_defaults(func=read_command)
+
+    for command in (export, read):
+        command.add_argument('--root', required=True, help='cartella locale o s3://bucket/prefisso')
+        command.add_argument('--table', help='default: VITAL_SIGNS_TABLE o VitalSigns')
+        command.add_argument('--endpoint-url', default=os.environ.get('ARCHIVE_ENDPOINT_URL'),
+                             help='endpoint S3 compatibile (MinIO, LocalStack)')
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
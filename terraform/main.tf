@@ -40,6 +40,12 @@ variable "alert_email" {
   default     = "your.email@example.com"
 }
 
+variable "numpy_layer_arn" {
+  description = "ARN of a Lambda layer providing NumPy (e.g. AWS SDK for pandas); empty = per-record rule evaluation and simulation"
+  type        = string
+  default     = ""
+}
+
 # ===== LOCAL VARIABLES =====
 locals {
   name_prefix = "${var.project_name}-${var.environment}"
@@ -172,6 +178,8 @@ resource "aws_dynamodb_table" "vital_signs" {
   stream_enabled   = true
   stream_view_type = "NEW_IMAGE"
 
+  # Finestra calda: expiration_time impostato da simulatore e bulk_loader
+  # (VITALS_TTL_DAYS); lo storico va archiviato con scripts/vitals_archive.py
   ttl {
     attribute_name = "expiration_time"
     enabled        = true
@@ -190,6 +198,69 @@ resource "aws_dynamodb_table" "alerts" {
     type = "S"
   }
 
+  attribute {
+    name = "patient_id"
+    type = "S"
+  }
+
+  attribute {
+    name = "timestamp"
+    type = "S"
+  }
+
+  # Allarmi di un paziente dal più recente (api-handler)
+  global_secondary_index {
+    name            = "patient_id-timestamp-index"
+    hash_key        = "patient_id"
+    range_key       = "timestamp"
+    projection_type = "ALL"
+  }
+
+  tags = local.common_tags
+}
+
+# Finestre di deduplicazione allarmi per (paziente, tipo violazione)
+resource "aws_dynamodb_table" "alert_suppression" {
+  name         = "AlertSuppression-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "dedup_key"
+
+  attribute {
+    name = "dedup_key"
+    type = "S"
+  }
+
+  ttl {
+    attribute_name = "expires_at"
+    enabled        = true
+  }
+
+  tags = local.common_tags
+}
+
+# Rollup 1m/15m/1h dei parametri vitali per paziente (storico della vista dettaglio)
+resource "aws_dynamodb_table" "vital_rollups" {
+  name         = "VitalRollups-${var.environment}"
+  billing_mode = "PAY_PER_REQUEST"
+  hash_key     = "series"
+  range_key    = "bucket"
+
+  attribute {
+    name = "series"
+    type = "S"
+  }
+
+  attribute {
+    name = "bucket"
+    type = "S"
+  }
+
+  # Conservazione diversa per risoluzione (impostata da alert-detector)
+  ttl {
+    attribute_name = "expiration_time"
+    enabled        = true
+  }
+
   tags = local.common_tags
 }
 
@@ -252,9 +323,12 @@ resource "aws_iam_role_policy" "lambda_dynamodb" {
       Action = [
         "dynamodb:PutItem",
         "dynamodb:GetItem",
+        "dynamodb:BatchGetItem",
+        "dynamodb:UpdateItem",
         "dynamodb:Scan",
         "dynamodb:Query",
         "dynamodb:DeleteItem",
+        "dynamodb:BatchWriteItem",
         "dynamodb:DescribeStream",
         "dynamodb:GetRecords",
         "dynamodb:GetShardIterator",
@@ -264,6 +338,9 @@ resource "aws_iam_role_policy" "lambda_dynamodb" {
         aws_dynamodb_table.patients.arn,
         aws_dynamodb_table.vital_signs.arn,
         aws_dynamodb_table.alerts.arn,
+        "${aws_dynamodb_table.alerts.arn}/index/*",
+        aws_dynamodb_table.alert_suppression.arn,
+        aws_dynamodb_table.vital_rollups.arn,
         aws_dynamodb_table.websocket_connections.arn,
         "${aws_dynamodb_table.vital_signs.arn}/stream/*"
       ]
@@ -302,6 +379,21 @@ resource "aws_iam_role_policy" "lambda_apigateway" {
 #   })
 # }
 
+# ===== LAMBDA LAYER (codice condiviso) =====
+data "archive_file" "shared_layer" {
+  type        = "zip"
+  source_dir  = "../lambda/shared"
+  excludes    = ["python/__pycache__"]
+  output_path = "${path.module}/builds/shared_layer.zip"
+}
+
+resource "aws_lambda_layer_version" "shared" {
+  filename            = data.archive_file.shared_layer.output_path
+  layer_name          = "${local.name_prefix}-shared"
+  compatible_runtimes = ["python3.11"]
+  source_code_hash    = data.archive_file.shared_layer.output_base64sha256
+}
+
 # ===== LAMBDA FUNCTIONS =====
 data "archive_file" "vitals_simulator" {
   type        = "zip"
@@ -316,12 +408,16 @@ resource "aws_lambda_function" "vitals_simulator" {
   handler         = "app.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
+  memory_size     = 512
   source_code_hash = data.archive_file.vitals_simulator.output_base64sha256
+  layers          = concat([aws_lambda_layer_version.shared.arn], var.numpy_layer_arn != "" ? [var.numpy_layer_arn] : [])
 
   environment {
     variables = {
       PATIENTS_TABLE    = aws_dynamodb_table.patients.name
       VITAL_SIGNS_TABLE = aws_dynamodb_table.vital_signs.name
+      SIMULATOR_WORKERS = "8"
+      VITALS_TTL_DAYS   = "7"
       ENVIRONMENT       = var.environment
     }
   }
@@ -331,7 +427,8 @@ resource "aws_lambda_function" "vitals_simulator" {
 
 data "archive_file" "alert_detector" {
   type        = "zip"
-  source_file = "../lambda/alert-detector/app.py"
+  source_dir  = "../lambda/alert-detector"
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/builds/alert_detector.zip"
 }
 
@@ -342,16 +439,25 @@ resource "aws_lambda_function" "alert_detector" {
   handler         = "app.lambda_handler"
   runtime         = "python3.11"
   timeout         = 30
+  layers          = concat([aws_lambda_layer_version.shared.arn], var.numpy_layer_arn != "" ? [var.numpy_layer_arn] : [])
   source_code_hash = data.archive_file.alert_detector.output_base64sha256
 
   environment {
     variables = {
       ALERTS_TABLE       = aws_dynamodb_table.alerts.name
       CONNECTIONS_TABLE  = aws_dynamodb_table.websocket_connections.name
+      PATIENTS_TABLE     = aws_dynamodb_table.patients.name
+      VITAL_SIGNS_TABLE  = aws_dynamodb_table.vital_signs.name
+      SUPPRESSION_TABLE  = aws_dynamodb_table.alert_suppression.name
+      ROLLUPS_TABLE      = aws_dynamodb_table.vital_rollups.name
       WEBSOCKET_ENDPOINT = replace(aws_apigatewayv2_stage.websocket_production.invoke_url, "wss://", "")
       # SNS_TOPIC_ARN      = aws_sns_topic.alerts_topic.arn
       ENABLE_EMAIL       = "false"  # Cambia in "true" per attivare email
+      FANOUT_MAX_WORKERS = "32"
+      BATCH_PROTOCOL     = "true"
       ENVIRONMENT        = var.environment
+
+      ALERT_SUPPRESSION_SECONDS = "900"
     }
   }
 
@@ -362,12 +468,19 @@ resource "aws_lambda_event_source_mapping" "vitals_stream" {
   event_source_arn  = aws_dynamodb_table.vital_signs.stream_arn
   function_name     = aws_lambda_function.alert_detector.arn
   starting_position = "LATEST"
-  batch_size        = 10
+  # Batch grandi: decodifica colonnare e soglie vettoriali (VECTORIZED_MIN_BATCH)
+  batch_size        = 100
+
+  # Solo i record indicati in batchItemFailures vengono ritentati
+  function_response_types        = ["ReportBatchItemFailures"]
+  bisect_batch_on_function_error = true
+  maximum_retry_attempts         = 3
 }
 
 data "archive_file" "connection_manager" {
   type        = "zip"
-  source_file = "../lambda/connection-manager/app.py"
+  source_dir  = "../lambda/connection-manager"
+  excludes    = ["__pycache__"]
   output_path = "${path.module}/builds/connection_manager.zip"
 }
 
@@ -378,11 +491,13 @@ resource "aws_lambda_function" "connection_manager" {
   handler         = "app.lambda_handler"
   runtime         = "python3.11"
   timeout         = 10
+  layers          = [aws_lambda_layer_version.shared.arn]
   source_code_hash = data.archive_file.connection_manager.output_base64sha256
 
   environment {
     variables = {
       CONNECTIONS_TABLE = aws_dynamodb_table.websocket_connections.name
+      PATIENTS_TABLE    = aws_dynamodb_table.patients.name
       ENVIRONMENT       = var.environment
     }
   }
@@ -404,12 +519,15 @@ resource "aws_lambda_function" "api_handler" {
   runtime         = "python3.11"
   timeout         = 10
   source_code_hash = data.archive_file.api_handler.output_base64sha256
+  layers          = [aws_lambda_layer_version.shared.arn]
 
   environment {
     variables = {
       PATIENTS_TABLE    = aws_dynamodb_table.patients.name
       VITAL_SIGNS_TABLE = aws_dynamodb_table.vital_signs.name
       ALERTS_TABLE      = aws_dynamodb_table.alerts.name
+      ALERTS_INDEX      = "patient_id-timestamp-index"
+      ROLLUPS_TABLE     = aws_dynamodb_table.vital_rollups.name
       ENVIRONMENT       = var.environment
     }
   }
@@ -595,6 +713,13 @@ resource "aws_apigatewayv2_route" "disconnect" {
   target    = "integrations/${aws_apigatewayv2_integration.connect.id}"
 }
 
+# Sottoscrizione per paziente/reparto: {"action": "subscribe", ...}
+resource "aws_apigatewayv2_route" "subscribe" {
+  api_id    = aws_apigatewayv2_api.websocket.id
+  route_key = "subscribe"
+  target    = "integrations/${aws_apigatewayv2_integration.connect.id}"
+}
+
 resource "aws_apigatewayv2_stage" "websocket_production" {
   api_id      = aws_apigatewayv2_api.websocket.id
   name        = "production"
@@ -726,6 +851,7 @@ output "dynamodb_tables" {
     vital_signs = aws_dynamodb_table.vital_signs.name
     alerts      = aws_dynamodb_table.alerts.name
     connections = aws_dynamodb_table.websocket_connections.name
+    rollups     = aws_dynamodb_table.vital_rollups.name
   }
   description = "DynamoDB Table Names"
 }